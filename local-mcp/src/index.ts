@@ -3,10 +3,29 @@ import cors from "cors";
 import EventSource from "eventsource";
 import express from "express";
 import fetch from "node-fetch";
+import { createHash } from "crypto";
+import os from "os";
+import WebSocket from "ws";
+import { gzipSync } from "zlib";
 
 const CLOUD_HOST = "http://127.0.0.1:8000";
 const CLIENT_ID = "test-client-1";
 const API_PORT = 3000;
+// JSON result bodies larger than this many bytes are gzip-compressed
+const COMPRESS_THRESHOLD = 1024;
+// "websocket" carries commands, results and registration over one socket and falls back
+// to SSE + POST when the server does not accept it; "sse" always uses SSE + POST
+const TRANSPORT = process.env.MCP_TRANSPORT || "websocket";
+// Reconnects back off from the first delay, doubling up to the last; the server keeps
+// a disconnected client's session for a grace period, so quick retries resume it
+const RECONNECT_MIN_DELAY_MS = 250;
+const RECONNECT_MAX_DELAY_MS = 5000;
+// Isolated browser sessions offered to the server, one agent run each; session "0" is
+// the browser started at launch, the others start on first use
+const SESSION_POOL_SIZE = Number(process.env.MCP_SESSION_POOL_SIZE) || os.cpus().length;
+// Cancel notices remembered; a notice for a command that already finished is never
+// looked up again, so the oldest ones are forgotten past this many
+const MAX_CANCELLED_COMMANDS = 1000;
 
 interface CommandEvent {
     data: string;
@@ -18,8 +37,44 @@ interface CommandData {
     id: string;
     tool: string;
     params: Record<string, unknown>;
+    sessionId?: string;
 }
 
+interface BatchData {
+    type: "batch";
+    id: string;
+    commands: CommandData[];
+}
+
+interface CancelData {
+    type: "cancel";
+    id: string;
+    commandId: string;
+}
+
+interface ResultItem {
+    commandId: string;
+    result: any;
+}
+
+// Registration by content hash: the server reports which definitions it has not seen
+interface ToolRegistration {
+    toolSetHash: string;
+    toolHashes: string[];
+    capabilities: { batch: boolean; sessions: number };
+    tools?: any[];
+}
+
+// How results and tool definitions get back to the server on the current transport
+interface ServerChannel {
+    registerTools(toolDefinitions: any[]): Promise<void>;
+    sendResult(item: ResultItem): Promise<void>;
+    sendResults(batchId: string, results: ResultItem[]): Promise<void>;
+}
+
+// Commands the server stopped waiting for; they are skipped if they have not started
+const cancelledCommands = new Set<string>();
+
 // Schema interfaces for tool parameters
 interface ParameterProperty {
     type?: string;
@@ -71,107 +126,444 @@ async function main() {
             console.log(`Tool definition API listening at http://localhost:${API_PORT}`);
         });
 
-        // Connect to cloud agent via SSE
-        const eventSource = new EventSource(`${CLOUD_HOST}/connect/${CLIENT_ID}`, {
-            headers: {
-                'Accept': 'text/event-stream'
-            }
-        });
+        await connect(tools);
+
+        // Keep the process running
+        await new Promise(() => {});
+    } catch (error) {
+        console.error("Error in main:", error);
+        process.exit(1);
+    }
+}
+
+// JSON with sorted keys and no whitespace, matching the server's tool hashing
+function canonicalJson(value: any): string {
+    if (Array.isArray(value)) {
+        return `[${value.map(canonicalJson).join(",")}]`;
+    }
+    if (value && typeof value === 'object') {
+        const keys = Object.keys(value).filter(key => value[key] !== undefined).sort();
+        return `{${keys.map(key => `${JSON.stringify(key)}:${canonicalJson(value[key])}`).join(",")}}`;
+    }
+    return JSON.stringify(value);
+}
+
+function sha256(text: string): string {
+    return createHash('sha256').update(text).digest('hex');
+}
+
+// The hash-only registration sent first, and the follow-up carrying just the missing tools
+function toolRegistration(toolDefinitions: any[]): ToolRegistration {
+    const toolHashes = toolDefinitions.map(definition => sha256(canonicalJson(definition)));
+    return { toolSetHash: sha256(toolHashes.join("\n")), toolHashes, capabilities: { batch: true, sessions: SESSION_POOL_SIZE } };
+}
+
+function withMissingTools(registration: ToolRegistration, toolDefinitions: any[], missing: string[]): ToolRegistration {
+    const wanted = new Set(missing);
+    return { ...registration, tools: toolDefinitions.filter((_, i) => wanted.has(registration.toolHashes[i])) };
+}
+
+// Connect over the configured transport; reconnects go through here again
+async function connect(tools: Tool[]) {
+    if (TRANSPORT !== "sse" && await connectWebSocket(tools)) {
+        return;
+    }
+    connectSSE(tools);
+}
+
+let reconnectDelay = RECONNECT_MIN_DELAY_MS;
+// ID of the last command event received; sent on reconnect so the server replays
+// whatever was sent while the connection was down
+let lastEventId: string | undefined;
+
+function rememberEventId(id: unknown) {
+    if (id !== undefined && id !== null && id !== "") {
+        lastEventId = String(id);
+    }
+}
+
+function reconnectLater(tools: Tool[]) {
+    setTimeout(() => {
+        console.log("Attempting to reconnect...");
+        connect(tools).catch(console.error);
+    }, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY_MS);
+}
+
+// Run one command and send its result, unless it was cancelled meanwhile
+async function handleCommand(tools: Tool[], data: CommandData, channel: ServerChannel) {
+    try {
+        const result = await executeCommand(tools, data);
+        if (cancelledCommands.has(data.id) || result === undefined) {
+            return;
+        }
+        await channel.sendResult({ commandId: data.id, result });
+    } catch (error) {
+        console.error("Error processing command:", error);
+    } finally {
+        cancelledCommands.delete(data.id);
+    }
+}
 
-        console.log(`Connecting to ${CLOUD_HOST}/connect/${CLIENT_ID}`);
+// Several tool calls from one agent step, answered together
+async function handleBatch(tools: Tool[], batch: BatchData, channel: ServerChannel) {
+    try {
+        console.log(`Batch ${batch.id} received with ${batch.commands.length} commands`);
+        await channel.sendResults(batch.id, await executeBatch(tools, batch.commands));
+    } catch (error) {
+        console.error("Error processing batch:", error);
+    }
+}
 
-        eventSource.onopen = async () => {
-            console.log("SSE connection established successfully");
+// The agent run that issued a command was cancelled or the command timed out
+function handleCancel(notice: CancelData) {
+    console.log(`Command ${notice.commandId} cancelled`);
+    cancelledCommands.add(notice.commandId);
+    if (cancelledCommands.size > MAX_CANCELLED_COMMANDS) {
+        // Sets iterate in insertion order, so the first entry is the oldest
+        cancelledCommands.delete(cancelledCommands.values().next().value);
+    }
+}
+
+// Commands arrive as SSE events; results and tool definitions are POSTed
+function connectSSE(tools: Tool[]) {
+    const channel: ServerChannel = {
+        async registerTools(toolDefinitions) {
+            const register = (registration: ToolRegistration) => fetch(`${CLOUD_HOST}/register_tools/${CLIENT_ID}`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify(registration),
+            });
             
-            // Send tool definitions to remote-agent on connection
-            const toolDefinitions = generateToolDefinitions(tools);
+            const registration = toolRegistration(toolDefinitions);
+            let response = await register(registration);
+            let body: any = response.ok ? await response.json() : undefined;
+            if (body?.status === "incomplete") {
+                console.log(`Uploading ${body.missing.length} tool definitions the server does not have`);
+                response = await register(withMissingTools(registration, toolDefinitions, body.missing));
+                body = response.ok ? await response.json() : undefined;
+            }
+            
+            if (response.ok) {
+                console.log("Tool definitions sent to remote-agent:", body);
+            } else {
+                console.error("Failed to send tool definitions:", response.status, await response.text());
+            }
+        },
+        async sendResult(item) {
+            const { body, headers } = encodeResultBody({ ...item });
+            const response = await fetch(`${CLOUD_HOST}/result/${CLIENT_ID}`, {
+                method: 'POST',
+                headers,
+                body,
+            });
+            console.log("Result sent:", await response.json());
+        },
+        async sendResults(batchId, results) {
+            const { body, headers } = encodeResultBody({ batchId, results });
+            const response = await fetch(`${CLOUD_HOST}/results/${CLIENT_ID}`, {
+                method: 'POST',
+                headers,
+                body,
+            });
+            console.log("Batch results sent:", await response.json());
+        },
+    };
+
+    const eventSource = new EventSource(`${CLOUD_HOST}/connect/${CLIENT_ID}`, {
+        headers: {
+            'Accept': 'text/event-stream',
+            ...(lastEventId !== undefined ? { 'Last-Event-ID': lastEventId } : {}),
+        }
+    });
+
+    console.log(`Connecting to ${CLOUD_HOST}/connect/${CLIENT_ID}`);
+
+    eventSource.onopen = async () => {
+        console.log("SSE connection established successfully");
+        reconnectDelay = RECONNECT_MIN_DELAY_MS;
+        
+        // Send tool definitions to remote-agent on connection
+        try {
+            await channel.registerTools(generateToolDefinitions(tools));
+        } catch (error) {
+            console.error("Error sending tool definitions:", error);
+        }
+    };
+
+    // 명시적으로 'command' 이벤트를 리스닝합니다
+    (eventSource as any).addEventListener("command", (event: MessageEvent) => {
+        console.log("Command event received with data:", event.data);
+        rememberEventId(event.lastEventId);
+        handleCommand(tools, JSON.parse(event.data) as CommandData, channel);
+    });
+
+    (eventSource as any).addEventListener("batch", (event: MessageEvent) => {
+        rememberEventId(event.lastEventId);
+        handleBatch(tools, JSON.parse(event.data) as BatchData, channel);
+    });
+
+    (eventSource as any).addEventListener("cancel", (event: MessageEvent) => {
+        rememberEventId(event.lastEventId);
+        handleCancel(JSON.parse(event.data) as CancelData);
+    });
+
+    // 일반적인 메시지 처리 (이벤트 타입이 없는 경우)
+    eventSource.onmessage = (event: MessageEvent) => {
+        console.log("Generic message received:", event.data);
+    };
+
+    // 하트비트 이벤트 처리
+    (eventSource as any).addEventListener("heartbeat", (event: MessageEvent) => {
+        console.log("Heartbeat received:", event.data);
+    });
+
+    eventSource.onerror = (error: Event) => {
+        console.error("SSE connection error:", error);
+        eventSource.close();
+        reconnectLater(tools);
+    };
+}
+
+// Commands, results and tool definitions share one socket as JSON frames; resolves
+// false when the socket cannot be opened, so the caller can fall back to SSE
+function connectWebSocket(tools: Tool[]): Promise<boolean> {
+    const resume = lastEventId !== undefined ? `?last_event_id=${encodeURIComponent(lastEventId)}` : "";
+    const url = `${CLOUD_HOST.replace(/^http/, "ws")}/ws/${CLIENT_ID}${resume}`;
+    console.log(`Connecting to ${url}`);
+    const socket = new WebSocket(url, { perMessageDeflate: true });
+    const send = (message: Record<string, unknown>) => new Promise<void>((resolve, reject) =>
+        socket.send(JSON.stringify(message), error => error ? reject(error) : resolve())
+    );
+    // The server answers a hash-only registration with `missing_tools` if it needs definitions
+    let registration: ToolRegistration | undefined;
+    let toolDefinitions: any[] = [];
+    const channel: ServerChannel = {
+        registerTools: definitions => {
+            toolDefinitions = definitions;
+            registration = toolRegistration(definitions);
+            return send({ type: "register_tools", ...registration });
+        },
+        sendResult: item => send({ type: "result", ...item }),
+        sendResults: (batchId, results) => send({ type: "results", batchId, results }),
+    };
+
+    return new Promise(resolve => {
+        let opened = false;
+
+        socket.on("open", async () => {
+            opened = true;
+            resolve(true);
+            console.log("WebSocket connection established successfully");
+            reconnectDelay = RECONNECT_MIN_DELAY_MS;
             try {
-                const response = await fetch(`${CLOUD_HOST}/register_tools/${CLIENT_ID}`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        tools: toolDefinitions
-                    }),
-                });
-                
-                if (response.ok) {
-                    console.log("Tool definitions sent to remote-agent:", await response.json());
-                } else {
-                    console.error("Failed to send tool definitions:", response.status, await response.text());
-                }
+                await channel.registerTools(generateToolDefinitions(tools));
             } catch (error) {
                 console.error("Error sending tool definitions:", error);
             }
-        };
+        });
 
-        // 명시적으로 'command' 이벤트를 리스닝합니다
-        (eventSource as any).addEventListener("command", async (event: MessageEvent) => {
-            try {
-                console.log("Command event received with data:", event.data);
-                const data = JSON.parse(event.data) as CommandData;
-                console.log("Command event parsed:", data);
-
-                // Execute the command using appropriate tool
-                const exactTool = tools.find(t => t.name === data.tool);
-                const partialMatchTool = exactTool || tools.find(t => 
-                    t.name.includes('playwright') && 
-                    (t.name.includes('navigate') || t.name.includes('browser'))
-                );
-                const tool = exactTool || partialMatchTool;
-
-                if (tool) {
-                    console.log(`Found tool: ${tool.name}, executing with params:`, data.params);
-                    const result = await tool.invoke(data.params);
-                    console.log(`Tool execution result:`, result);
-                    
-                    // Send result back to cloud agent
-                    const response = await fetch(`${CLOUD_HOST}/result/${CLIENT_ID}`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            commandId: data.id,
-                            result: result
-                        }),
-                    });
-                    console.log("Result sent:", await response.json());
-                } else {
-                    console.error(`Tool ${data.tool} not found. Available tools:`, tools.map(t => t.name));
-                }
-            } catch (error) {
-                console.error("Error processing command event:", error);
+        socket.on("message", (raw: WebSocket.RawData) => {
+            const { event, id, data } = JSON.parse(raw.toString());
+            rememberEventId(id);
+            switch (event) {
+                case "command":
+                    console.log("Command received:", data);
+                    handleCommand(tools, data as CommandData, channel);
+                    break;
+                case "batch":
+                    handleBatch(tools, data as BatchData, channel);
+                    break;
+                case "cancel":
+                    handleCancel(data as CancelData);
+                    break;
+                case "missing_tools":
+                    if (registration && data.toolSetHash === registration.toolSetHash) {
+                        console.log(`Uploading ${data.missing.length} tool definitions the server does not have`);
+                        send({ type: "register_tools", ...withMissingTools(registration, toolDefinitions, data.missing) })
+                            .catch(error => console.error("Error sending tool definitions:", error));
+                    }
+                    break;
+                case "registered":
+                    console.log(`Tool definitions sent to remote-agent: ${data.tools} tools registered`, data.sessions ?? "");
+                    break;
+                case "heartbeat":
+                    // Answered so proxies see traffic both ways on an idle socket
+                    send({ type: "heartbeat" }).catch(() => undefined);
+                    break;
+                default:
+                    console.log(`WebSocket ${event} message:`, data);
             }
         });
 
-        // 일반적인 메시지 처리 (이벤트 타입이 없는 경우)
-        eventSource.onmessage = (event: MessageEvent) => {
-            console.log("Generic message received:", event.data);
-        };
+        socket.on("error", (error: Error) => {
+            console.error("WebSocket error:", error.message);
+            if (!opened) {
+                console.log("Falling back to SSE");
+                resolve(false);
+            }
+        });
 
-        // 하트비트 이벤트 처리
-        (eventSource as any).addEventListener("heartbeat", (event: MessageEvent) => {
-            console.log("Heartbeat received:", event.data);
+        socket.on("close", () => {
+            if (opened) {
+                console.log("WebSocket connection closed");
+                reconnectLater(tools);
+            }
         });
+    });
+}
 
-        eventSource.onerror = (error: Event) => {
-            console.error("SSE connection error:", error);
-            // Implement reconnection logic if needed
-            setTimeout(() => {
-                console.log("Attempting to reconnect...");
-                eventSource.close();
-                main();
-            }, 5000);
+// Encode a result POST body: binary content blocks (e.g. screenshots) are sent as raw
+// multipart attachments instead of base64-in-JSON, and large JSON is gzip-compressed
+function encodeResultBody(payload: Record<string, unknown>): { body: Buffer | string; headers: Record<string, string> } {
+    const attachments: { name: string; data: Buffer; mimeType: string }[] = [];
+    const extractBinary = (value: any): any => {
+        if (Array.isArray(value)) {
+            return value.map(extractBinary);
+        }
+        if (value && typeof value === 'object') {
+            if (typeof value.data === 'string' && typeof value.mimeType === 'string' && value.type !== 'text') {
+                const name = `a${attachments.length}`;
+                attachments.push({ name, data: Buffer.from(value.data, 'base64'), mimeType: value.mimeType });
+                const { data, ...rest } = value;
+                return { ...rest, attachment: name };
+            }
+            return Object.fromEntries(Object.entries(value).map(([key, item]) => [key, extractBinary(item)]));
+        }
+        return value;
+    };
+    const json = JSON.stringify(extractBinary(payload));
+
+    if (attachments.length > 0) {
+        const boundary = `----mcp-result-${Date.now().toString(16)}${Math.random().toString(16).slice(2)}`;
+        const part = (name: string, contentType: string) => Buffer.from(
+            `--${boundary}\r\nContent-Disposition: form-data; name="${name}"; filename="${name}"\r\n` +
+            `Content-Type: ${contentType}\r\n\r\n`
+        );
+        const chunks: Buffer[] = [part("payload", "application/json"), Buffer.from(json), Buffer.from("\r\n")];
+        for (const attachment of attachments) {
+            chunks.push(part(attachment.name, attachment.mimeType), attachment.data, Buffer.from("\r\n"));
+        }
+        chunks.push(Buffer.from(`--${boundary}--\r\n`));
+        return {
+            body: Buffer.concat(chunks),
+            headers: { 'Content-Type': `multipart/form-data; boundary=${boundary}` },
         };
+    }
 
-        // Keep the process running
-        await new Promise(() => {});
-    } catch (error) {
-        console.error("Error in main:", error);
-        process.exit(1);
+    if (Buffer.byteLength(json) > COMPRESS_THRESHOLD) {
+        return {
+            body: gzipSync(json),
+            headers: { 'Content-Type': 'application/json', 'Content-Encoding': 'gzip' },
+        };
+    }
+    return { body: json, headers: { 'Content-Type': 'application/json' } };
+}
+
+// Read-only tools that may run concurrently with each other inside a batch
+const CONCURRENT_TOOL_PATTERNS = ['snapshot', 'screenshot', 'console_messages', 'network_requests', 'tab_list'];
+
+function allowsConcurrency(toolName: string): boolean {
+    return CONCURRENT_TOOL_PATTERNS.some(pattern => toolName.includes(pattern));
+}
+
+// Tools of the browser sessions started on demand, each its own isolated Playwright MCP server
+const sessionTools = new Map<string, Promise<Tool[]>>();
+
+// The tools driving a command's session; commands without one share the launch browser
+function toolsForSession(tools: Tool[], sessionId?: string): Promise<Tool[]> {
+    if (sessionId === undefined || sessionId === "0") {
+        return Promise.resolve(tools);
+    }
+    let pending = sessionTools.get(sessionId);
+    if (!pending) {
+        console.log(`Starting browser session ${sessionId}`);
+        const client = new MultiServerMCPClient({
+            playwright: {
+                transport: "stdio",
+                command: "npx",
+                args: ["@playwright/mcp@latest", "--isolated"]
+            }
+        });
+        pending = client.getTools().then(sessionToolList => sessionToolList as Tool[]);
+        // A session that failed to start is retried by the next command for it
+        pending.catch(() => sessionTools.delete(sessionId!));
+        sessionTools.set(sessionId, pending);
+    }
+    return pending;
+}
+
+// Run one command with the matching tool of its session; undefined when no tool matches
+async function executeCommand(launchTools: Tool[], data: CommandData): Promise<any> {
+    if (cancelledCommands.delete(data.id)) {
+        console.log(`Skipping cancelled command ${data.id}`);
+        return undefined;
+    }
+    const tools = await toolsForSession(launchTools, data.sessionId);
+
+    // Execute the command using appropriate tool
+    const exactTool = tools.find(t => t.name === data.tool);
+    const partialMatchTool = exactTool || tools.find(t => 
+        t.name.includes('playwright') && 
+        (t.name.includes('navigate') || t.name.includes('browser'))
+    );
+    const tool = exactTool || partialMatchTool;
+
+    if (!tool) {
+        console.error(`Tool ${data.tool} not found. Available tools:`, tools.map(t => t.name));
+        return undefined;
+    }
+
+    console.log(`Found tool: ${tool.name}, executing with params:`, data.params);
+    const result = await tool.invoke(data.params);
+    console.log(`Tool execution result:`, result);
+    return result;
+}
+
+// Commands of different sessions run concurrently, each session's in order
+async function executeBatch(tools: Tool[], commands: CommandData[]) {
+    const bySession = new Map<string, CommandData[]>();
+    for (const command of commands) {
+        const key = command.sessionId ?? "0";
+        bySession.set(key, [...(bySession.get(key) ?? []), command]);
     }
+    const results = (await Promise.all([...bySession.values()].map(group => executeSessionBatch(tools, group)))).flat();
+    const order = new Map(commands.map((command, i) => [command.id, i]));
+    return results.sort((a, b) => order.get(a.commandId)! - order.get(b.commandId)!);
+}
+
+// Run one session's commands in order; consecutive read-only commands run concurrently
+async function executeSessionBatch(tools: Tool[], commands: CommandData[]) {
+    const results: { commandId: string; result: any }[] = [];
+    const runOne = async (command: CommandData) => {
+        try {
+            const result = await executeCommand(tools, command);
+            return { commandId: command.id, result: result ?? { error: `Tool ${command.tool} not found` } };
+        } catch (error) {
+            return { commandId: command.id, result: { error: String(error) } };
+        } finally {
+            // A cancel that arrived while the command ran is answered with the result anyway
+            cancelledCommands.delete(command.id);
+        }
+    };
+
+    let i = 0;
+    while (i < commands.length) {
+        if (!allowsConcurrency(commands[i].tool)) {
+            results.push(await runOne(commands[i]));
+            i++;
+            continue;
+        }
+        const group: CommandData[] = [];
+        while (i < commands.length && allowsConcurrency(commands[i].tool)) {
+            group.push(commands[i]);
+            i++;
+        }
+        results.push(...await Promise.all(group.map(runOne)));
+    }
+    return results;
 }
 
 // Helper function to generate tool definitions
@@ -259,11 +651,18 @@ function generateToolDefinitions(tools: Tool[]) {
         // Log the parameters for debugging
         console.log(`Tool ${tool.name} parameters:`, parameters);
         
+        // Read-only tools let the server reuse results until a mutating tool runs, and
+        // idempotent ones let it send a slow command again
+        const readOnly = (tool as any).metadata?.annotations?.readOnlyHint;
+        const idempotent = (tool as any).metadata?.annotations?.idempotentHint;
+
         return {
             name: tool.name,
             display_name: tool.name.split('__').pop() || tool.name,
             description: tool.description || `Tool ${tool.name}`,
-            parameters
+            parameters,
+            ...(readOnly === undefined ? {} : { readOnly }),
+            ...(idempotent === undefined ? {} : { idempotent })
         };
     });
 }
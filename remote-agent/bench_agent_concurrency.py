@@ -0,0 +1,48 @@
+import asyncio
+import contextlib
+import io
+import time
+
+from bench_support import FakeChatModel, PLAYWRIGHT_TOOL_DEFINITIONS, fake_local_client
+from graph import run_graph, set_chat_model_factory
+from tools import MCPClient, create_mcp_tools
+
+CLIENT_ID = "bench-concurrency-client"
+LLM_LATENCY = 0.05
+TOOL_LATENCY = 0.02
+RUNS_PER_LEVEL = 64
+
+async def main():
+    """Agent runs per second as the number of in-flight requests on one event loop grows."""
+    set_chat_model_factory(lambda config: FakeChatModel(
+        tool_calls=[{"name": "browser_navigate", "args": {"url": "https://example.com"}}],
+        latency=LLM_LATENCY,
+    ))
+    routers = {}
+    router = routers[CLIENT_ID] = MCPClient(
+        client_id=CLIENT_ID,
+        send_command_func=fake_local_client(routers.__getitem__, latency=TOOL_LATENCY),
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        tools = await create_mcp_tools(client_id=CLIENT_ID, tool_definitions=PLAYWRIGHT_TOOL_DEFINITIONS, mcp_client=router)
+        # Warm the workflow cache so only execution is measured
+        await run_graph(CLIENT_ID, "warm up", tools)
+
+    print(f"each run: 2 LLM calls x {LLM_LATENCY * 1000:.0f} ms + 1 tool call x {TOOL_LATENCY * 1000:.0f} ms")
+    print(f"{'in-flight':>9} {'runs/s':>8} {'wall s':>7}")
+    for in_flight in (1, 4, 16, 64):
+        semaphore = asyncio.Semaphore(in_flight)
+
+        async def one_run(i: int):
+            async with semaphore:
+                result = await run_graph(CLIENT_ID, f"task {i}", tools)
+                assert result["messages"][-1].content == "Task complete."
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(*(one_run(i) for i in range(RUNS_PER_LEVEL)))
+        elapsed = time.perf_counter() - started
+        print(f"{in_flight:>9} {RUNS_PER_LEVEL / elapsed:>8.1f} {elapsed:>7.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
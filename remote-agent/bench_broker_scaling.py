@@ -0,0 +1,110 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+CLIENTS = 4
+CONCURRENCY_PER_CLIENT = 16
+DURATION = 5.0
+
+async def run_client(port: int, client_id: str) -> int:
+    """Hold an SSE stream as a fake MCP client while driving command round-trips to it."""
+    limits = httpx.Limits(max_connections=CONCURRENCY_PER_CLIENT + 4)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30, limits=limits) as http:
+        connected = asyncio.Event()
+        pending = set()
+
+        async def answer(command):
+            await http.post(f"/result/{client_id}", json={"commandId": command["id"], "result": {"ok": True}})
+
+        async def listen():
+            async with http.stream("GET", f"/connect/{client_id}") as response:
+                connected.set()
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event == "command":
+                        task = asyncio.create_task(answer(json.loads(line[len("data: "):])))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+
+        listener = asyncio.create_task(listen())
+        await connected.wait()
+        await asyncio.sleep(0.5)
+
+        completed = 0
+        deadline = time.perf_counter() + DURATION
+
+        async def drive():
+            nonlocal completed
+            while time.perf_counter() < deadline:
+                response = await http.post(
+                    f"/test/send_command/{client_id}?wait=true",
+                    json={"tool": "browser_snapshot", "params": {}},
+                )
+                if response.status_code == 200:
+                    completed += 1
+
+        await asyncio.gather(*(drive() for _ in range(CONCURRENCY_PER_CLIENT)))
+        listener.cancel()
+        await asyncio.gather(listener, *pending, return_exceptions=True)
+        return completed
+
+def client_process(port: int, client_id: str, results) -> None:
+    results.put(asyncio.run(run_client(port, client_id)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure(workers: int) -> float:
+    """Command round-trips per second through `uvicorn --workers N` with the Unix-socket broker."""
+    port = free_port()
+    env = dict(os.environ, MCP_BROKER="unix", MCP_BROKER_DIR=tempfile.mkdtemp(prefix="broker-"))
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(200):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/docs")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        time.sleep(1.0)
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=client_process, args=(port, f"bench-client-{i}", results))
+            for i in range(CLIENTS)
+        ]
+        for process in processes:
+            process.start()
+        completed = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return completed / DURATION
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    worker_counts = [int(arg) for arg in sys.argv[1:]] or [1, 2, 4]
+    print(f"{os.cpu_count()} CPUs, {CLIENTS} clients x {CONCURRENCY_PER_CLIENT} concurrent round-trips, {DURATION:.0f}s each")
+    print(f"{'workers':>7} {'round-trips/s':>14}")
+    for workers in worker_counts:
+        print(f"{workers:>7} {measure(workers):>14.0f}")
+
+if __name__ == "__main__":
+    main()
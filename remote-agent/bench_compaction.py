@@ -0,0 +1,60 @@
+import asyncio
+import contextlib
+import io
+
+from bench_support import FakeChatModel, PLAYWRIGHT_TOOL_DEFINITIONS, fake_local_client, fake_page_snapshot, fake_screenshot
+from graph import run_graph, set_chat_model_factory
+from tools import MCPClient, create_mcp_tools
+from tools import compaction
+
+CLIENT_ID = "bench-compaction-client"
+
+# A screenshot-heavy browser task: every navigation and snapshot returns a full page tree
+STEPS = [
+    [{"name": "browser_navigate", "args": {"url": "https://www.example.com"}}],
+    [{"name": "browser_snapshot", "args": {}}],
+    [{"name": "browser_take_screenshot", "args": {"raw": True, "filename": "example.png"}}],
+    [{"name": "browser_click", "args": {"element": "Read more 3", "ref": "s1e10"}}],
+    [{"name": "browser_navigate", "args": {"url": "https://openai.com"}}],
+    [{"name": "browser_take_screenshot", "args": {"raw": True, "filename": "openai.png"}}],
+]
+
+def respond(command):
+    if "screenshot" in command["tool"]:
+        return fake_screenshot()
+    return fake_page_snapshot(command["params"].get("url", "https://www.example.com"))
+
+async def run_task(enabled: bool) -> dict:
+    """Run the scripted task and total the estimated prompt tokens sent to the model."""
+    sent = {"tokens": 0}
+
+    class CountingModel(FakeChatModel):
+        def _respond(self, messages):
+            sent["tokens"] += sum(compaction.estimate_tokens(str(message.content)) for message in messages)
+            return super()._respond(messages)
+
+    set_chat_model_factory(lambda config: CountingModel(steps=STEPS, latency=0))
+    compaction.COMPACTION_ENABLED = enabled
+
+    routers = {}
+    router = routers[CLIENT_ID] = MCPClient(
+        client_id=CLIENT_ID, send_command_func=fake_local_client(routers.__getitem__, latency=0, respond=respond)
+    )
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tools = await create_mcp_tools(client_id=CLIENT_ID, tool_definitions=PLAYWRIGHT_TOOL_DEFINITIONS, mcp_client=router)
+        await run_graph(CLIENT_ID, "Browse example.com and openai.com, taking screenshots", tools)
+    reported = [line for line in output.getvalue().splitlines() if line.startswith("Compaction")]
+    return {"prompt_tokens": sent["tokens"], "report": reported[-1] if reported else ""}
+
+async def main():
+    baseline = await run_task(enabled=False)
+    compacted = await run_task(enabled=True)
+
+    print(f"{len(STEPS)}-step task, prompt tokens sent to the model (estimated)")
+    print(f"verbatim:  {baseline['prompt_tokens']:>9,}")
+    print(f"compacted: {compacted['prompt_tokens']:>9,}")
+    print(compacted["report"])
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import resource
+import statistics
+import time
+from typing import List, Optional
+
+import httpx
+import uvicorn
+
+from bench_support import FakeChatModel, SimulatedMCPClient, SimulatedWebSocketClient, free_port
+import main
+from graph import set_chat_model_factory
+from metrics import TOOL_ROUND_TRIP
+
+# A short browsing task: every agent request makes three tool calls and four LLM calls
+STEPS = [
+    [{"name": "browser_navigate", "args": {"url": "https://www.example.com"}}],
+    [{"name": "browser_click", "args": {"element": "Read more 1", "ref": "s1e1"}}],
+    [{"name": "browser_navigate", "args": {"url": "https://www.example.com/next"}}],
+]
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+def percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+async def run_request(http: httpx.AsyncClient, client_id: str, n: int) -> Optional[float]:
+    """Send one streamed agent request; seconds until its final event, None if it was rejected or failed."""
+    started = time.perf_counter()
+    async with http.stream("POST", f"/agent/{client_id}/stream", json={"input": f"task {n}"}) as response:
+        if response.status_code != 200:
+            return None
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "final":
+                return time.perf_counter() - started
+            elif line.startswith("data: ") and event == "error":
+                return None
+    return None
+
+async def run_client(http: httpx.AsyncClient, client: SimulatedMCPClient, requests: int, concurrency: int) -> List[Optional[float]]:
+    """Drive `requests` agent requests for one client, `concurrency` at a time."""
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(n: int) -> Optional[float]:
+        async with gate:
+            return await run_request(http, client.client_id, n)
+
+    return await asyncio.gather(*(one(n) for n in range(requests)))
+
+async def benchmark(args: argparse.Namespace) -> None:
+    set_chat_model_factory(lambda config: FakeChatModel(steps=STEPS, latency=args.llm_latency))
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    limits = httpx.Limits(max_connections=args.clients * (args.concurrency + 4))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as http:
+        clients = [
+            SimulatedWebSocketClient(f"ws://127.0.0.1:{port}", f"load-client-{i}", args.tool_latency, args.payload_size, args.batch)
+            if args.websocket else
+            SimulatedMCPClient(http, f"load-client-{i}", args.tool_latency, args.payload_size, args.batch)
+            for i in range(args.clients)
+        ]
+        # The server logs connections and registrations; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(*(client.start() for client in clients))
+            rss_before = rss_mb()
+            started = time.perf_counter()
+            results = await asyncio.gather(*(run_client(http, client, args.requests, args.concurrency) for client in clients))
+            elapsed = time.perf_counter() - started
+            rss_after = rss_mb()
+            await asyncio.gather(*(client.stop() for client in clients))
+
+    server.should_exit = True
+    await serving
+
+    latencies = sorted(latency for per_client in results for latency in per_client if latency is not None)
+    total = args.clients * args.requests
+    print(f"{args.clients} clients x {args.requests} requests, {args.concurrency} in flight per client")
+    print(f"LLM {args.llm_latency * 1000:.0f} ms/step, tool {args.tool_latency * 1000:.0f} ms, payload {args.payload_size} chars, batch={args.batch}, "
+          f"{'websocket' if args.websocket else 'sse'}")
+    print(f"completed {len(latencies)}/{total} in {elapsed:.2f}s, {len(latencies) / elapsed:.1f} requests/s, "
+          f"{sum(client.commands_answered for client in clients) / elapsed:.0f} tool calls/s, {total - len(latencies)} rejected or failed")
+    if latencies:
+        print(f"latency ms: p50 {statistics.median(latencies) * 1000:.0f}  p95 {percentile(latencies, 0.95) * 1000:.0f}  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f}  max {latencies[-1] * 1000:.0f}")
+    round_trip_p95 = TOOL_ROUND_TRIP.quantile(0.95, tool="mcp__playwright__browser_navigate")
+    if round_trip_p95 is not None:
+        print(f"tool round-trip p95 <= {round_trip_p95 * 1000:.1f} ms (histogram bucket)")
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6
+    print(f"memory: RSS {rss_before:.0f} -> {rss_after:.0f} MB during the run, peak {peak:.0f} MB")
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark: fake LLM, simulated MCP clients, real HTTP")
+    parser.add_argument("--clients", type=int, default=8, help="simulated MCP clients")
+    parser.add_argument("--requests", type=int, default=20, help="agent requests per client")
+    parser.add_argument("--concurrency", type=int, default=4, help="agent requests in flight per client")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="seconds per tool call on the client")
+    parser.add_argument("--payload-size", type=int, default=4096, help="characters per tool result")
+    parser.add_argument("--batch", action="store_true", help="register clients with batch support")
+    parser.add_argument("--websocket", action="store_true", help="connect clients over /ws instead of SSE + POST")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(parse_args()))
@@ -0,0 +1,39 @@
+import asyncio
+import statistics
+import time
+
+from bench_support import PLAYWRIGHT_TOOL_DEFINITIONS
+from graph import get_workflow, invalidate_workflows
+from tools import MCPClient, create_mcp_tools
+
+CLIENT_ID = "bench-graph-client"
+REQUESTS = 50
+
+async def main():
+    """Compare cold (build + compile) and warm (cache hit) workflow construction per request."""
+    tools = await create_mcp_tools(
+        client_id=CLIENT_ID,
+        tool_definitions=PLAYWRIGHT_TOOL_DEFINITIONS,
+        mcp_client=MCPClient(client_id=CLIENT_ID),
+    )
+
+    cold, warm = [], []
+    for _ in range(REQUESTS):
+        invalidate_workflows(CLIENT_ID)
+        started = time.perf_counter()
+        _, cached = get_workflow(CLIENT_ID, tools)
+        cold.append((time.perf_counter() - started) * 1000)
+        assert not cached
+
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        _, cached = get_workflow(CLIENT_ID, tools)
+        warm.append((time.perf_counter() - started) * 1000)
+        assert cached
+
+    print(f"{len(tools)} tools, {REQUESTS} requests each")
+    print(f"cold: median {statistics.median(cold):.2f} ms, max {max(cold):.2f} ms")
+    print(f"warm: median {statistics.median(warm):.3f} ms, max {max(warm):.3f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from bench_support import FakeChatModel, PLAYWRIGHT_TOOL_DEFINITIONS, fake_local_client, fake_page_snapshot
+from graph import LLM_CACHE_STATS, run_graph, set_chat_model_factory
+from graph import llm_cache
+from tools import MCPClient, create_mcp_tools
+
+CLIENT_ID = "bench-llm-cache-client"
+# Stands in for the provider round-trip of one agent step
+LLM_LATENCY = 0.5
+
+# A scripted regression flow like the ones in test_browser.py
+STEPS = [
+    [{"name": "browser_navigate", "args": {"url": "https://www.example.com"}}],
+    [{"name": "browser_click", "args": {"element": "Read more 3", "ref": "s1e10"}}],
+    [{"name": "browser_navigate", "args": {"url": "https://openai.com"}}],
+]
+
+async def run_task(tools) -> float:
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await run_graph(CLIENT_ID, "Open example.com, follow a link, then open openai.com", tools)
+    return time.perf_counter() - started
+
+async def main():
+    """Wall time of a repeated deterministic task with the LLM response cache cold, warm, and on disk only."""
+    llm_cache.LLM_CACHE_ENABLED = True
+    llm_cache._LLM_CACHE = llm_cache.LLMResponseCache(os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite3"))
+    set_chat_model_factory(lambda config: FakeChatModel(steps=STEPS, latency=LLM_LATENCY))
+
+    routers = {}
+    router = routers[CLIENT_ID] = MCPClient(
+        client_id=CLIENT_ID,
+        send_command_func=fake_local_client(routers.__getitem__, latency=0.01, respond=lambda command: fake_page_snapshot("https://www.example.com")),
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        tools = await create_mcp_tools(client_id=CLIENT_ID, tool_definitions=PLAYWRIGHT_TOOL_DEFINITIONS, mcp_client=router)
+
+    print(f"{len(STEPS) + 1} LLM calls per run, {LLM_LATENCY * 1000:.0f} ms each uncached")
+    print(f"{'run':>12} {'seconds':>8}")
+    print(f"{'cold':>12} {await run_task(tools):>8.3f}")
+    print(f"{'memory':>12} {await run_task(tools):>8.3f}")
+    llm_cache.get_llm_cache()._memory.clear()
+    print(f"{'sqlite':>12} {await run_task(tools):>8.3f}")
+    print(", ".join(f"{key}={value}" for key, value in LLM_CACHE_STATS.items()))
+
+if __name__ == "__main__":
+    asyncio.run(main())
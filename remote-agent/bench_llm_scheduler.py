@@ -0,0 +1,82 @@
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+
+from bench_e2e import percentile
+from bench_support import FakeRateLimits, fake_openai_app, free_port
+from graph import LLMScheduler, set_llm_client
+from graph.llm_scheduler import RateLimitedTransport
+from langchain_openai import ChatOpenAI
+
+# The provider allows 20 requests a second, with a second's worth at once
+REQUESTS_PER_MINUTE = 1200
+PROVIDER_LATENCY = 0.05
+# One client bursts many calls while the others make a few, all at once
+HEAVY_CALLS = 60
+LIGHT_CLIENTS = 7
+LIGHT_CALLS = 3
+
+async def call(model: ChatOpenAI, client_id: str) -> Optional[float]:
+    """One chat completion for a client; seconds it took, None if it failed."""
+    set_llm_client(client_id)
+    started = time.perf_counter()
+    try:
+        await model.ainvoke("Summarize the page")
+    except Exception:
+        return None
+    return time.perf_counter() - started
+
+async def burst(mode: str) -> Tuple[Dict[str, List[Optional[float]]], float, FakeRateLimits]:
+    """Every client's calls at once against a fresh provider; latencies per client, seconds until all settled, the provider's counts."""
+    limits = FakeRateLimits(REQUESTS_PER_MINUTE, 0)
+    port = free_port()
+    provider = uvicorn.Server(uvicorn.Config(
+        fake_openai_app(latency=PROVIDER_LATENCY, rate_limits=limits), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    serving = asyncio.create_task(provider.serve())
+    while not provider.started:
+        await asyncio.sleep(0.01)
+
+    transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=64))
+    if mode != "none":
+        transport = RateLimitedTransport(transport, LLMScheduler(REQUESTS_PER_MINUTE, 0))
+    http = httpx.AsyncClient(transport=transport, timeout=60)
+    model = ChatOpenAI(model="gpt-4o", temperature=0, base_url=f"http://127.0.0.1:{port}/v1", http_async_client=http)
+
+    clients = {"heavy": HEAVY_CALLS, **{f"light-{i}": LIGHT_CALLS for i in range(LIGHT_CLIENTS)}}
+    started = time.perf_counter()
+    calls = {
+        # FIFO queues everyone as one client
+        client_id: [asyncio.create_task(call(model, "all" if mode == "fifo" else client_id)) for _ in range(count)]
+        for client_id, count in clients.items()
+    }
+    results = {client_id: [await task for task in tasks] for client_id, tasks in calls.items()}
+    elapsed = time.perf_counter() - started
+
+    await http.aclose()
+    provider.should_exit = True
+    await serving
+    return results, elapsed, limits
+
+async def benchmark() -> None:
+    """A burst of LLM calls over a rate-limited provider: no scheduling, one FIFO queue, fair queuing per client."""
+    total = HEAVY_CALLS + LIGHT_CLIENTS * LIGHT_CALLS
+    print(f"{total} LLM calls at once ({HEAVY_CALLS} from one client, {LIGHT_CALLS} from each of {LIGHT_CLIENTS} others), "
+          f"provider limit {REQUESTS_PER_MINUTE} RPM, {PROVIDER_LATENCY * 1000:.0f} ms per call")
+    print(f"{'mode':>6} {'429s':>5} {'failed':>7} {'seconds':>8} {'light p50 ms':>13} {'light p99 ms':>13} {'heavy p99 ms':>13}")
+    for mode in ("none", "fifo", "fair"):
+        results, elapsed, limits = await burst(mode)
+        light = sorted(latency for client_id, latencies in results.items() if client_id != "heavy" for latency in latencies if latency is not None)
+        heavy = sorted(latency for latency in results["heavy"] if latency is not None)
+        failed = sum(latency is None for latencies in results.values() for latency in latencies)
+        light_p50 = f"{statistics.median(light) * 1000:.0f}" if light else "-"
+        light_p99 = f"{percentile(light, 0.99) * 1000:.0f}" if light else "-"
+        heavy_p99 = f"{percentile(heavy, 0.99) * 1000:.0f}" if heavy else "-"
+        print(f"{mode:>6} {limits.rejected:>5} {failed:>7} {elapsed:>8.2f} {light_p50:>13} {light_p99:>13} {heavy_p99:>13}")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
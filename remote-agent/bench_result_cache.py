@@ -0,0 +1,57 @@
+import asyncio
+import contextlib
+import io
+import time
+
+from bench_support import FakeChatModel, PLAYWRIGHT_TOOL_DEFINITIONS, fake_local_client, fake_page_snapshot
+from graph import run_graph, set_chat_model_factory
+from tools import MCPClient, RESULT_CACHE_STATS, create_mcp_tools
+from tools import mcp_tools
+
+CLIENT_ID = "bench-result-cache-client"
+# Stands in for SSE delivery, Playwright and the result POST of one command
+ROUND_TRIP_LATENCY = 0.05
+
+# An agent that re-reads the page around each action, as ReAct agents tend to
+SNAPSHOT = {"name": "browser_snapshot", "args": {}}
+STEPS = [
+    [{"name": "browser_navigate", "args": {"url": "https://www.example.com"}}],
+    [SNAPSHOT], [SNAPSHOT, {"name": "browser_tab_list", "args": {}}], [SNAPSHOT],
+    [{"name": "browser_click", "args": {"element": "Read more 3", "ref": "s1e10"}}],
+    [SNAPSHOT], [SNAPSHOT], [{"name": "browser_take_screenshot", "args": {"raw": False, "filename": "page.png"}}],
+    [SNAPSHOT],
+]
+
+async def run_task(enabled: bool) -> dict:
+    """Run the scripted task and count the commands that reached the client."""
+    mcp_tools.RESULT_CACHE_ENABLED = enabled
+    set_chat_model_factory(lambda config: FakeChatModel(steps=STEPS, latency=0))
+    sent = {"commands": 0}
+    routers = {}
+    answer = fake_local_client(
+        routers.__getitem__, latency=ROUND_TRIP_LATENCY,
+        respond=lambda command: fake_page_snapshot("https://www.example.com"),
+    )
+
+    async def send_command(client_id, command):
+        sent["commands"] += 1
+        await answer(client_id, command)
+
+    router = routers[CLIENT_ID] = MCPClient(client_id=CLIENT_ID, send_command_func=send_command)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tools = await create_mcp_tools(client_id=CLIENT_ID, tool_definitions=PLAYWRIGHT_TOOL_DEFINITIONS, mcp_client=router)
+        started = time.perf_counter()
+        await run_graph(CLIENT_ID, "Read example.com before and after following a link", tools)
+    return {"commands": sent["commands"], "seconds": time.perf_counter() - started}
+
+async def main():
+    calls = sum(len(step) for step in STEPS)
+    print(f"{calls} tool calls, {ROUND_TRIP_LATENCY * 1000:.0f} ms per client round-trip")
+    print(f"{'cache':>6} {'round-trips':>12} {'seconds':>8}")
+    for enabled in (False, True):
+        result = await run_task(enabled)
+        print(f"{'on' if enabled else 'off':>6} {result['commands']:>12} {result['seconds']:>8.3f}")
+    print(", ".join(f"{key}={value}" for key, value in RESULT_CACHE_STATS.items()))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+import asyncio
+import base64
+import gzip
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+import zstandard
+from starlette.requests import Request
+
+from bench_support import fake_page_snapshot
+from transport import read_result_payload
+
+SCREENSHOT_BYTES = 200_000
+ROUNDS = 20
+
+def task_results() -> List[Tuple[str, object, bytes]]:
+    """(commandId, result, screenshot bytes or b"") for a screenshot-heavy browser task."""
+    results = []
+    for i in range(3):
+        results.append((f"snapshot-{i}", fake_page_snapshot(f"https://example.com/{i}"), b""))
+        results.append((f"screenshot-{i}", None, os.urandom(SCREENSHOT_BYTES)))
+    return results
+
+def encode(transport: str, command_id: str, result: object, image: bytes) -> Tuple[bytes, Dict[str, str]]:
+    """Encode one result POST body the way the local client would for the given transport."""
+    if image and transport == "multipart":
+        payload = {"commandId": command_id, "result": [{"type": "image", "attachment": "a0", "mimeType": "image/png"}]}
+        request = httpx.Request(
+            "POST", "http://bench/result/c",
+            data={"payload": json.dumps(payload)},
+            files={"a0": ("a0.png", image, "image/png")},
+        )
+        return request.read(), {"content-type": request.headers["content-type"]}
+
+    if image:
+        result = [{"type": "image", "data": base64.b64encode(image).decode(), "mimeType": "image/png"}]
+    body = json.dumps({"commandId": command_id, "result": result}).encode()
+    headers = {"content-type": "application/json"}
+    if transport in ("gzip", "multipart"):
+        body, headers["content-encoding"] = gzip.compress(body, compresslevel=6), "gzip"
+    elif transport == "zstd":
+        body, headers["content-encoding"] = zstandard.ZstdCompressor().compress(body), "zstd"
+    return body, headers
+
+async def parse(body: bytes, headers: Dict[str, str]) -> dict:
+    """Run the server's result parser over a body, as /result would."""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/result/c", "query_string": b"",
+        "headers": [(key.encode(), value.encode()) for key, value in headers.items()],
+    }
+    return await read_result_payload(Request(scope, receive))
+
+async def main():
+    """Bytes on the wire and server parse time per screenshot-heavy task, by result transport."""
+    results = task_results()
+    print(f"task: {len(results)} results ({sum(1 for *_, image in results if image)} screenshots of {SCREENSHOT_BYTES // 1000} KB)")
+    print(f"{'transport':>10} {'KB on wire':>11} {'parse ms/task':>14}")
+    for transport in ("json", "gzip", "zstd", "multipart"):
+        encoded = [encode(transport, *item) for item in results]
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            for body, headers in encoded:
+                await parse(body, headers)
+        parse_ms = (time.perf_counter() - started) * 1000 / ROUNDS
+        wire_kb = sum(len(body) for body, _ in encoded) / 1000
+        print(f"{transport:>10} {wire_kb:>11.0f} {parse_ms:>14.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+from typing import Tuple
+
+import uvicorn
+
+from bench_support import SimulatedWebSocketClient, free_port
+from bench_e2e import percentile
+import main
+from transport import SESSION_STATS
+
+BLIPS = 50
+OUTAGE = 0.2
+
+async def call_across_blip(client: SimulatedWebSocketClient, n: int) -> Tuple[bool, float]:
+    """Issue a tool call while the client's socket is down; whether it succeeded and seconds until it settled."""
+    router = main.get_mcp_client(client.client_id)
+    await client.drop()
+    # Let the server notice the closed socket
+    while main.CLIENTS.get(client.client_id):
+        await asyncio.sleep(0.001)
+    started = time.perf_counter()
+    call = asyncio.create_task(router.send_command("mcp__playwright__browser_navigate", {"url": f"https://example.com/{n}"}))
+    settled = []
+    call.add_done_callback(lambda _: settled.append(time.perf_counter() - started))
+    await asyncio.sleep(OUTAGE)
+    await client.resume()
+    await asyncio.wait([call])
+    return call.exception() is None, settled[0]
+
+async def benchmark() -> None:
+    """Tool calls issued during a short outage of the client's socket, within and past the session grace period."""
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    print(f"{BLIPS} tool calls, each issued during a {OUTAGE * 1000:.0f} ms outage of the client's socket")
+    print(f"{'grace s':>8} {'completed':>10} {'failed':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for grace in (30.0, OUTAGE / 2):
+        main.SESSION_GRACE_PERIOD = grace
+        client = SimulatedWebSocketClient(f"ws://127.0.0.1:{port}", f"resume-{grace:g}", latency=0.005, payload_size=1024)
+        outcomes = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            await client.start()
+            for n in range(BLIPS):
+                outcomes.append(await call_across_blip(client, n))
+                if main.CLIENTS[client.client_id] and client.client_id not in main.CLIENT_TOOLS:
+                    # The session ended during the outage; register again as a new client would
+                    await client.stop()
+                    await client.start()
+            await client.stop()
+        settled = sorted(seconds for _, seconds in outcomes)
+        completed = sum(1 for ok, _ in outcomes if ok)
+        print(f"{grace:>8g} {completed:>10} {BLIPS - completed:>7} {statistics.median(settled) * 1000:>8.0f} "
+              f"{percentile(settled, 0.99) * 1000:>8.0f}")
+    print(f"sessions resumed {SESSION_STATS['resumed']}, commands replayed {SESSION_STATS['replayed_commands']}, "
+          f"sessions expired {SESSION_STATS['expired']}")
+
+    server.should_exit = True
+    await serving
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
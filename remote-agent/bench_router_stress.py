@@ -0,0 +1,93 @@
+import asyncio
+import random
+import time
+from collections import Counter
+
+import httpx
+
+import main
+
+CLIENT_ID = "stress-client"
+AGENTS = 8
+COMMANDS_PER_AGENT = 500
+DUPLICATE_RATE = 0.05
+WITHHELD_RATE = 0.02
+
+async def main_async():
+    """Interleave thousands of commands from concurrent agents through one client router."""
+    rng = random.Random(7)
+    outbox: asyncio.Queue = asyncio.Queue()
+
+    async def enqueue(client_id: str, command: dict):
+        await outbox.put(command)
+
+    main.MCP_CLIENTS[CLIENT_ID] = main.MCPClient(client_id=CLIENT_ID, send_command_func=enqueue)
+    router = main.get_mcp_client(CLIENT_ID)
+    withheld = set()
+    outcomes: Counter = Counter()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as http:
+
+        async def post_result(command_id: str) -> None:
+            response = await http.post(f"/result/{CLIENT_ID}", json={"commandId": command_id, "result": {"echo": command_id}})
+            outcomes[response.json().get("reason", "resolved")] += 1
+
+        async def local_client():
+            """Answer commands out of order, duplicating some and holding back others."""
+            while True:
+                command = await outbox.get()
+                # Cancel notices for expired commands need no answer
+                if command.get("type") == "cancel":
+                    continue
+                if rng.random() < WITHHELD_RATE:
+                    withheld.add(command["id"])
+                    continue
+
+                async def answer(command_id=command["id"]):
+                    await asyncio.sleep(rng.random() * 0.01)
+                    await post_result(command_id)
+                    if rng.random() < DUPLICATE_RATE:
+                        await post_result(command_id)
+                asyncio.create_task(answer())
+
+        async def agent(n: int) -> int:
+            ok = 0
+            for i in range(COMMANDS_PER_AGENT):
+                try:
+                    # Short client-side deadline stands in for the 60 s production timeout
+                    result = await asyncio.wait_for(router.send_command("browser_snapshot", {"agent": n, "step": i}), 0.5)
+                except asyncio.TimeoutError:
+                    continue
+                assert result["echo"], result
+                ok += 1
+            return ok
+
+        responder = asyncio.create_task(local_client())
+        started = time.perf_counter()
+        resolved = sum(await asyncio.gather(*(agent(n) for n in range(AGENTS))))
+        elapsed = time.perf_counter() - started
+
+        # Deliver held-back results after their commands expired
+        for command_id in withheld:
+            await post_result(command_id)
+        await asyncio.sleep(0.1)
+        responder.cancel()
+
+    total = AGENTS * COMMANDS_PER_AGENT
+    assert resolved + len(withheld) == total, (resolved, len(withheld), total)
+    assert outcomes["resolved"] == resolved, outcomes
+    assert outcomes["late"] == len(withheld), outcomes
+    assert outcomes["unknown"] == 0, outcomes
+    assert not router.pending_results, len(router.pending_results)
+    assert len(router.settled_commands) <= router.MAX_SETTLED_COMMANDS
+
+    print(f"{total} commands from {AGENTS} agents in {elapsed:.2f}s ({total / elapsed:.0f} cmd/s)")
+    print(f"resolved={outcomes['resolved']} duplicate={outcomes['duplicate']} late={outcomes['late']}")
+    print(f"pending futures left: {len(router.pending_results)}, settled IDs remembered: {len(router.settled_commands)}")
+
+async def run():
+    async with main.lifespan(main.app):
+        await main_async()
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+import uvicorn
+
+from bench_e2e import STEPS, percentile, run_client
+from bench_support import FakeChatModel, SimulatedWebSocketClient, free_port
+from graph import set_chat_model_factory
+import main
+
+REQUESTS = 16
+CONCURRENCY = 8
+LLM_LATENCY = 0.02
+# A browser action: navigation and clicks take a while, and a browser does one at a time
+TOOL_LATENCY = 0.1
+
+class SessionRecordingClient(SimulatedWebSocketClient):
+    """Records the sessions its commands were tagged with."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.sessions_seen = set()
+
+    async def _answer(self, event: str, payload: Dict[str, Any]) -> None:
+        self.sessions_seen.add(payload.get("sessionId"))
+        await super()._answer(event, payload)
+
+async def sample_utilization(client_id: str, samples: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        pool = main.SESSION_POOLS.get(client_id)
+        if pool is not None:
+            samples.append(pool.stats()["utilization"])
+        await asyncio.sleep(0.01)
+
+async def benchmark() -> None:
+    """Concurrent agent runs of one client, pinned to a pool of 1, 2 or 4 isolated browser sessions."""
+    set_chat_model_factory(lambda config: FakeChatModel(steps=STEPS, latency=LLM_LATENCY))
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    print(f"{REQUESTS} agent requests, {CONCURRENCY} in flight, {len(STEPS)} browser actions of {TOOL_LATENCY * 1000:.0f} ms each")
+    print(f"{'sessions':>9} {'requests/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'utilization':>12} {'sessions seen':>14}")
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) as http:
+        for sessions in (1, 2, 4):
+            client = SessionRecordingClient(
+                f"ws://127.0.0.1:{port}", f"sessions-client-{sessions}", TOOL_LATENCY, 1024, sessions=sessions
+            )
+            samples: List[float] = []
+            stop = asyncio.Event()
+            with contextlib.redirect_stdout(io.StringIO()):
+                await client.start()
+                sampler = asyncio.create_task(sample_utilization(client.client_id, samples, stop))
+                started = time.perf_counter()
+                latencies = await run_client(http, client, REQUESTS, CONCURRENCY)
+                elapsed = time.perf_counter() - started
+                stop.set()
+                await sampler
+                await client.stop()
+            completed = sorted(latency for latency in latencies if latency is not None)
+            print(f"{sessions:>9} {len(completed) / elapsed:>11.1f} {statistics.median(completed) * 1000:>8.0f} "
+                  f"{percentile(completed, 0.99) * 1000:>8.0f} {statistics.mean(samples):>11.0%} {len(client.sessions_seen):>14}")
+
+    server.should_exit = True
+    await serving
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
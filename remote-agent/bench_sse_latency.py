@@ -0,0 +1,82 @@
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List
+
+import main
+
+CLIENT_ID = "bench-sse-client"
+
+async def measure(concurrency: int) -> List[float]:
+    """Latency (ms) from send_command_to_client until the SSE chunk carrying the command is written."""
+    sent_at: Dict[str, float] = {}
+    latencies: List[float] = []
+    done = asyncio.Event()
+    connected = asyncio.Event()
+    disconnect = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            connected.set()
+            return
+        written_at = time.perf_counter()
+        for line in message.get("body", b"").decode().splitlines():
+            if not line.startswith("data: {"):
+                continue
+            command_id = json.loads(line[len("data: "):])["id"]
+            latencies.append((written_at - sent_at.pop(command_id)) * 1000)
+        if len(latencies) == concurrency:
+            done.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": f"/connect/{CLIENT_ID}",
+        "raw_path": f"/connect/{CLIENT_ID}".encode(),
+        "query_string": b"",
+        "headers": [(b"accept", b"text/event-stream")],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 8000),
+    }
+    stream = asyncio.create_task(main.app(scope, receive, send))
+    await connected.wait()
+    # Let the generator park on the empty queue, as it would between tool calls
+    while CLIENT_ID not in main.CLIENTS:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.05)
+
+    async def send_one(i: int):
+        command = {"id": f"cmd-{i}", "tool": "browser_snapshot", "params": {}}
+        sent_at[command["id"]] = time.perf_counter()
+        await main.send_command_to_client(CLIENT_ID, command)
+
+    await asyncio.gather(*(send_one(i) for i in range(concurrency)))
+    await asyncio.wait_for(done.wait(), timeout=30)
+
+    disconnect.set()
+    stream.cancel()
+    try:
+        await stream
+    except BaseException:
+        pass
+    return latencies
+
+async def main_async():
+    """Report enqueue-to-write latency at 1, 10 and 100 concurrent commands."""
+    print(f"{'concurrency':>11} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    async with main.lifespan(main.app):
+        for concurrency in (1, 10, 100):
+            latencies = sorted(await measure(concurrency))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{concurrency:>11} {statistics.median(latencies):>8.3f} {p99:>8.3f} {latencies[-1]:>8.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+import httpx
+import uvicorn
+
+from bench_support import SimulatedMCPClient, fake_openai_app, free_port
+
+MODES = ("eager", "lazy", "prewarm")
+IMPORT_ROUNDS = 3
+# Seconds the server sits idle before the first request in the second scenario
+IDLE_BEFORE_REQUEST = 3.0
+
+def import_seconds(mode: str) -> float:
+    """Wall time of `import main` in a fresh interpreter."""
+    script = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+    env = {**os.environ, "AGENT_STARTUP": mode, "OPENAI_API_KEY": "sk-benchmark"}
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+async def first_request(mode: str, llm_url: str, idle: float) -> Dict[str, float]:
+    """Start a server, wait until it answers, then time the first client's registration and agent run."""
+    port = free_port()
+    script = f"import uvicorn, main; uvicorn.run(main.app, host='127.0.0.1', port={port}, log_level='warning')"
+    env = {**os.environ, "AGENT_STARTUP": mode, "OPENAI_API_KEY": "sk-benchmark", "OPENAI_BASE_URL": llm_url}
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-c", script], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as http:
+            while True:
+                try:
+                    await http.get("/jobs", params={"limit": 1})
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.01)
+            ready = time.perf_counter() - started
+            await asyncio.sleep(idle)
+
+            request_started = time.perf_counter()
+            client = SimulatedMCPClient(http, "startup-client", latency=0)
+            await client.start()
+            job = (await http.post("/agent/startup-client", json={"input": "Open example.com"})).json()
+            status: Optional[str] = None
+            while status not in ("completed", "failed"):
+                await asyncio.sleep(0.005)
+                status = (await http.get(f"/jobs/{job['job_id']}")).json()["status"]
+            first = time.perf_counter() - request_started
+            await client.stop()
+        if status != "completed":
+            raise RuntimeError(f"First agent run {status} in {mode} mode")
+        return {"ready": ready, "first": first}
+    finally:
+        server.terminate()
+        server.wait()
+
+async def benchmark() -> None:
+    """Import time, time until the port answers, and first-request latency per startup mode."""
+    llm_port = free_port()
+    llm = uvicorn.Server(uvicorn.Config(fake_openai_app(), host="127.0.0.1", port=llm_port, log_level="warning"))
+    serving = asyncio.create_task(llm.serve())
+    while not llm.started:
+        await asyncio.sleep(0.01)
+    llm_url = f"http://127.0.0.1:{llm_port}/v1"
+
+    print(f"{'mode':>8} {'import s':>9} {'ready s':>8} {'first request s':>16} {f'after {IDLE_BEFORE_REQUEST:.0f}s idle':>14}")
+    for mode in MODES:
+        imported = statistics.median(import_seconds(mode) for _ in range(IMPORT_ROUNDS))
+        immediate = await first_request(mode, llm_url, 0)
+        idle = await first_request(mode, llm_url, IDLE_BEFORE_REQUEST)
+        print(f"{mode:>8} {imported:>9.2f} {immediate['ready']:>8.2f} {immediate['first']:>16.2f} {idle['first']:>14.2f}")
+
+    llm.should_exit = True
+    await serving
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,369 @@
+"""Shared fixtures for the benchmark scripts."""
+
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import websockets
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# ChatOpenAI refuses to construct without a key; benchmarks never reach the API
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+def _tool(tool_name: str, tool_description: str, **parameters: str) -> Dict[str, Any]:
+    return {
+        "name": f"mcp__playwright__{tool_name}",
+        "display_name": tool_name,
+        "description": tool_description,
+        "parameters": {
+            param: {"type": param_type, "description": f"The {param.replace('_', ' ')}"}
+            for param, param_type in parameters.items()
+        },
+    }
+
+# Tool definitions shaped like the ones the Playwright MCP client registers
+PLAYWRIGHT_TOOL_DEFINITIONS: List[Dict[str, Any]] = [
+    _tool("browser_close", "Close the page"),
+    _tool("browser_resize", "Resize the browser window", width="number", height="number"),
+    _tool("browser_console_messages", "Returns all console messages"),
+    _tool("browser_handle_dialog", "Handle a dialog", accept="boolean", prompt_text="string"),
+    _tool("browser_file_upload", "Upload one or multiple files", paths="string"),
+    _tool("browser_install", "Install the browser specified in the config"),
+    _tool("browser_press_key", "Press a key on the keyboard", key="string"),
+    _tool("browser_navigate", "Navigate to a URL", url="string"),
+    _tool("browser_navigate_back", "Go back to the previous page"),
+    _tool("browser_navigate_forward", "Go forward to the next page"),
+    _tool("browser_network_requests", "Returns all network requests since loading the page"),
+    _tool("browser_pdf_save", "Save page as PDF", filename="string"),
+    _tool("browser_take_screenshot", "Take a screenshot of the current page", raw="boolean", filename="string"),
+    _tool("browser_snapshot", "Capture accessibility snapshot of the current page"),
+    _tool("browser_click", "Perform click on a web page", element="string", ref="string"),
+    _tool("browser_drag", "Perform drag and drop between two elements",
+          start_element="string", start_ref="string", end_element="string", end_ref="string"),
+    _tool("browser_hover", "Hover over element on page", element="string", ref="string"),
+    _tool("browser_type", "Type text into editable element",
+          element="string", ref="string", text="string", submit="boolean", slowly="boolean"),
+    _tool("browser_select_option", "Select an option in a dropdown", element="string", ref="string", values="string"),
+    _tool("browser_tab_list", "List browser tabs"),
+    _tool("browser_tab_new", "Open a new tab", url="string"),
+    _tool("browser_tab_select", "Select a tab by index", index="integer"),
+    _tool("browser_tab_close", "Close a tab", index="integer"),
+    _tool("browser_generate_playwright_test", "Generate a Playwright test for given scenario",
+          name="string", description="string", steps="string"),
+    _tool("browser_wait_for", "Wait for text to appear or disappear or a specified time to pass",
+          time="number", text="string", text_gone="string"),
+]
+
+class FakeChatModel(BaseChatModel):
+    """Scripted chat model: calls `tool_calls` on the first step, then answers.
+
+    `steps` scripts several steps instead, one list of tool calls per step. Each
+    call sleeps `latency` seconds to stand in for the provider round-trip.
+    """
+
+    tool_calls: List[Dict[str, Any]] = []
+    steps: List[List[Dict[str, Any]]] = []
+    latency: float = 0.05
+    answer: str = "Task complete."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeChatModel":
+        return self
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        steps = self.steps or [self.tool_calls]
+        step = sum(1 for message in messages if isinstance(message, AIMessage) and message.tool_calls)
+        if step >= len(steps) or not steps[step]:
+            message = AIMessage(content=self.answer)
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": call["name"], "args": call.get("args", {}), "id": f"call_{step}_{i}", "type": "tool_call"}
+                    for i, call in enumerate(steps[step])
+                ],
+            )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+def free_port() -> int:
+    """A TCP port on localhost that is free to bind."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def fake_local_client(
+    get_router: Callable[[str], Any],
+    latency: float = 0.02,
+    payload_size: int = 64,
+    respond: Optional[Callable[[Dict[str, Any]], Any]] = None,
+) -> Callable:
+    """Return a send_command_func that answers every command after `latency` seconds.
+
+    Results come from `respond(command)` when given, else a `payload_size` filler.
+    """
+
+    async def send_command(client_id: str, command: Dict[str, Any]) -> None:
+        async def answer():
+            await asyncio.sleep(latency)
+            result = respond(command) if respond else {"content": "x" * payload_size}
+            get_router(client_id).receive_result(command["id"], result)
+        asyncio.create_task(answer())
+
+    return send_command
+
+def fake_page_snapshot(url: str, elements: int = 400) -> str:
+    """Playwright MCP style result text: page header plus a YAML accessibility tree."""
+    lines = [f"- Page URL: {url}", "- Page Title: Example", "- Page Snapshot", "```yaml"]
+    for i in range(elements):
+        lines.append(f"- generic [ref=s1e{i * 3}]:")
+        lines.append(f"  - text: Paragraph {i} of filler copy that describes the page content in some detail")
+        lines.append(f"  - link \"Read more {i}\" [ref=s1e{i * 3 + 1}]")
+    lines.append("```")
+    return "\n".join(lines)
+
+def fake_screenshot(size: int = 200_000) -> List[Dict[str, Any]]:
+    """MCP image content block with a base64 payload of roughly `size` bytes."""
+    return [{"type": "image", "data": base64.b64encode(os.urandom(size)).decode(), "mimeType": "image/png"}]
+
+class SimulatedMCPClient:
+    """Local MCP client stand-in speaking the real protocol over HTTP.
+
+    Holds `/connect/{client_id}` open, registers PLAYWRIGHT_TOOL_DEFINITIONS through
+    `/register_tools`, and answers each `command` (or `batch`) event after `latency`
+    seconds by POSTing a result of about `payload_size` characters to `/result`
+    (or `/results`). With `sessions` set it registers that many browser sessions and,
+    like one browser per session, answers a session's commands one at a time.
+    """
+
+    def __init__(
+        self, http: Any, client_id: str, latency: float = 0.02, payload_size: int = 4096, batch: bool = False, sessions: int = 0
+    ):
+        self.http = http
+        self.client_id = client_id
+        self.latency = latency
+        self.payload_size = payload_size
+        self.batch = batch
+        self.sessions = sessions
+        self._browsers: Dict[str, asyncio.Lock] = {}
+        self.commands_answered = 0
+        self._listener: Optional[asyncio.Task] = None
+        self._answers: set = set()
+        self._cancelled: set = set()
+
+    def result_for(self, command: Dict[str, Any]) -> str:
+        text = fake_page_snapshot(command.get("params", {}).get("url", "https://www.example.com"), elements=1)
+        return text + "\n" + "x" * max(0, self.payload_size - len(text))
+
+    def capabilities(self) -> Dict[str, Any]:
+        return {"batch": self.batch, **({"sessions": self.sessions} if self.sessions else {})}
+
+    async def start(self) -> None:
+        connected = asyncio.Event()
+        self._listener = asyncio.create_task(self._listen(connected))
+        await connected.wait()
+        response = await self.http.post(
+            f"/register_tools/{self.client_id}",
+            json={"tools": PLAYWRIGHT_TOOL_DEFINITIONS, "capabilities": self.capabilities()},
+        )
+        response.raise_for_status()
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        await asyncio.gather(*([self._listener] if self._listener else []), *self._answers, return_exceptions=True)
+
+    async def _listen(self, connected: asyncio.Event) -> None:
+        async with self.http.stream("GET", f"/connect/{self.client_id}") as response:
+            connected.set()
+            event, data = None, []
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data.append(line[len("data: "):])
+                elif not line and data:
+                    if event != "heartbeat":
+                        self._dispatch(event, json.loads("\n".join(data)))
+                    event, data = None, []
+
+    def _dispatch(self, event: Optional[str], payload: Any) -> None:
+        if event == "cancel":
+            self._cancelled.add(payload["commandId"])
+            return
+        if event not in ("command", "batch"):
+            return
+        task = asyncio.create_task(self._answer(event, payload))
+        self._answers.add(task)
+        task.add_done_callback(self._answers.discard)
+
+    async def _answer(self, event: str, payload: Dict[str, Any]) -> None:
+        if self.sessions:
+            commands = payload["commands"] if event == "batch" else [payload]
+            async with contextlib.AsyncExitStack() as browsers:
+                # Lock in a fixed order so batches spanning sessions cannot deadlock
+                for session_id in sorted({command.get("sessionId", "0") for command in commands}):
+                    await browsers.enter_async_context(self._browsers.setdefault(session_id, asyncio.Lock()))
+                await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        if event == "batch":
+            results = [
+                {"commandId": command["id"], "result": self.result_for(command)}
+                for command in payload["commands"] if command["id"] not in self._cancelled
+            ]
+            await self._send("results", {"batchId": payload["id"], "results": results})
+            self.commands_answered += len(results)
+        elif payload["id"] not in self._cancelled:
+            await self._send("result", {"commandId": payload["id"], "result": self.result_for(payload)})
+            self.commands_answered += 1
+
+    async def _send(self, kind: str, body: Dict[str, Any]) -> None:
+        await self.http.post(f"/{kind}/{self.client_id}", json=body)
+
+class SimulatedWebSocketClient(SimulatedMCPClient):
+    """SimulatedMCPClient over `/ws/{client_id}`: commands, results and registration share one socket.
+
+    `base_url` is the server's `ws://host:port`. `drop()` and `resume()` simulate a
+    network blip: the socket closes and a new one picks up after the last event seen.
+    """
+
+    def __init__(
+        self, base_url: str, client_id: str, latency: float = 0.02, payload_size: int = 4096, batch: bool = False, sessions: int = 0
+    ):
+        super().__init__(None, client_id, latency, payload_size, batch, sessions)
+        self.base_url = base_url
+        self.last_event_id: Optional[int] = None
+        self._socket: Any = None
+
+    async def start(self) -> None:
+        self._socket = await websockets.connect(f"{self.base_url}/ws/{self.client_id}", max_size=None)
+        await self._send("register_tools", {"tools": PLAYWRIGHT_TOOL_DEFINITIONS, "capabilities": self.capabilities()})
+        frame = json.loads(await self._socket.recv())
+        if frame["event"] != "registered":
+            raise RuntimeError(f"Tool registration failed: {frame}")
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._socket is not None:
+            await self._socket.close()
+
+    async def drop(self) -> None:
+        """Close the socket without unregistering, as a lost connection does."""
+        await super().stop()
+        await self._socket.close()
+
+    async def resume(self) -> None:
+        """Reconnect with the last event ID seen, so the server replays what was missed."""
+        query = f"?last_event_id={self.last_event_id}" if self.last_event_id is not None else ""
+        self._socket = await websockets.connect(f"{self.base_url}/ws/{self.client_id}{query}", max_size=None)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        async for message in self._socket:
+            frame = json.loads(message)
+            if frame.get("id") is not None:
+                self.last_event_id = frame["id"]
+            self._dispatch(frame["event"], frame["data"])
+
+    async def _send(self, kind: str, body: Dict[str, Any]) -> None:
+        await self._socket.send(json.dumps({"type": kind, **body}))
+
+class FakeRateLimits:
+    """A provider's request and token limits: buckets refilling a minute's quota per
+    minute and holding `burst` seconds' worth, as providers enforce them."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, burst: float = 1.0):
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.capacity = {kind: limit / 60 * burst for kind, limit in self.limits.items()}
+        self.level = dict(self.capacity)
+        self.updated = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+
+    def admit(self, tokens: int) -> Dict[str, str]:
+        """Headers for a request of `tokens` tokens; a `retry-after` one means it was refused."""
+        now = time.monotonic()
+        for kind, limit in self.limits.items():
+            if limit > 0:
+                self.level[kind] = min(self.capacity[kind], self.level[kind] + (now - self.updated) * limit / 60)
+        self.updated = now
+        needed = {"requests": 1, "tokens": tokens}
+        waits = [
+            (needed[kind] - self.level[kind]) / (limit / 60)
+            for kind, limit in self.limits.items() if limit > 0 and self.level[kind] < needed[kind]
+        ]
+        if waits:
+            self.rejected += 1
+        else:
+            self.accepted += 1
+            for kind, limit in self.limits.items():
+                if limit > 0:
+                    self.level[kind] -= needed[kind]
+        headers = {
+            f"x-ratelimit-remaining-{kind}": str(max(0, int(self.level[kind])))
+            for kind, limit in self.limits.items() if limit > 0
+        }
+        if waits:
+            headers["retry-after"] = f"{max(waits):.3f}"
+        return headers
+
+def fake_openai_app(answer: str = "Done.", latency: float = 0.0, rate_limits: Optional[FakeRateLimits] = None) -> Any:
+    """ASGI app answering OpenAI chat completion requests with a fixed final answer.
+
+    Point the server at it with `OPENAI_BASE_URL=http://host:port/v1` to exercise the
+    real ChatOpenAI client without network access. Streamed requests get the answer
+    as a single chunk. With `rate_limits`, requests over them get a 429 and every
+    response carries `x-ratelimit-remaining-*` headers, as OpenAI's do.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    async def completions(request: Any) -> Any:
+        raw = await request.body()
+        body = json.loads(raw)
+        headers = rate_limits.admit(len(raw) // 4 + int(body.get("max_tokens") or 0)) if rate_limits else {}
+        if "retry-after" in headers:
+            error = {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}
+            return JSONResponse({"error": error}, status_code=429, headers=headers)
+        await asyncio.sleep(latency)
+        usage = {"prompt_tokens": len(raw) // 4, "completion_tokens": 2, "total_tokens": len(raw) // 4 + 2}
+        completion = {"id": "chatcmpl-bench", "created": 0, "model": body.get("model", "gpt-4o")}
+        if not body.get("stream"):
+            return JSONResponse({
+                **completion,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            }, headers=headers)
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str]) -> str:
+            choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            return f"data: {json.dumps({**completion, 'object': 'chat.completion.chunk', 'choices': [choice]})}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": answer}, None)
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    return Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
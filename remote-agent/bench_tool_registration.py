@@ -0,0 +1,69 @@
+import asyncio
+import contextlib
+import io
+import json
+import time
+from typing import Dict, List
+
+import httpx
+
+from bench_support import PLAYWRIGHT_TOOL_DEFINITIONS
+import main
+from tools import TOOL_CATALOG, tool_hash, tool_set_hash
+
+CLIENTS = 200
+
+async def register(http: httpx.AsyncClient, client_id: str, hashed: bool) -> None:
+    """Register the way a client does on (re)connect: the whole list, or hashes first."""
+    if not hashed:
+        await http.post(f"/register_tools/{client_id}", json={"tools": PLAYWRIGHT_TOOL_DEFINITIONS})
+        return
+    tool_hashes = [tool_hash(tool_def) for tool_def in PLAYWRIGHT_TOOL_DEFINITIONS]
+    registration = {"toolSetHash": tool_set_hash(tool_hashes), "toolHashes": tool_hashes}
+    response = (await http.post(f"/register_tools/{client_id}", json=registration)).json()
+    if response["status"] == "incomplete":
+        missing = set(response["missing"])
+        tools = [tool_def for tool_def, digest in zip(PLAYWRIGHT_TOOL_DEFINITIONS, tool_hashes) if digest in missing]
+        await http.post(f"/register_tools/{client_id}", json={**registration, "tools": tools})
+
+def disconnect_all(client_ids: List[str]) -> None:
+    """Drop the clients' registered tools, as the end of their sessions does."""
+    for client_id in client_ids:
+        main.CLIENT_TOOLS.pop(client_id, None)
+        main.CLIENT_TOOL_OBJECTS.pop(client_id, None)
+
+async def storm(hashed: bool) -> Dict[str, float]:
+    """Register CLIENTS identical clients, drop them all, and have them all re-register at once."""
+    TOOL_CATALOG._tools.clear()
+    TOOL_CATALOG._sets.clear()
+    sent = {"bytes": 0, "requests": 0}
+
+    async def count(request: httpx.Request) -> None:
+        sent["bytes"] += len(request.content)
+        sent["requests"] += 1
+
+    client_ids = [f"bench-{'hashed' if hashed else 'full'}-{i}" for i in range(CLIENTS)]
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", event_hooks={"request": [count]}) as http:
+        for client_id in client_ids:
+            await register(http, client_id, hashed)
+        disconnect_all(client_ids)
+        sent.update(bytes=0, requests=0)
+        started = time.perf_counter()
+        await asyncio.gather(*(register(http, client_id, hashed) for client_id in client_ids))
+        elapsed = time.perf_counter() - started
+    return {"ms": elapsed * 1000, "kb": sent["bytes"] / 1000, "requests": sent["requests"]}
+
+async def benchmark() -> None:
+    """Bytes and server time for a reconnect storm, full tool lists vs registration by hash."""
+    full_size = len(json.dumps({"tools": PLAYWRIGHT_TOOL_DEFINITIONS}))
+    print(f"{CLIENTS} clients reconnecting with the same {len(PLAYWRIGHT_TOOL_DEFINITIONS)} tools ({full_size / 1000:.1f} KB as a full list)")
+    print(f"{'registration':>13} {'requests':>9} {'KB sent':>8} {'storm ms':>9}")
+    async with main.lifespan(main.app):
+        for hashed in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = await storm(hashed)
+            print(f"{'by hash' if hashed else 'full list':>13} {result['requests']:>9} {result['kb']:>8.0f} {result['ms']:>9.0f}")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
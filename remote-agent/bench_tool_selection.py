@@ -0,0 +1,104 @@
+import asyncio
+import contextlib
+import io
+import json
+import time
+from typing import Any, Dict, List
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from bench_support import FakeChatModel, PLAYWRIGHT_TOOL_DEFINITIONS, fake_local_client
+from graph import run_graph, set_chat_model_factory
+from graph import workflow
+from tools import MCPClient, ToolIndex, create_mcp_tools
+from tools.compaction import estimate_tokens
+
+CLIENT_ID = "bench-selection-client"
+
+# Requests and the tool calls the model makes for them, one list per step
+TASKS = [
+    ("Go to example.com and click the Read more link", [
+        [{"name": "browser_navigate", "args": {"url": "https://www.example.com"}}],
+        [{"name": "browser_click", "args": {"element": "Read more", "ref": "s1e1"}}],
+    ]),
+    ("Open openai.com and take a screenshot of the page", [
+        [{"name": "browser_navigate", "args": {"url": "https://openai.com"}}],
+        [{"name": "browser_take_screenshot", "args": {}}],
+    ]),
+    ("Search example.com for pricing: type pricing into the search box and press Enter", [
+        [{"name": "browser_navigate", "args": {"url": "https://www.example.com"}}],
+        [{"name": "browser_type", "args": {"element": "Search", "ref": "s1e2", "text": "pricing"}}],
+        [{"name": "browser_press_key", "args": {"key": "Enter"}}],
+    ]),
+    ("Choose Korea from the country dropdown on example.com/signup", [
+        [{"name": "browser_navigate", "args": {"url": "https://www.example.com/signup"}}],
+        [{"name": "browser_select_option", "args": {"element": "Country", "ref": "s1e3", "values": "Korea"}}],
+    ]),
+    ("Open a new tab with openai.com, then list the tabs", [
+        [{"name": "browser_tab_new", "args": {"url": "https://openai.com"}}],
+        [{"name": "browser_tab_list", "args": {}}],
+    ]),
+    ("What does example.com say about pricing?", [
+        [{"name": "browser_navigate", "args": {"url": "https://www.example.com"}}],
+        [{"name": "browser_snapshot", "args": {}}],
+    ]),
+]
+
+async def run_tasks(tools: List[Any], top_k: int) -> Dict[str, Any]:
+    """Run every task; tool schema tokens per LLM call and how many scripted calls had their tool bound."""
+    workflow.TOOL_TOP_K = top_k
+    bound_per_call: List[List[str]] = []
+    schema_tokens: List[int] = []
+
+    class RecordingModel(FakeChatModel):
+        bound: List[Dict[str, Any]] = []
+
+        def bind_tools(self, tools: Any, **kwargs: Any) -> "RecordingModel":
+            return self.model_copy(update={"bound": [convert_to_openai_tool(tool) for tool in tools]})
+
+        def _respond(self, messages):
+            bound_per_call.append([tool["function"]["name"] for tool in self.bound])
+            schema_tokens.append(estimate_tokens(json.dumps(self.bound)))
+            return super()._respond(messages)
+
+    covered = scripted = 0
+    for request, steps in TASKS:
+        set_chat_model_factory(lambda config, steps=steps: RecordingModel(steps=steps, latency=0))
+        first_call = len(bound_per_call)
+        with contextlib.redirect_stdout(io.StringIO()):
+            await run_graph(CLIENT_ID, request, tools)
+        for step, calls in enumerate(steps):
+            for call in calls:
+                scripted += 1
+                covered += call["name"] in bound_per_call[first_call + step]
+    return {
+        "calls": len(schema_tokens),
+        "tools": sum(map(len, bound_per_call)) / len(bound_per_call),
+        "schema_tokens": sum(schema_tokens) / len(schema_tokens),
+        "covered": covered,
+        "scripted": scripted,
+    }
+
+async def benchmark() -> None:
+    """Tool schema tokens per LLM call and selection recall, all tools bound vs top-k by BM25."""
+    routers = {}
+    router = routers[CLIENT_ID] = MCPClient(client_id=CLIENT_ID, send_command_func=fake_local_client(routers.__getitem__, latency=0))
+    tools = await create_mcp_tools(client_id=CLIENT_ID, tool_definitions=PLAYWRIGHT_TOOL_DEFINITIONS, mcp_client=router)
+    started = time.perf_counter()
+    index = ToolIndex.from_tools(tools)
+    built_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    for request, _ in TASKS * 100:
+        index.select(request, {"browser_navigate", "browser_snapshot"})
+    select_us = (time.perf_counter() - started) / (len(TASKS) * 100) * 1e6
+    print(f"{len(tools)} tools indexed in {built_ms:.2f} ms, {select_us:.0f} us per selection")
+
+    print(f"{'bound':>8} {'LLM calls':>10} {'tools/call':>11} {'schema tokens/call':>19} {'tool bound when called':>23}")
+    for top_k in (0, 8, 4):
+        result = await run_tasks(tools, top_k)
+        label = "all" if top_k == 0 else f"top {top_k}"
+        print(f"{label:>8} {result['calls']:>10} {result['tools']:>11.1f} {result['schema_tokens']:>19.0f} "
+              f"{result['covered']:>17}/{result['scripted']}")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
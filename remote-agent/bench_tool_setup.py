@@ -0,0 +1,58 @@
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+import httpx
+
+from bench_support import PLAYWRIGHT_TOOL_DEFINITIONS
+import main
+from tools import create_mcp_tools
+from tools import mcp_tools
+
+REQUESTS = 50
+
+async def per_request_build(client_id: str) -> float:
+    """Old /agent path: rebuild schemas and tools from the definitions on every request."""
+    mcp_tools._ARGS_SCHEMA_CACHE.clear()
+    started = time.perf_counter()
+    await create_mcp_tools(
+        client_id=client_id,
+        tool_definitions=PLAYWRIGHT_TOOL_DEFINITIONS,
+        mcp_client=main.get_mcp_client(client_id),
+    )
+    return (time.perf_counter() - started) * 1000
+
+async def main_async():
+    """Per-request tool setup cost before and after building tools at registration."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        before = [await per_request_build("bench-before") for _ in range(REQUESTS)]
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as http:
+            mcp_tools._ARGS_SCHEMA_CACHE.clear()
+            registration = []
+            for client_id in ("bench-after-1", "bench-after-2"):
+                started = time.perf_counter()
+                await http.post(f"/register_tools/{client_id}", json={"tools": PLAYWRIGHT_TOOL_DEFINITIONS})
+                registration.append((time.perf_counter() - started) * 1000)
+
+        after = []
+        for _ in range(REQUESTS):
+            started = time.perf_counter()
+            tools = main.CLIENT_TOOL_OBJECTS.get("bench-after-1") or await main.build_client_tools("bench-after-1")
+            after.append((time.perf_counter() - started) * 1000)
+
+    shared = all(
+        a.args_schema is b.args_schema
+        for a, b in zip(main.CLIENT_TOOL_OBJECTS["bench-after-1"], main.CLIENT_TOOL_OBJECTS["bench-after-2"])
+        if a.args_schema is not None
+    )
+    print(f"{len(PLAYWRIGHT_TOOL_DEFINITIONS)} tool definitions, {REQUESTS} requests")
+    print(f"before: tool setup per /agent request, median {statistics.median(before):.3f} ms")
+    print(f"after:  tool setup per /agent request, median {statistics.median(after):.4f} ms")
+    print(f"registration: first client {registration[0]:.2f} ms, identical second client {registration[1]:.2f} ms")
+    print(f"schemas shared between identical clients: {shared}")
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,86 @@
+import asyncio
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from bench_e2e import percentile
+from tools import MCPClient, TOOL_LATENCIES
+from tools import deadlines
+
+CLIENT_ID = "bench-timeouts-client"
+TOOL = "mcp__playwright__browser_snapshot"
+CALLS = 1000
+CONCURRENCY = 20
+# Share of commands (and of resent copies) the client never answers; kept under 1%,
+# since timeouts count as slow samples and more of them back the p99 timeout off to the max
+LOSS_RATE = 0.005
+# The hard-coded 60 s timeout scaled down 10x, so a lost command does not stall the run for a minute
+FIXED_TIMEOUT = 6.0
+
+class LossyClient:
+    """A send_command_func answering in 20-60 ms, with a slow tail, and losing some commands."""
+
+    def __init__(self, routers: Dict[str, MCPClient], rng: random.Random):
+        self.routers = routers
+        self.rng = rng
+        self.loss_rate = 0.0
+        self.sent = 0
+        self.command_ids = set()
+
+    async def __call__(self, client_id: str, command: Dict[str, Any]) -> None:
+        self.sent += 1
+        self.command_ids.add(command["id"])
+        if self.rng.random() < self.loss_rate:
+            return
+        latency = self.rng.uniform(0.02, 0.06) if self.rng.random() > 0.03 else self.rng.uniform(0.1, 0.3)
+
+        async def answer():
+            await asyncio.sleep(latency)
+            self.routers[client_id].receive_result(command["id"], {"content": "snapshot"})
+        asyncio.create_task(answer())
+
+async def run_calls(router: MCPClient, calls: int) -> List[Optional[float]]:
+    """Seconds each call took, None for the ones that failed."""
+    gate = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(n: int) -> Optional[float]:
+        async with gate:
+            started = time.perf_counter()
+            try:
+                await router.send_command(TOOL, {"n": n})
+            except TimeoutError:
+                return None
+            return time.perf_counter() - started
+
+    return await asyncio.gather(*(one(n) for n in range(calls)))
+
+async def benchmark() -> None:
+    """Snapshot calls to a client that loses some commands: fixed timeout, p99-derived timeout, and hedging."""
+    routers: Dict[str, MCPClient] = {}
+    client = LossyClient(routers, random.Random(7))
+    router = routers[CLIENT_ID] = MCPClient(client_id=CLIENT_ID, send_command_func=client)
+    # Results are not reused between calls, so every call reaches the client
+    router.read_only_tools = set()
+    await run_calls(router, 100)
+    p95, p99 = TOOL_LATENCIES.quantile(TOOL, 0.95), TOOL_LATENCIES.quantile(TOOL, 0.99)
+    print(f"{CALLS} snapshot calls, {CONCURRENCY} in flight, {LOSS_RATE:.1%} of commands lost; "
+          f"warmed p95 {p95 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms, timeouts scaled 10x down")
+    print(f"{'mode':>10} {'timeout s':>10} {'failed':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'seconds':>8} {'resends':>8}")
+
+    client.loss_rate = LOSS_RATE
+    deadlines.MAX_TOOL_TIMEOUT = FIXED_TIMEOUT
+    for mode in ("fixed", "p99", "p99+hedge"):
+        deadlines.MIN_TOOL_TIMEOUT = FIXED_TIMEOUT if mode == "fixed" else 0.5
+        router.idempotent_tools = {TOOL} if mode == "p99+hedge" else set()
+        client.sent, client.command_ids = 0, set()
+        started = time.perf_counter()
+        results = await run_calls(router, CALLS)
+        elapsed = time.perf_counter() - started
+        settled = sorted(seconds for seconds in results if seconds is not None)
+        print(f"{mode:>10} {TOOL_LATENCIES.timeout(TOOL):>10.2f} {CALLS - len(settled):>7} {statistics.median(settled) * 1000:>8.0f} "
+              f"{percentile(settled, 0.99) * 1000:>8.0f} {settled[-1] * 1000:>8.0f} {elapsed:>8.2f} "
+              f"{client.sent - len(client.command_ids):>8}")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
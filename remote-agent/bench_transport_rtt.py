@@ -0,0 +1,70 @@
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+from typing import List
+
+import httpx
+import uvicorn
+
+from bench_support import SimulatedMCPClient, SimulatedWebSocketClient, free_port
+from bench_e2e import percentile
+import main
+
+SEQUENTIAL = 300
+CONCURRENT = 50
+PAYLOAD_SIZES = (256, 16_384)
+
+async def round_trips(client_id: str, concurrency: int, total: int) -> List[float]:
+    """Milliseconds per tool call from MCPClient.send_command until its result resolves."""
+    router = main.get_mcp_client(client_id)
+    latencies: List[float] = []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(n: int) -> None:
+        async with gate:
+            started = time.perf_counter()
+            # A mutating tool, so the read-only result cache never answers
+            await router.send_command("mcp__playwright__browser_navigate", {"url": f"https://example.com/{n}"})
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(n) for n in range(total)))
+    return sorted(latencies)
+
+async def benchmark() -> None:
+    """Command round-trip over SSE + POST vs one WebSocket, through a real uvicorn server."""
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    print(f"{'transport':>10} {'payload':>8} {'in flight':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls/s':>8}")
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as http:
+        for payload_size in PAYLOAD_SIZES:
+            for transport in ("sse", "websocket"):
+                client_id = f"rtt-{transport}-{payload_size}"
+                if transport == "sse":
+                    client = SimulatedMCPClient(http, client_id, latency=0, payload_size=payload_size)
+                else:
+                    client = SimulatedWebSocketClient(f"ws://127.0.0.1:{port}", client_id, latency=0, payload_size=payload_size)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await client.start()
+                    # Warm up connections before measuring
+                    await round_trips(client_id, 1, 10)
+                    runs = []
+                    for concurrency, total in ((1, SEQUENTIAL), (CONCURRENT, SEQUENTIAL * 2)):
+                        started = time.perf_counter()
+                        latencies = await round_trips(client_id, concurrency, total)
+                        runs.append((concurrency, latencies, total / (time.perf_counter() - started)))
+                    await client.stop()
+                for concurrency, latencies, rate in runs:
+                    print(f"{transport:>10} {payload_size:>8} {concurrency:>10} {statistics.median(latencies):>8.2f} "
+                          f"{percentile(latencies, 0.95):>8.2f} {percentile(latencies, 0.99):>8.2f} {rate:>8.0f}")
+
+    server.should_exit = True
+    await serving
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -0,0 +1,15 @@
+import os
+
+from .base import CommandBroker
+from .in_process import InProcessBroker
+from .unix_socket import UnixSocketBroker
+
+def create_broker(kind: str = "inprocess") -> CommandBroker:
+    """Create the broker selected by name: "inprocess" (default) or "unix"."""
+    if kind == "unix":
+        return UnixSocketBroker(os.environ.get("MCP_BROKER_DIR", "/tmp/remote-agent-broker"))
+    if kind == "inprocess":
+        return InProcessBroker()
+    raise ValueError(f"Unknown broker: {kind}")
+
+__all__ = ["CommandBroker", "InProcessBroker", "UnixSocketBroker", "create_broker"]
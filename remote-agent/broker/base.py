@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Hands a command to the SSE streams this process holds for a client
+CommandHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+# Resolves a result against this process's command routers; returns the outcome
+ResultHandler = Callable[[str, str, Any], str]
+
+class CommandBroker(ABC):
+    """Routes commands to the process holding a client's SSE stream, and results back
+    to the process whose agent run is waiting for them.
+    """
+
+    def __init__(self) -> None:
+        self.deliver_command: Optional[CommandHandler] = None
+        self.deliver_result: Optional[ResultHandler] = None
+
+    @property
+    def command_id_prefix(self) -> str:
+        """Prefix for command IDs issued by this process, used to route their results."""
+        return ""
+
+    async def start(self, deliver_command: CommandHandler, deliver_result: ResultHandler) -> None:
+        """Start the broker with the handlers for local delivery."""
+        self.deliver_command = deliver_command
+        self.deliver_result = deliver_result
+
+    async def stop(self) -> None:
+        """Release the broker's resources."""
+
+    @abstractmethod
+    async def attach_client(self, client_id: str) -> None:
+        """Record that this process now holds an SSE stream for the client."""
+
+    async def suspend_client(self, client_id: str) -> None:
+        """Record that this process's last stream for the client closed; the process
+        keeps the client's session for the grace period, in case it reconnects here.
+        """
+
+    @abstractmethod
+    async def detach_client(self, client_id: str) -> None:
+        """Record that this process no longer holds the client's session."""
+
+    @abstractmethod
+    async def send_command(self, client_id: str, command: Dict[str, Any]) -> None:
+        """Deliver a command to whichever process holds the client's SSE stream."""
+
+    @abstractmethod
+    async def send_result(self, client_id: str, command_id: str, result: Any) -> str:
+        """Deliver a result to the process that issued the command; returns the outcome."""
+
+    @abstractmethod
+    async def publish_tools(self, client_id: str, tools: List[Dict[str, Any]]) -> None:
+        """Share a client's registered tool definitions with every process."""
+
+    @abstractmethod
+    async def get_tools(self, client_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the client's registered tool definitions, if any process has them."""
@@ -0,0 +1,28 @@
+from typing import Any, Dict, List, Optional
+
+from .base import CommandBroker
+
+class InProcessBroker(CommandBroker):
+    """Broker for a single server process: everything is delivered locally."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.tools: Dict[str, List[Dict[str, Any]]] = {}
+
+    async def attach_client(self, client_id: str) -> None:
+        pass
+
+    async def detach_client(self, client_id: str) -> None:
+        self.tools.pop(client_id, None)
+
+    async def send_command(self, client_id: str, command: Dict[str, Any]) -> None:
+        await self.deliver_command(client_id, command)
+
+    async def send_result(self, client_id: str, command_id: str, result: Any) -> str:
+        return self.deliver_result(client_id, command_id, result)
+
+    async def publish_tools(self, client_id: str, tools: List[Dict[str, Any]]) -> None:
+        self.tools[client_id] = tools
+
+    async def get_tools(self, client_id: str) -> Optional[List[Dict[str, Any]]]:
+        return self.tools.get(client_id)
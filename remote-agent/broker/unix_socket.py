@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from .base import CommandBroker, CommandHandler, ResultHandler
+
+class UnixSocketBroker(CommandBroker):
+    """Broker for several worker processes on one host, e.g. `uvicorn --workers N`.
+
+    Each worker listens on its own Unix socket in `directory`. A SQLite file shared by
+    the workers records which worker holds each client's SSE stream, plus the clients'
+    tool definitions. Command IDs carry the issuing worker's ID, so a result posted
+    to any worker is forwarded to the worker whose agent run is waiting for it.
+    """
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.directory = directory
+        self.worker_id = f"w{os.getpid()}"
+        self.socket_path = self._socket_path(self.worker_id)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._peers: Dict[str, asyncio.StreamWriter] = {}
+        self._peer_locks: Dict[str, asyncio.Lock] = {}
+        # Clients whose session this worker holds, with or without a live stream
+        self._sessions: Set[str] = set()
+
+    @property
+    def command_id_prefix(self) -> str:
+        return f"{self.worker_id}:"
+
+    def _socket_path(self, worker_id: str) -> str:
+        return os.path.join(self.directory, f"{worker_id}.sock")
+
+    async def start(self, deliver_command: CommandHandler, deliver_result: ResultHandler) -> None:
+        await super().start(deliver_command, deliver_result)
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self.socket_path)
+
+        self._db = sqlite3.connect(os.path.join(self.directory, "registry.db"), isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS client_streams ("
+            "client_id TEXT, worker_id TEXT, attached_at REAL, PRIMARY KEY (client_id, worker_id))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS client_tools (client_id TEXT PRIMARY KEY, tools TEXT)")
+        print(f"Broker worker {self.worker_id} listening on {self.socket_path}")
+
+    async def stop(self) -> None:
+        for writer in self._peers.values():
+            writer.close()
+        self._peers.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._db is not None:
+            self._db.execute("DELETE FROM client_streams WHERE worker_id = ?", (self.worker_id,))
+            self._db.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def attach_client(self, client_id: str) -> None:
+        self._sessions.add(client_id)
+        self._db.execute(
+            "INSERT OR REPLACE INTO client_streams VALUES (?, ?, ?)", (client_id, self.worker_id, time.time())
+        )
+
+    async def suspend_client(self, client_id: str) -> None:
+        # Commands go to the worker the client reconnects to, if it picks another one
+        self._db.execute(
+            "DELETE FROM client_streams WHERE client_id = ? AND worker_id = ?", (client_id, self.worker_id)
+        )
+
+    async def detach_client(self, client_id: str) -> None:
+        self._sessions.discard(client_id)
+        self._db.execute(
+            "DELETE FROM client_streams WHERE client_id = ? AND worker_id = ?", (client_id, self.worker_id)
+        )
+        # Tool definitions go away with the client's last stream, as they do in-process
+        if not self._stream_workers(client_id):
+            self._db.execute("DELETE FROM client_tools WHERE client_id = ?", (client_id,))
+
+    def _stream_workers(self, client_id: str) -> List[str]:
+        rows = self._db.execute(
+            "SELECT worker_id FROM client_streams WHERE client_id = ? ORDER BY attached_at DESC", (client_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    async def send_command(self, client_id: str, command: Dict[str, Any]) -> None:
+        workers = self._stream_workers(client_id)
+        if self.worker_id in workers:
+            await self.deliver_command(client_id, command)
+            return
+        # Newest stream first; drop registrations of workers that are gone
+        for worker_id in workers:
+            try:
+                await self._forward(worker_id, {"op": "command", "client_id": client_id, "command": command})
+                return
+            except OSError:
+                self._db.execute("DELETE FROM client_streams WHERE worker_id = ?", (worker_id,))
+        if client_id in self._sessions:
+            # The client may still reconnect here; the command waits in its replay buffer
+            await self.deliver_command(client_id, command)
+            return
+        # As in-process, the caller fails the command instead of waiting for its timeout
+        raise ConnectionError(f"No worker holds a stream for client {client_id}")
+
+    async def send_result(self, client_id: str, command_id: str, result: Any) -> str:
+        origin = command_id.split(":", 1)[0] if ":" in command_id else self.worker_id
+        if origin == self.worker_id:
+            return self.deliver_result(client_id, command_id, result)
+        try:
+            await self._forward(origin, {"op": "result", "client_id": client_id, "command_id": command_id, "result": result})
+        except OSError:
+            return "unknown"
+        return "forwarded"
+
+    async def publish_tools(self, client_id: str, tools: List[Dict[str, Any]]) -> None:
+        self._db.execute("INSERT OR REPLACE INTO client_tools VALUES (?, ?)", (client_id, json.dumps(tools)))
+
+    async def get_tools(self, client_id: str) -> Optional[List[Dict[str, Any]]]:
+        row = self._db.execute("SELECT tools FROM client_tools WHERE client_id = ?", (client_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def _forward(self, worker_id: str, message: Dict[str, Any]) -> None:
+        """Send one length-prefixed JSON frame to another worker, reusing its connection."""
+        frame = json.dumps(message).encode()
+        lock = self._peer_locks.setdefault(worker_id, asyncio.Lock())
+        async with lock:
+            writer = self._peers.get(worker_id)
+            if writer is None or writer.is_closing():
+                _, writer = await asyncio.open_unix_connection(self._socket_path(worker_id))
+                self._peers[worker_id] = writer
+            try:
+                writer.write(len(frame).to_bytes(4, "big") + frame)
+                await writer.drain()
+            except OSError:
+                self._peers.pop(worker_id, None)
+                raise
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Deliver frames forwarded by other workers until they disconnect."""
+        try:
+            while True:
+                size = int.from_bytes(await reader.readexactly(4), "big")
+                message = json.loads(await reader.readexactly(size))
+                if message["op"] == "command":
+                    try:
+                        await self.deliver_command(message["client_id"], message["command"])
+                    except ConnectionError as e:
+                        # The issuing worker's command times out; the peer link stays up
+                        print(f"Command {message['command'].get('id')} dropped: {e}")
+                elif message["op"] == "result":
+                    self.deliver_result(message["client_id"], message["command_id"], message["result"])
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
@@ -1,3 +1,66 @@
-from .workflow import create_workflow, run_graph
+"""The LangGraph agent.
 
-__all__ = ["create_workflow", "run_graph"]
+Only the lightweight parts are imported with the package. The agent modules pull in
+langchain, langgraph and langchain_openai, which take over a second to import, so
+they load on first use of one of their names, or ahead of time through `warm_up()`.
+"""
+
+import importlib
+import sys
+from typing import Any
+
+from .http_client import close_llm_http_client, get_llm_http_client
+from .llm_scheduler import LLM_SCHEDULER, LLM_SCHEDULER_STATS, LLMScheduler, set_llm_client
+from .workflow_cache import invalidate_workflows
+
+# Name -> submodule it is loaded from on first use
+_LAZY_EXPORTS = {
+    "LLM_CACHE_STATS": ".llm_cache",
+    "LLMResponseCache": ".llm_cache",
+    "get_llm_cache": ".llm_cache",
+    "ThreadAccessError": ".threads",
+    "ThreadStore": ".threads",
+    "get_thread_store": ".threads",
+    "create_workflow": ".workflow",
+    "final_answer": ".workflow",
+    "get_workflow": ".workflow",
+    "run_graph": ".workflow",
+    "set_chat_model_factory": ".workflow",
+    "stream_graph": ".workflow",
+}
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def warm_up() -> None:
+    """Import the agent modules and build the default chat model ahead of the first request."""
+    for module in sorted(set(_LAZY_EXPORTS.values())):
+        importlib.import_module(module, __name__)
+    sys.modules[f"{__name__}.workflow"].warm_up()
+
+__all__ = [
+    "LLM_CACHE_STATS",
+    "LLM_SCHEDULER",
+    "LLM_SCHEDULER_STATS",
+    "LLMResponseCache",
+    "LLMScheduler",
+    "ThreadAccessError",
+    "ThreadStore",
+    "close_llm_http_client",
+    "create_workflow",
+    "final_answer",
+    "get_llm_cache",
+    "get_llm_http_client",
+    "get_thread_store",
+    "get_workflow",
+    "invalidate_workflows",
+    "run_graph",
+    "set_chat_model_factory",
+    "set_llm_client",
+    "stream_graph",
+    "warm_up",
+]
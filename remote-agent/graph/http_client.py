@@ -0,0 +1,39 @@
+"""Keep-alive HTTP connection pool shared by every chat model the agents build, behind the LLM scheduler."""
+
+import os
+from typing import Optional
+
+import httpx
+
+from .llm_scheduler import RateLimitedTransport
+
+# Connections kept open to the LLM provider across all agent runs
+LLM_MAX_CONNECTIONS = int(os.environ.get("AGENT_LLM_MAX_CONNECTIONS", "64"))
+# Seconds an idle provider connection is kept for reuse
+LLM_KEEPALIVE_EXPIRY = 60.0
+
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+def get_llm_http_client() -> httpx.AsyncClient:
+    """The shared client, created on first use so one pool serves every model instance."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        # Requests wait for the shared rate limits before taking a connection
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _HTTP_CLIENT = httpx.AsyncClient(
+            transport=RateLimitedTransport(transport),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
+    return _HTTP_CLIENT
+
+async def close_llm_http_client() -> None:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
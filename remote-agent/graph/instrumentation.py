@@ -0,0 +1,50 @@
+import time
+from typing import Any, Dict, List
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from metrics import LLM_COMPLETION_TOKENS, LLM_LATENCY, LLM_PROMPT_TOKENS
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Records the latency and token usage of every chat model call."""
+
+    # Called on the event loop rather than in an executor; it only records numbers
+    run_inline = True
+
+    def __init__(self):
+        # run_id -> (start time, model name)
+        self._started: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or params.get("_type") or "unknown"
+        self._started[run_id] = (time.perf_counter(), str(model))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        started_at, model = started
+        LLM_LATENCY.observe(time.perf_counter() - started_at, model=model)
+
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+        if usage is None:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            usage = {"input_tokens": token_usage.get("prompt_tokens"), "output_tokens": token_usage.get("completion_tokens")}
+        if usage.get("input_tokens") is not None:
+            LLM_PROMPT_TOKENS.observe(usage["input_tokens"], model=model)
+        if usage.get("output_tokens") is not None:
+            LLM_COMPLETION_TOKENS.observe(usage["output_tokens"], model=model)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started.pop(run_id, None)
+
+LLM_METRICS_CALLBACK = LLMMetricsCallback()
@@ -0,0 +1,171 @@
+"""Opt-in cache of chat model responses, in memory with a SQLite tier behind it."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from metrics import REGISTRY
+
+# Set AGENT_LLM_CACHE=1 to answer repeated deterministic LLM calls from the cache
+LLM_CACHE_ENABLED = os.environ.get("AGENT_LLM_CACHE", "0") == "1"
+# Seconds a cached response stays valid
+LLM_CACHE_TTL = float(os.environ.get("AGENT_LLM_CACHE_TTL", "86400"))
+# Responses kept in memory before the least recently used is evicted
+MAX_MEMORY_ENTRIES = 1024
+
+LLM_CACHE_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "expired": 0}
+REGISTRY.stats_counter("agent_llm_cache_events_total", "LLM response cache events", LLM_CACHE_STATS)
+
+# Message fields that differ between otherwise identical runs
+_VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a serialized message list for use in a cache key.
+
+    Drops message IDs and provider metadata, and renumbers tool call IDs in the order
+    they appear, so a replayed task produces the same key on every step.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+
+    call_ids: Dict[str, str] = {}
+
+    def call_id(value: Any) -> Any:
+        return call_ids.setdefault(value, f"call_{len(call_ids)}") if isinstance(value, str) else value
+
+    for message in messages:
+        kwargs = message.get("kwargs") if isinstance(message, dict) else None
+        if not isinstance(kwargs, dict):
+            continue
+        for field in _VOLATILE_MESSAGE_FIELDS:
+            kwargs.pop(field, None)
+        for call in [
+            *kwargs.get("tool_calls", []),
+            *kwargs.get("invalid_tool_calls", []),
+            *kwargs.get("additional_kwargs", {}).get("tool_calls", []),
+        ]:
+            call["id"] = call_id(call.get("id"))
+        if "tool_call_id" in kwargs:
+            kwargs["tool_call_id"] = call_id(kwargs["tool_call_id"])
+    return json.dumps(messages, sort_keys=True)
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """Hash of the normalized messages and the model params, which include bound tool schemas."""
+    return hashlib.sha256(f"{normalize_prompt(prompt)}\x00{llm_string}".encode()).hexdigest()
+
+def _encode(generations: Sequence[Generation]) -> str:
+    # Message IDs are dropped so a reused response is not merged with an earlier copy
+    return json.dumps([
+        {
+            "message": messages_to_dict([generation.message.model_copy(update={"id": None})])[0],
+            "generation_info": generation.generation_info,
+        }
+        for generation in generations
+        if isinstance(generation, ChatGeneration)
+    ])
+
+def _decode(payload: str) -> List[ChatGeneration]:
+    entries = json.loads(payload)
+    messages = messages_from_dict([entry["message"] for entry in entries])
+    return [
+        ChatGeneration(message=message, generation_info=entry["generation_info"])
+        for message, entry in zip(messages, entries)
+    ]
+
+class LLMResponseCache(BaseCache):
+    """Chat model response cache with an in-memory LRU tier over a SQLite file.
+
+    Entries expire `ttl` seconds after they were stored. Set as a chat model's
+    `cache`, it is consulted before every provider call.
+    """
+
+    def __init__(self, path: str, ttl: float = LLM_CACHE_TTL, max_memory_entries: int = MAX_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        # key -> (stored_at, encoded generations), least recently used first
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=5, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, stored_at REAL, generations TEXT)"
+        )
+
+    def _remember(self, key: str, stored_at: float, payload: str) -> None:
+        self._memory[key] = (stored_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[List[ChatGeneration]]:
+        key = cache_key(prompt, llm_string)
+        entry = self._memory.get(key)
+        tier = "memory_hits"
+        if entry is None:
+            entry = self._db.execute(
+                "SELECT stored_at, generations FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            tier = "disk_hits"
+        if entry is None:
+            LLM_CACHE_STATS["misses"] += 1
+            return None
+
+        stored_at, payload = entry
+        if time.time() - stored_at > self.ttl:
+            self._memory.pop(key, None)
+            self._db.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+            LLM_CACHE_STATS["expired"] += 1
+            LLM_CACHE_STATS["misses"] += 1
+            return None
+
+        self._remember(key, stored_at, payload)
+        LLM_CACHE_STATS["hits"] += 1
+        LLM_CACHE_STATS[tier] += 1
+        return _decode(payload)
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = cache_key(prompt, llm_string)
+        stored_at, payload = time.time(), _encode(return_val)
+        self._remember(key, stored_at, payload)
+        self._db.execute(
+            "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?)", (key, stored_at, payload)
+        )
+
+    # Lookups are local and short, so they run on the event loop rather than in an executor
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[List[ChatGeneration]]:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self._memory.clear()
+        self._db.execute("DELETE FROM llm_responses")
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear()
+
+# Opened on first use so importing the graph package does not create the file
+_LLM_CACHE: Optional[LLMResponseCache] = None
+
+def get_llm_cache() -> LLMResponseCache:
+    global _LLM_CACHE
+    if _LLM_CACHE is None:
+        _LLM_CACHE = LLMResponseCache(os.environ.get("AGENT_LLM_CACHE_DB", "llm_cache.sqlite3"))
+    return _LLM_CACHE
+
+def cacheable(model_config: Dict[str, Any]) -> bool:
+    """Whether responses for a model config may be cached: only deterministic ones are."""
+    return LLM_CACHE_ENABLED and model_config.get("temperature") == 0
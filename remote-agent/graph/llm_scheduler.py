@@ -0,0 +1,201 @@
+"""Process-wide, rate-limit-aware queue in front of the LLM provider.
+
+Every chat model sends its requests through the shared HTTP client, whose transport
+waits here first. Requests take from token buckets for requests and tokens per
+minute and are served round-robin across clients, so a burst from one client
+neither trips the provider's limits nor starves the others. A 429 pauses every
+request until the provider's `retry-after`.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+
+from metrics import LLM_QUEUE_WAIT, REGISTRY
+
+# Requests and tokens per minute the provider allows this process; 0 means no limit
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("AGENT_LLM_RPM", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("AGENT_LLM_TPM", "0"))
+# Seconds' worth of the limits that may be sent at once; providers enforce a limit
+# over intervals shorter than a minute, so a full minute's burst would be refused
+LLM_BURST_SECONDS = float(os.environ.get("AGENT_LLM_BURST_SECONDS", "1"))
+# Pause after a 429 that does not say how long to wait
+DEFAULT_RETRY_AFTER = 1.0
+
+# Totals since startup
+LLM_SCHEDULER_STATS: Dict[str, float] = {"requests": 0, "queued": 0, "throttled": 0, "tokens_reserved": 0}
+REGISTRY.stats_counter("agent_llm_scheduler_total", "LLM provider requests through the shared scheduler", LLM_SCHEDULER_STATS)
+
+# Client whose agent run is sending LLM requests in the current context
+_LLM_CLIENT: ContextVar[str] = ContextVar("llm_client", default="")
+
+def set_llm_client(client_id: str) -> None:
+    """Queue the LLM requests of the current context (one agent run) as the client's."""
+    _LLM_CLIENT.set(client_id)
+
+def estimate_request_tokens(body: bytes) -> int:
+    """Tokens a chat completion request counts against the limit: its prompt (about
+    four bytes per token) plus the completion tokens it may use."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return len(body) // 4
+    max_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens") or 0
+    return len(body) // 4 + int(max_tokens)
+
+class TokenBucket:
+    """Refills `per_minute` units a minute, holding at most `burst` seconds' worth."""
+
+    def __init__(self, per_minute: float, burst: float = LLM_BURST_SECONDS):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst, 1.0)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken; more than the capacity needs a full bucket."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        # An oversized request leaves the bucket in debt, delaying the ones after it
+        self.level -= amount
+
+    def limit_to(self, remaining: float, now: float) -> None:
+        """Align with the provider's count, which also covers other processes sharing the key."""
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+class LLMScheduler:
+    """Admits LLM requests within the rate limits, round-robin across clients."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        burst: float = LLM_BURST_SECONDS
+    ):
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        # client_id -> its waiting requests (tokens, future) in arrival order; the
+        # client served next comes first
+        self._queues: "OrderedDict[str, Deque[Tuple[int, asyncio.Future]]]" = OrderedDict()
+        self._paused_until = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.configure(requests_per_minute, tokens_per_minute, burst)
+
+    def configure(self, requests_per_minute: float, tokens_per_minute: float, burst: float = LLM_BURST_SECONDS) -> None:
+        """Set the limits, starting from full buckets; 0 removes a limit."""
+        self.requests = TokenBucket(requests_per_minute, burst) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, burst) if tokens_per_minute > 0 else None
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _delay(self, tokens: int, now: float) -> float:
+        delay = self._paused_until - now
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return max(delay, 0.0)
+
+    def _admit(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        LLM_SCHEDULER_STATS["tokens_reserved"] += tokens
+
+    async def acquire(self, client_id: str, tokens: int) -> None:
+        """Wait until a request of `tokens` estimated tokens may be sent for the client."""
+        LLM_SCHEDULER_STATS["requests"] += 1
+        if not self._queues and self._delay(tokens, time.monotonic()) == 0:
+            self._admit(tokens)
+            LLM_QUEUE_WAIT.observe(0.0, client_id=client_id)
+            return
+
+        LLM_SCHEDULER_STATS["queued"] += 1
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(client_id, deque()).append((tokens, waiter))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await waiter
+        finally:
+            LLM_QUEUE_WAIT.observe(time.perf_counter() - started, client_id=client_id)
+
+    async def _dispatch(self) -> None:
+        while self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            tokens, waiter = queue[0]
+            if waiter.done():
+                # Cancelled while waiting
+                self._pop(client_id)
+                continue
+            delay = self._delay(tokens, time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self._pop(client_id)
+            self._admit(tokens)
+            waiter.set_result(None)
+
+    def _pop(self, client_id: str) -> None:
+        """Drop the client's first request; the client moves behind the others if it has more."""
+        queue = self._queues.pop(client_id)
+        queue.popleft()
+        if queue:
+            self._queues[client_id] = queue
+
+    def observe_response(self, response: httpx.Response) -> None:
+        """Adjust to the provider's rate-limit headers, pausing all requests on a 429."""
+        now = time.monotonic()
+        headers = response.headers
+        if response.status_code == 429:
+            LLM_SCHEDULER_STATS["throttled"] += 1
+            try:
+                retry_after = float(headers.get("retry-after", DEFAULT_RETRY_AFTER))
+            except ValueError:
+                retry_after = DEFAULT_RETRY_AFTER
+            self._paused_until = max(self._paused_until, now + retry_after)
+        for bucket, header in ((self.requests, "x-ratelimit-remaining-requests"), (self.tokens, "x-ratelimit-remaining-tokens")):
+            remaining = headers.get(header)
+            if bucket is not None and remaining is not None and remaining.isdigit():
+                bucket.limit_to(float(remaining), now)
+
+    def stats(self) -> Dict[str, float]:
+        """Requests waiting and seconds until sending resumes after a 429."""
+        return {"waiting": self.waiting, "paused_for": max(0.0, self._paused_until - time.monotonic())}
+
+LLM_SCHEDULER = LLMScheduler()
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Sends provider requests once LLM_SCHEDULER admits them, as the current context's client."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, scheduler: LLMScheduler = LLM_SCHEDULER):
+        self._transport = transport
+        self._scheduler = scheduler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            await self._scheduler.acquire(_LLM_CLIENT.get(), estimate_request_tokens(request.content))
+        response = await self._transport.handle_async_request(request)
+        self._scheduler.observe_response(response)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
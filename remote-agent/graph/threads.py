@@ -0,0 +1,180 @@
+"""Persistent conversation threads stored in a local SQLite file."""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+
+from tools.compaction import estimate_tokens
+
+# Estimated tokens of history replayed into a run before older turns are summarized
+THREAD_TOKEN_BUDGET = int(os.environ.get("AGENT_THREAD_TOKEN_BUDGET", "16000"))
+# Characters of each user request and answer kept in a summary of older turns
+SUMMARY_SNIPPET_CHARS = 200
+
+class ThreadAccessError(PermissionError):
+    """The thread exists but belongs to another client."""
+
+class ThreadStore:
+    """Conversation threads persisted as message deltas.
+
+    Each run appends only the messages it added. Once a thread's history exceeds the
+    token budget, its oldest turns are folded into a summary and later loads start
+    from that summary instead of replaying the whole thread. A thread belongs to the
+    client that started it; other clients get a ThreadAccessError.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=5, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS threads ("
+            "thread_id TEXT PRIMARY KEY, client_id TEXT, summary TEXT, summary_until INTEGER DEFAULT 0, "
+            "created_at REAL, updated_at REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS thread_messages ("
+            "thread_id TEXT, seq INTEGER, message TEXT, PRIMARY KEY (thread_id, seq))"
+        )
+        # thread_id -> its lock, and the runs holding or waiting for it
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def lock(self, thread_id: str) -> AsyncIterator[None]:
+        """Serialize runs on one thread, so their deltas do not interleave.
+
+        The lock is dropped once no run holds or waits for it, so idle threads do
+        not keep one.
+        """
+        lock = self._locks.setdefault(thread_id, asyncio.Lock())
+        self._lock_users[thread_id] = self._lock_users.get(thread_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[thread_id] -= 1
+            if not self._lock_users[thread_id]:
+                del self._lock_users[thread_id]
+                del self._locks[thread_id]
+
+    def _rows(self, thread_id: str, after_seq: int) -> List[tuple]:
+        return self._db.execute(
+            "SELECT seq, message FROM thread_messages WHERE thread_id = ? AND seq > ? ORDER BY seq",
+            (thread_id, after_seq),
+        ).fetchall()
+
+    def _thread(self, thread_id: str, client_id: str) -> Optional[tuple]:
+        """The thread's summary and where it ends, None for a new thread."""
+        thread = self._db.execute(
+            "SELECT client_id, summary, summary_until FROM threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        if thread is None:
+            return None
+        if thread[0] != client_id:
+            raise ThreadAccessError(f"Thread {thread_id} belongs to another client")
+        return thread[1:]
+
+    def load(self, thread_id: str, client_id: str) -> List[AnyMessage]:
+        """Return the messages a new run of the client on the thread starts from."""
+        thread = self._thread(thread_id, client_id)
+        if thread is None:
+            return []
+        summary, summary_until = thread
+        messages = messages_from_dict([json.loads(message) for _, message in self._rows(thread_id, summary_until)])
+        if summary:
+            messages.insert(0, SystemMessage(content=summary))
+        return messages
+
+    def append(self, thread_id: str, client_id: str, messages: List[AnyMessage]) -> None:
+        """Append the messages a run added to the thread."""
+        self._thread(thread_id, client_id)
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO threads (thread_id, client_id, created_at, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (thread_id, client_id, now, now),
+        )
+        last_seq = self._db.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM thread_messages WHERE thread_id = ?", (thread_id,)
+        ).fetchone()[0]
+        self._db.executemany(
+            "INSERT INTO thread_messages VALUES (?, ?, ?)",
+            [
+                (thread_id, last_seq + i, json.dumps(message))
+                for i, message in enumerate(messages_to_dict(messages), start=1)
+            ],
+        )
+
+    def trim(self, thread_id: str, client_id: str, budget: int = THREAD_TOKEN_BUDGET) -> List[AnyMessage]:
+        """Fold the oldest turns into the summary until the history fits the budget.
+
+        Turns are only cut where a user message starts, so tool calls always stay
+        with their results. Returns the history a new run starts from.
+        """
+        thread = self._thread(thread_id, client_id)
+        if thread is None:
+            return []
+        summary, summary_until = thread
+        rows = self._rows(thread_id, summary_until)
+        messages = messages_from_dict([json.loads(message) for _, message in rows])
+        sizes = [estimate_tokens(str(message.content)) for message in messages]
+        total = sum(sizes) + estimate_tokens(summary or "")
+        if total <= budget:
+            return self.load(thread_id, client_id)
+
+        # Drop whole turns from the front, keeping at least the latest turn
+        turn_starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        cut = 0
+        for start in turn_starts[1:]:
+            cut = start
+            if total - sum(sizes[:cut]) <= budget:
+                break
+        if cut == 0:
+            return self.load(thread_id, client_id)
+
+        folded = summarize_messages(messages[:cut])
+        summary = f"{summary}\n{folded}" if summary else f"Summary of earlier turns in this conversation:\n{folded}"
+        self._db.execute(
+            "UPDATE threads SET summary = ?, summary_until = ? WHERE thread_id = ?",
+            (summary, rows[cut - 1][0], thread_id),
+        )
+        return self.load(thread_id, client_id)
+
+def summarize_messages(messages: List[AnyMessage]) -> str:
+    """Summarize turns structurally: each request, the tools it called, and the answer."""
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"- User asked: {str(message.content)[:SUMMARY_SNIPPET_CHARS]}")
+        elif isinstance(message, AIMessage) and message.tool_calls:
+            calls = ", ".join(f"{call['name']}({json.dumps(call['args'])})" for call in message.tool_calls)
+            lines.append(f"  - Called: {calls}")
+        elif isinstance(message, AIMessage) and message.content:
+            lines.append(f"  - Answered: {str(message.content)[:SUMMARY_SNIPPET_CHARS]}")
+        elif isinstance(message, ToolMessage) and message.status == "error":
+            lines.append(f"  - {message.name} failed")
+    return "\n".join(lines)
+
+# Opened on first use so importing the graph package does not create the file
+_THREAD_STORE: Optional[ThreadStore] = None
+
+def get_thread_store() -> ThreadStore:
+    global _THREAD_STORE
+    if _THREAD_STORE is None:
+        _THREAD_STORE = ThreadStore(os.environ.get("AGENT_THREADS_DB", "agent_threads.sqlite3"))
+    return _THREAD_STORE
@@ -1,20 +1,105 @@
-from typing import Any, Dict, List, Tuple, TypedDict, Annotated, Literal, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Set, Tuple, TypedDict, Annotated, Literal, Optional
+from collections import OrderedDict
+import hashlib
+import json
 import operator
+import time
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
 from langchain.tools import BaseTool
 from langgraph.prebuilt import create_react_agent
+from metrics import WORKFLOW_BUILD, debug_log
+from tools.compaction import compact_prompt, start_compaction_report
+from tools.selection import PINNED_TOOLS, TOOL_TOP_K, ToolIndex, tool_index
+from .http_client import get_llm_http_client
+from .instrumentation import LLM_METRICS_CALLBACK
+from .llm_scheduler import set_llm_client
+from .llm_cache import cacheable, get_llm_cache
+from .threads import get_thread_store
+from .workflow_cache import MAX_CACHED_WORKFLOWS, WORKFLOW_CACHE_STATS, _WORKFLOW_CACHE, invalidate_workflows
 
 
+# Model settings used when a workflow is built without an explicit config
+DEFAULT_MODEL_CONFIG: Dict[str, Any] = {"model": "gpt-4o", "temperature": 0}
+def default_chat_model(config: Dict[str, Any]) -> BaseChatModel:
+    """OpenAI chat model sending its requests over the shared keep-alive connection pool."""
+    return ChatOpenAI(**config, http_async_client=get_llm_http_client())
+
+# Builds the chat model for a model config; replaceable so benchmarks can run offline
+_chat_model_factory: Callable[[Dict[str, Any]], BaseChatModel] = default_chat_model
+
+def set_chat_model_factory(factory: Callable[[Dict[str, Any]], BaseChatModel]) -> None:
+    """Replace how agents build their chat model and drop workflows built with the old one."""
+    global _chat_model_factory
+    _chat_model_factory = factory
+    _WORKFLOW_CACHE.clear()
+
+def step_query(messages: List[AnyMessage]) -> str:
+    """What an agent step is about: the latest request and the model's latest reply."""
+    request = next((message for message in reversed(messages) if isinstance(message, HumanMessage)), None)
+    reply = next((message for message in reversed(messages) if isinstance(message, AIMessage)), None)
+    return " ".join(str(message.content) for message in (request, reply) if message is not None)
+
+def called_tools(messages: List[AnyMessage]) -> Set[str]:
+    """Names of the tools the conversation has called so far."""
+    return {call["name"] for message in messages if isinstance(message, AIMessage) for call in message.tool_calls}
+
+class RelevantToolsModel(Runnable):
+    """Chat model for create_react_agent that binds only the tools relevant to each step.
+
+    create_react_agent hands it the full tool list through `bind_tools`; each call
+    then binds the pinned tools, the tools the conversation already called and the
+    `top_k` best matches in the tool index for the step. Models bound to a subset
+    are reused for the next step that selects the same one.
+    """
+
+    # Number of bound models kept per agent
+    MAX_BOUND_MODELS = 32
+
+    def __init__(self, model: BaseChatModel, index: ToolIndex, top_k: int = TOOL_TOP_K):
+        self.model = model
+        self.index = index
+        self.top_k = top_k
+        self._tools: Dict[str, BaseTool] = {}
+        self._bind_kwargs: Dict[str, Any] = {}
+        self._bound: "OrderedDict[Tuple[str, ...], Runnable]" = OrderedDict()
+
+    def bind_tools(self, tools: List[BaseTool], **kwargs: Any) -> "RelevantToolsModel":
+        self._tools = {tool.name: tool for tool in tools}
+        self._bind_kwargs = kwargs
+        self._bound.clear()
+        return self
+
+    def model_for(self, messages: List[AnyMessage]) -> Runnable:
+        """The model bound to the tools selected for a step's messages."""
+        names = tuple(self.index.select(step_query(messages), PINNED_TOOLS | called_tools(messages), self.top_k))
+        bound = self._bound.get(names)
+        if bound is None:
+            bound = self.model.bind_tools([self._tools[name] for name in names if name in self._tools], **self._bind_kwargs)
+            self._bound[names] = bound
+            while len(self._bound) > self.MAX_BOUND_MODELS:
+                self._bound.popitem(last=False)
+        self._bound.move_to_end(names)
+        return bound
+
+    def invoke(self, input: List[AnyMessage], config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.model_for(input).invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: List[AnyMessage], config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self.model_for(input).ainvoke(input, config, **kwargs)
+
 class AgentState(TypedDict):
     """The state of the agent."""
     messages: List[Dict[str, Any]]  # The messages in the conversation
     tools: List[BaseTool]  # The tools available to the agent
     next: Optional[str]  # The next node to route to
 
-def create_agent(tools: List[BaseTool], model: str = "gpt-4o") -> Any:
+def create_agent(tools: List[BaseTool], model_config: Optional[Dict[str, Any]] = None) -> Any:
     """Create an agent that can use tools."""
 #     prompt = ChatPromptTemplate.from_messages([
 #         ("system", """You are an agent that can help with browser automation and other tasks.
@@ -26,9 +111,17 @@ def create_agent(tools: List[BaseTool], model: str = "gpt-4o") -> Any:
 #         ("placeholder", "{messages}"),
 #     ])
     
-    model = ChatOpenAI(model=model, temperature=0)
+    model_config = model_config or DEFAULT_MODEL_CONFIG
+    model = _chat_model_factory(model_config)
+    # Deterministic steps repeated across runs are answered from the response cache
+    if cacheable(model_config):
+        model.cache = get_llm_cache()
+    model.callbacks = [*(model.callbacks or []), LLM_METRICS_CALLBACK]
 
-    agent = create_react_agent(model, tools)
+    # Superseded page snapshots are dropped from what the model sees on each step, and
+    # only the tools relevant to it are bound; the tool node can still run any of them
+    agent_model = RelevantToolsModel(model, tool_index(tools), TOOL_TOP_K) if TOOL_TOP_K > 0 else model
+    agent = create_react_agent(agent_model, tools, prompt=compact_prompt)
     return agent
 
 def extract_messages(state: AgentState) -> Dict[str, Any]:
@@ -43,35 +136,41 @@ def extract_tools(state: AgentState) -> Dict[str, Any]:
     return {"tool_descriptions": tool_descriptions}
 
 # 라우팅 함수 정의
-def route_to_next(state: AgentState) -> Literal["tool_executor", "__end__"]:
-    """결정하기 - 툴 실행기로 이동할지 종료할지."""
+def route_to_next(state: AgentState, tools_by_name: Dict[str, BaseTool]) -> Literal["tool_executor", "__end__"]:
+    """결정하기 - 툴 실행기로 이동할지 종료할지.
+
+    Only structured tool calls of known tools go to the tool executor; a tool name
+    merely mentioned in the answer text does not.
+    """
     if state.get("next"):
         return state["next"]
     
     last_message = state["messages"][-1]
-    # AIMessage 객체의 속성에 올바르게 접근
-    if hasattr(last_message, "content"):
-        for tool in state["tools"]:
-            if tool.name in last_message.content:
-                return "tool_executor"
+    tool_calls = getattr(last_message, "tool_calls", None)
+    if tool_calls and all(call["name"] in tools_by_name for call in tool_calls):
+        return "tool_executor"
     return "__end__"
 
-def create_workflow(tools: List[BaseTool]) -> StateGraph:
+def create_workflow(tools: List[BaseTool], model_config: Optional[Dict[str, Any]] = None) -> StateGraph:
     """Create a workflow for the agent."""
     # Define a new graph
     builder = StateGraph(AgentState)
     
     # Create an agent that can use tools
-    agent = create_agent(tools)
+    agent = create_agent(tools, model_config)
     
     # Tool execution node
     tool_node = ToolNode(tools)
     
+    async def call_agent(state: AgentState) -> Dict[str, Any]:
+        """Run the ReAct agent without blocking the server's event loop."""
+        return await agent.ainvoke({
+            **extract_messages(state),
+            **extract_tools(state)
+        })
+    
     # Add nodes
-    builder.add_node("agent", lambda state: agent.invoke({
-        **extract_messages(state),
-        **extract_tools(state)
-    }))
+    builder.add_node("agent", call_agent)
     builder.add_node("tool_executor", tool_node)
     
     # Set the entry point
@@ -80,7 +179,8 @@ def create_workflow(tools: List[BaseTool]) -> StateGraph:
     # Agent -> Tools edge (라우팅 로직 외부로 분리)
     builder.add_conditional_edges(
         "agent",
-        route_to_next,
+        lambda state: route_to_next(state, tool_node.tools_by_name),
+        ["tool_executor", END],
     )
     
     # Tools -> Agent edge
@@ -91,24 +191,180 @@ def create_workflow(tools: List[BaseTool]) -> StateGraph:
     
     return graph
 
-async def run_graph(client_id: str, user_input: str, tools: List[BaseTool]) -> Dict[str, Any]:
-    """Run the workflow with the given input."""
-    # Initialize the state
+def tool_set_fingerprint(tools: List[BaseTool], model_config: Optional[Dict[str, Any]] = None) -> str:
+    """Stable hash of the tool definitions and model config a workflow is built from."""
+    payload = {
+        "model": model_config or DEFAULT_MODEL_CONFIG,
+        "tools": sorted(
+            ({"name": tool.name, "description": tool.description, "args": tool.args} for tool in tools),
+            key=lambda tool: tool["name"],
+        ),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def get_workflow(
+    client_id: str,
+    tools: List[BaseTool],
+    model_config: Optional[Dict[str, Any]] = None
+) -> Tuple[Any, bool]:
+    """Return a compiled workflow for the client's tool set, building it on a cache miss.
+
+    Workflows are keyed by client as well as fingerprint because the tools are bound
+    to that client's command router. Returns the workflow and whether it was cached.
+    """
+    key = (client_id, tool_set_fingerprint(tools, model_config))
+    graph = _WORKFLOW_CACHE.get(key)
+    if graph is not None:
+        _WORKFLOW_CACHE.move_to_end(key)
+        return graph, True
+    
+    graph = create_workflow(tools, model_config)
+    _WORKFLOW_CACHE[key] = graph
+    while len(_WORKFLOW_CACHE) > MAX_CACHED_WORKFLOWS:
+        _WORKFLOW_CACHE.popitem(last=False)
+    return graph, False
+
+def warm_up() -> None:
+    """Build the default chat model once, so the first request does not set up the OpenAI client."""
+    try:
+        default_chat_model(DEFAULT_MODEL_CONFIG)
+    except Exception as e:
+        # e.g. no API key in the environment; the first request reports it
+        print(f"Could not pre-build the chat model: {e}")
+
+def prepare_run(
+    client_id: str,
+    user_input: str,
+    tools: List[BaseTool],
+    history: Optional[List[AnyMessage]] = None
+) -> Tuple[Any, AgentState]:
+    """Fetch the client's compiled workflow and build the initial state for one request."""
+    # The run's LLM requests queue for the rate limits as this client's
+    set_llm_client(client_id)
+    # Initialize the state, continuing from a thread's history when there is one
     state = AgentState(
-        messages=[{"role": "user", "content": user_input}],
+        messages=[*(history or []), HumanMessage(content=user_input)],
         tools=tools,
         next=None
     )
     
-    # Create and run the workflow
-    graph = create_workflow(tools)
+    # Reuse the compiled workflow unless the tool set or model config changed
+    started = time.perf_counter()
+    graph, cached = get_workflow(client_id, tools)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    WORKFLOW_CACHE_STATS["hits" if cached else "misses"] += 1
+    WORKFLOW_CACHE_STATS["warm_ms" if cached else "cold_ms"] += elapsed_ms
+    WORKFLOW_BUILD.observe(elapsed_ms / 1000, cache="warm" if cached else "cold")
+    debug_log("Workflow for client %s: %s in %.2f ms", client_id, "warm" if cached else "cold", elapsed_ms)
+    return graph, state
+
+def final_answer(result: Dict[str, Any]) -> Optional[str]:
+    """Return the content of the last message of a finished run."""
+    messages = result.get("messages") or []
+    if not messages:
+        return None
+    last_message = messages[-1]
+    if isinstance(last_message, dict):
+        return last_message.get("content")
+    return getattr(last_message, "content", None)
+
+async def run_graph(
+    client_id: str,
+    user_input: str,
+    tools: List[BaseTool],
+    thread_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Run the workflow with the given input.
+
+    With a `thread_id` the run continues that conversation: it starts from the
+    thread's stored history and appends the messages it adds.
+    """
+    if thread_id is None:
+        return await _run_graph(client_id, user_input, tools, [])
+    
+    store = get_thread_store()
+    async with store.lock(thread_id):
+        history = store.trim(thread_id, client_id)
+        result = await _run_graph(client_id, user_input, tools, history)
+        store.append(thread_id, client_id, result["messages"][len(history):])
+        return result
+
+async def _run_graph(
+    client_id: str,
+    user_input: str,
+    tools: List[BaseTool],
+    history: List[AnyMessage]
+) -> Dict[str, Any]:
+    graph, state = prepare_run(client_id, user_input, tools, history)
+    report = start_compaction_report()
     
     # langgraph 버전 호환성을 위해 여러 실행 메서드 시도
     try:
         # 최신 langgraph API 사용
         result = await graph.ainvoke(state)
+        debug_log(
+            "Compaction for client %s: ~%d prompt tokens saved over %d LLM calls",
+            client_id, report["prompt_tokens_saved"], report["llm_calls"],
+        )
         return result
     except Exception as e:
         print(f"Error running graph: {e}")
         raise
 
+# Characters of a tool result included in a streamed tool_end event
+TOOL_SUMMARY_CHARS = 200
+
+async def stream_graph(
+    client_id: str,
+    user_input: str,
+    tools: List[BaseTool],
+    thread_id: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run the workflow and yield progress events as they happen.
+
+    Yields `token` events for model output, `tool_start`/`tool_end` events around
+    each tool call, and a closing `final` event with the answer and the prompt
+    tokens saved by tool-output compaction. `thread_id` works as in `run_graph`.
+    """
+    if thread_id is None:
+        async for event in _stream_graph(client_id, user_input, tools, [], None):
+            yield event
+        return
+    
+    store = get_thread_store()
+    async with store.lock(thread_id):
+        history = store.trim(thread_id, client_id)
+        async for event in _stream_graph(client_id, user_input, tools, history, thread_id):
+            yield event
+
+async def _stream_graph(
+    client_id: str,
+    user_input: str,
+    tools: List[BaseTool],
+    history: List[AnyMessage],
+    thread_id: Optional[str]
+) -> AsyncIterator[Dict[str, Any]]:
+    graph, state = prepare_run(client_id, user_input, tools, history)
+    report = start_compaction_report()
+    
+    answer = None
+    async for event in graph.astream_events(state, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if content:
+                yield {"type": "token", "content": content}
+        elif kind == "on_tool_start":
+            yield {"type": "tool_start", "tool": event["name"], "input": event["data"].get("input")}
+        elif kind == "on_tool_end":
+            output = event["data"].get("output")
+            summary = str(getattr(output, "content", output))
+            yield {"type": "tool_end", "tool": event["name"], "summary": summary[:TOOL_SUMMARY_CHARS]}
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            # The root run's output is the final graph state
+            output = event["data"].get("output") or {}
+            answer = final_answer(output)
+            if thread_id is not None:
+                get_thread_store().append(thread_id, client_id, output["messages"][len(history):])
+    
+    yield {"type": "final", "answer": answer, "prompt_tokens_saved": report["prompt_tokens_saved"]}
@@ -0,0 +1,26 @@
+"""Compiled workflows by client and tool set.
+
+Kept apart from the agent modules so tool registration and session teardown can drop
+a client's workflows without importing them, even while the prewarm thread is still
+loading them.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from metrics import REGISTRY
+
+# Maximum number of compiled workflows kept before the least recently used is evicted
+MAX_CACHED_WORKFLOWS = 32
+
+# (client_id, fingerprint) -> compiled workflow, least recently used first
+_WORKFLOW_CACHE: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+WORKFLOW_CACHE_STATS: Dict[str, float] = {"hits": 0, "misses": 0, "cold_ms": 0.0, "warm_ms": 0.0}
+REGISTRY.stats_counter("agent_workflow_cache_total", "Compiled workflow cache totals", WORKFLOW_CACHE_STATS)
+
+def invalidate_workflows(client_id: str) -> int:
+    """Drop every cached workflow for a client, e.g. after its tool set changed."""
+    stale = [key for key in _WORKFLOW_CACHE if key[0] == client_id]
+    for key in stale:
+        del _WORKFLOW_CACHE[key]
+    return len(stale)
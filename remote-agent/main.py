@@ -1,136 +1,934 @@
-from fastapi import FastAPI, Request, BackgroundTasks
-from sse_starlette.sse import EventSourceResponse
-from fastapi.responses import JSONResponse
-from typing import Dict, Set, Optional, Any, List
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from sse_starlette.sse import EventSourceResponse, ServerSentEvent
+from fastapi.responses import JSONResponse, Response
+from typing import TYPE_CHECKING, Dict, Set, Optional, Any, List, Tuple
 import asyncio
+from collections import OrderedDict
 import json
+import math
+import os
+import time
 import uuid
 import uvicorn
-from tools import MCPClient, create_mcp_tools
-from graph import run_graph
+from broker import create_broker
+from transport import SESSION_STATS, InvalidPayload, PayloadTooLarge, ReplayBuffer, UnsupportedEncoding, read_result_payload
+from tools import (
+    BLOB_STORE,
+    TOOL_CATALOG,
+    TOOL_LATENCIES,
+    MCPClient,
+    SessionPool,
+    create_mcp_tools,
+    tool_index,
+    tool_hash,
+    tool_set_hash,
+    warm_up as warm_up_tools,
+)
+# The agent modules load lazily (see STARTUP_MODE), so they are used through the package
+import graph
+from graph import LLM_SCHEDULER, close_llm_http_client, invalidate_workflows
+from metrics import (
+    CLIENT_METRICS,
+    JOB_QUEUE_DEPTH,
+    JOBS_RUNNING,
+    LLM_QUEUE_DEPTH,
+    PENDING_COMMANDS,
+    REGISTRY,
+    SESSION_POOL_BUSY,
+    SESSION_POOL_SIZE,
+    SSE_ENQUEUE_TO_WRITE,
+    SSE_QUEUE_DEPTH,
+    TOOL_TIMEOUT,
+    debug_log,
+)
+from scheduler import DEFAULT_PRIORITY, FINISHED_STATUSES, PRIORITIES, JobScheduler
 
-app = FastAPI()
+if TYPE_CHECKING:
+    from langchain.tools import BaseTool
 
-# Store connected clients and their MCPClient instances
-CLIENTS: Dict[str, Set[asyncio.Queue]] = {}
+# Routes commands and results between worker processes; "unix" allows `--workers N`
+BROKER = create_broker(os.environ.get("MCP_BROKER", "inprocess"))
+
+# How the agent stack (langchain, langgraph, the OpenAI client) is loaded: "eager" with
+# this module, "prewarm" in a background thread while the server starts accepting
+# connections, or "lazy" on the first tool registration or agent request
+STARTUP_MODE = os.environ.get("AGENT_STARTUP", "prewarm")
+_AGENT_STACK_READY = False
+_AGENT_STACK: Optional[asyncio.Task] = None
+
+def warm_up_agent_stack() -> None:
+    """Import the agent and tool modules and build the LLM client and its connection pool."""
+    global _AGENT_STACK_READY
+    started = time.perf_counter()
+    warm_up_tools()
+    graph.warm_up()
+    _AGENT_STACK_READY = True
+    print(f"Agent stack loaded in {time.perf_counter() - started:.2f}s ({STARTUP_MODE})")
+
+async def agent_stack_ready() -> None:
+    """Wait until the agent stack is loaded, loading it off the event loop if that has not started."""
+    global _AGENT_STACK
+    if _AGENT_STACK_READY:
+        return
+    if _AGENT_STACK is None:
+        _AGENT_STACK = asyncio.create_task(asyncio.to_thread(warm_up_agent_stack))
+    # A cancelled request must not cancel the load other requests are waiting for
+    await asyncio.shield(_AGENT_STACK)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await BROKER.start(deliver_command_locally, deliver_result_locally)
+    await SCHEDULER.start()
+    if STARTUP_MODE == "prewarm":
+        # Started here, the load runs while uvicorn binds its socket and serves
+        asyncio.create_task(agent_stack_ready())
+    yield
+    for teardown in SESSION_TEARDOWNS.values():
+        teardown.cancel()
+    await SCHEDULER.stop()
+    await BROKER.stop()
+    await close_llm_http_client()
+
+app = FastAPI(lifespan=lifespan)
+
+# A queued command: when it was first enqueued, its event ID and the command itself
+QueuedCommand = Tuple[float, Optional[int], Optional[dict]]
+
+class ClientConnection:
+    """One SSE stream or WebSocket of a client and the bounded queue of commands waiting to be written to it."""
+    
+    def __init__(self, transport: str = "sse"):
+        self.transport = transport
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_COMMANDS)
+        # Since when the stream has left the commands now queued unwritten
+        self.queued_since = time.monotonic()
+    
+    def put(self, command: Optional[dict], enqueued_at: Optional[float] = None, event_id: Optional[int] = None) -> None:
+        """Queue a command with its event ID and when it was first enqueued, for enqueue-to-write timing."""
+        if self.queue.empty():
+            self.queued_since = time.monotonic()
+        self.queue.put_nowait((enqueued_at or time.perf_counter(), event_id, command))
+    
+    def stalled(self) -> bool:
+        """Whether the stream has stopped draining its queue, e.g. behind a dead TCP connection."""
+        if self.queue.full():
+            return True
+        return not self.queue.empty() and time.monotonic() - self.queued_since > SSE_STALL_TIMEOUT
+
+# Store connected clients (their SSE streams and WebSockets, oldest first) and their MCPClient instances
+CLIENTS: Dict[str, List[ClientConnection]] = {}
 MCP_CLIENTS: Dict[str, MCPClient] = {}
 # Store tool definitions for each client
 CLIENT_TOOLS: Dict[str, List[Dict[str, Any]]] = {}
+# Commands recently sent to each client, replayed when it reconnects with Last-Event-ID
+REPLAY_BUFFERS: Dict[str, ReplayBuffer] = {}
+# Pending teardowns of clients whose last stream closed, by client ID
+SESSION_TEARDOWNS: Dict[str, asyncio.Task] = {}
+# LangChain tools built from each client's registered definitions, reused across requests
+CLIENT_TOOL_OBJECTS: Dict[str, List["BaseTool"]] = {}
+# Browser sessions of clients that run several, leased to one agent run at a time
+SESSION_POOLS: Dict[str, SessionPool] = {}
+# Agent jobs by ID, oldest first, so results can be fetched after the request returns
+AGENT_JOBS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+MAX_AGENT_JOBS = 1000
+# Tools and stream event queues of jobs that have not started yet, by job ID
+AGENT_JOB_TOOLS: Dict[str, List["BaseTool"]] = {}
+AGENT_JOB_EVENTS: Dict[str, asyncio.Queue] = {}
+# Agent runs executed at once across all clients
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", "16"))
+# Agent runs executed at once per client; further requests wait for a slot
+MAX_AGENT_RUNS_PER_CLIENT = int(os.environ.get("MCP_MAX_AGENT_RUNS_PER_CLIENT", "4"))
+# Requests allowed to wait for a slot per client; beyond that /agent answers 429
+MAX_WAITING_AGENT_RUNS = int(os.environ.get("MCP_MAX_WAITING_AGENT_RUNS", "16"))
+
+# Seconds of idleness after which a heartbeat is written to the SSE stream
+HEARTBEAT_INTERVAL = 15.0
+# Upper bound on queued commands coalesced into a single SSE write
+MAX_COMMANDS_PER_FLUSH = 32
+# Commands queued per SSE stream; a stream with a full queue is evicted
+MAX_QUEUED_COMMANDS = 256
+# Seconds a stream may leave queued commands unwritten before it is evicted
+SSE_STALL_TIMEOUT = 10.0
+# Seconds a client's tools, commands and replay buffer are kept after its last stream
+# closes, so a client that reconnects in time resumes where it left off
+SESSION_GRACE_PERIOD = float(os.environ.get("MCP_SESSION_GRACE_PERIOD", "30"))
+# Seconds between checks whether an ended session's tool calls have unwound
+ROUTER_DRAIN_INTERVAL = 0.1
+# Commands remembered per client for replay; no more than fit in one stream's queue
+MAX_REPLAY_EVENTS = MAX_QUEUED_COMMANDS
+# Window (seconds) for batching concurrent tool calls into one envelope for clients that
+# support it; unset disables batching
+COMMAND_BATCH_WINDOW = float(os.environ["MCP_BATCH_WINDOW_MS"]) / 1000 if os.environ.get("MCP_BATCH_WINDOW_MS") else None
+
+def command_event(command: dict) -> str:
+    """Event name a command is sent under: batch envelopes and cancel notices have their own."""
+    return command["type"] if command.get("type") in ("batch", "cancel") else "command"
+
+def encode_command_events(commands: List[Tuple[Optional[int], dict]]) -> bytes:
+    """Encode queued `(event ID, command)` pairs as consecutive SSE events in one chunk.
+
+    Batch envelopes are sent as `batch` events, cancel notices as `cancel` events and
+    everything else as `command` events.
+    """
+    return b"".join(
+        ServerSentEvent(
+            data=json.dumps(command),
+            event=command_event(command),
+            id=str(event_id) if event_id is not None else None
+        ).encode()
+        for event_id, command in commands
+    )
+
+def get_mcp_client(client_id: str) -> MCPClient:
+    """Return the client's shared command router, creating it on first use."""
+    if client_id not in MCP_CLIENTS:
+        MCP_CLIENTS[client_id] = MCPClient(
+            client_id=client_id,
+            send_command_func=send_command_to_client,
+            command_id_prefix=BROKER.command_id_prefix
+        )
+    return MCP_CLIENTS[client_id]
+
+async def build_client_tools(client_id: str) -> List["BaseTool"]:
+    """Build the client's tools from its registered definitions and store them for reuse."""
+    await agent_stack_ready()
+    # Tools are bound to the client's shared router so posted results reach them
+    tools = await create_mcp_tools(
+        client_id=client_id,
+        send_command_func=send_command_to_client,
+        tool_definitions=CLIENT_TOOLS.get(client_id, []),
+        mcp_client=get_mcp_client(client_id)
+    )
+    # Index the tools for per-step selection now rather than on the first agent request
+    tool_index(tools)
+    CLIENT_TOOL_OBJECTS[client_id] = tools
+    return tools
+
+async def store_client_tools(client_id: str, tools: List[Dict[str, Any]]) -> None:
+    """Store new tool definitions for a client and build their tools; workflows for an old tool set are stale."""
+    invalidate_workflows(client_id)
+    CLIENT_TOOLS[client_id] = tools
+    await build_client_tools(client_id)
 
 async def send_command_to_client(client_id: str, command: dict):
-    if client_id in CLIENTS:
-        for queue in CLIENTS[client_id]:
-            await queue.put(command)
+    """Send a command to the client through whichever worker holds its SSE stream."""
+    await BROKER.send_command(client_id, command)
 
-@app.get("/connect/{client_id}")
-async def connect_client(client_id: str):
+async def deliver_command_locally(client_id: str, command: dict):
+    """Queue a command on one of the streams (SSE or WebSocket) this process holds for the client.
+
+    The newest stream gets it. Stalled streams are evicted on the way and the commands
+    still queued on them move to the next live stream, oldest first. With no live
+    stream left, commands wait in the client's replay buffer until it reconnects or
+    its session ends.
+    """
+    buffer = REPLAY_BUFFERS.get(client_id)
+    commands: List[QueuedCommand] = [(time.perf_counter(), buffer.record(command) if buffer is not None else None, command)]
+    for connection in reversed(CLIENTS.get(client_id, [])):
+        if connection.stalled():
+            commands = evict_connection(client_id, connection) + commands
+            continue
+        while commands and not connection.queue.full():
+            enqueued_at, event_id, queued = commands.pop(0)
+            connection.put(queued, enqueued_at, event_id)
+        if not commands:
+            return
+    
+    if buffer is not None:
+        # Replayed when the client reconnects; the session's end fails them otherwise
+        end_session_later(client_id)
+        return
+    
+    error = ConnectionError(f"No live stream for client {client_id}")
+    # Commands moved off an evicted stream have no stream left to go to
+    for _, _, dropped in commands:
+        if dropped is not command:
+            fail_command_locally(client_id, dropped, error)
+    raise error
+
+def evict_connection(client_id: str, connection: ClientConnection) -> List[QueuedCommand]:
+    """Detach a stalled stream, returning its queued commands; the stream closes once it wakes."""
+    CLIENTS[client_id].remove(connection)
+    commands = []
+    while not connection.queue.empty():
+        commands.append(connection.queue.get_nowait())
+    connection.put(None)
+    print(f"Evicted stalled stream of client {client_id} with {len(commands)} queued commands")
+    return commands
+
+def fail_command_locally(client_id: str, command: dict, error: Exception) -> None:
+    """Fail the waiting tool calls of a command (or batch envelope) that cannot be delivered."""
+    if client_id in MCP_CLIENTS:
+        for queued in command.get("commands", [command]):
+            MCP_CLIENTS[client_id].fail_command(queued["id"], error)
+
+def deliver_result_locally(client_id: str, command_id: str, result: Any) -> str:
+    """Resolve a result against this process's router for the client."""
+    if client_id not in MCP_CLIENTS:
+        return "unknown"
+    return MCP_CLIENTS[client_id].receive_result(command_id, result)
+
+def awaiting_delivery(client_id: str, command: dict) -> bool:
+    """Whether a buffered command is worth replaying: a cancel notice, or a command a run still waits for."""
+    if command.get("type") == "cancel":
+        return True
+    router = MCP_CLIENTS.get(client_id)
+    return any(
+        # Commands issued by other workers are not tracked here and are always replayed
+        not queued["id"].startswith(BROKER.command_id_prefix)
+        or (router is not None and queued["id"] in router.pending_results)
+        for queued in command.get("commands", [command])
+    )
+
+async def attach_connection(client_id: str, transport: str, last_event_id: Optional[int] = None) -> ClientConnection:
+    """Add a new stream for a client, attaching the client on its first one.
+
+    A client reconnecting within its grace period keeps its tools and session. The
+    commands sent after the last event ID it saw (all of them, if it saw none) that
+    are still awaited are replayed onto the new stream first, unless another stream
+    of the client is still open and carrying them.
+    """
+    teardown = SESSION_TEARDOWNS.pop(client_id, None)
+    if teardown is not None:
+        teardown.cancel()
+        SESSION_STATS["resumed"] += 1
     if client_id not in CLIENTS:
-        CLIENTS[client_id] = set()
-        # Create MCPClient instance for this client
-        MCP_CLIENTS[client_id] = MCPClient(client_id=client_id, send_command_func=send_command_to_client)
+        CLIENTS[client_id] = []
+        # Create (or reuse) the command router for this client
+        get_mcp_client(client_id)
+    if not CLIENTS[client_id]:
+        # First live stream of the client in this process, or the first since it dropped
+        await BROKER.attach_client(client_id)
+    buffer = REPLAY_BUFFERS.setdefault(client_id, ReplayBuffer(MAX_REPLAY_EVENTS))
+    
+    connection = ClientConnection(transport)
+    replayed = 0
+    if not CLIENTS[client_id]:
+        for event_id, command in buffer.since(last_event_id or 0):
+            if awaiting_delivery(client_id, command):
+                connection.put(command, event_id=event_id)
+                replayed += 1
+        SESSION_STATS["replayed_commands"] += replayed
+    CLIENTS[client_id].append(connection)
+    resumed = f", resumed with {replayed} commands replayed" if teardown is not None else ""
+    print(f"Client {client_id} connected ({transport}{resumed})")
+    return connection
+
+async def detach_connection(client_id: str, connection: ClientConnection) -> None:
+    """Remove a closed stream; once the client's last one is gone, its session ends after the grace period."""
+    connections = CLIENTS.get(client_id)
+    if connections is not None and connection in connections:
+        connections.remove(connection)
+    if connections is not None and not connections:
+        await BROKER.suspend_client(client_id)
+        if CLIENTS.get(client_id):
+            # The client reconnected meanwhile
+            await BROKER.attach_client(client_id)
+        else:
+            end_session_later(client_id)
+    print(f"Client {client_id} disconnected ({connection.transport})")
+
+def end_session_later(client_id: str) -> None:
+    """Schedule the client's teardown after SESSION_GRACE_PERIOD, unless it is already scheduled."""
+    if client_id not in SESSION_TEARDOWNS:
+        SESSION_TEARDOWNS[client_id] = asyncio.create_task(end_session(client_id))
+
+async def end_session(client_id: str) -> None:
+    """Tear a client down once its grace period passes without a reconnect.
+
+    The client's state is dropped before the first await, so a client reconnecting
+    during the teardown starts a new session rather than losing parts of it.
+    """
+    await asyncio.sleep(SESSION_GRACE_PERIOD)
+    del SESSION_TEARDOWNS[client_id]
+    if CLIENTS.get(client_id):
+        return
+    CLIENTS.pop(client_id, None)
+    REPLAY_BUFFERS.pop(client_id, None)
+    SESSION_STATS["expired"] += 1
+    if client_id in CLIENT_TOOLS:
+        del CLIENT_TOOLS[client_id]
+    CLIENT_TOOL_OBJECTS.pop(client_id, None)
+    SESSION_POOLS.pop(client_id, None)
+    for metric in CLIENT_METRICS:
+        metric.remove(client_id=client_id)
+    invalidate_workflows(client_id)
+    router = MCP_CLIENTS.get(client_id)
+    if router is not None:
+        # The browser may be gone or changed by the time the client reconnects
+        router.invalidate_results()
+        # Commands the client never received fail now rather than at their timeout
+        error = ConnectionError(f"Client {client_id} did not reconnect within {SESSION_GRACE_PERIOD:g}s")
+        for command_id in list(router.pending_results):
+            router.fail_command(command_id, error)
+    print(f"Session of client {client_id} ended")
+    await SCHEDULER.set_client_limit(client_id, None)
+    await BROKER.detach_client(client_id)
+    if client_id in CLIENTS:
+        # Reconnected during the teardown; the new session holds a stream here
+        await BROKER.attach_client(client_id)
+        return
+    if router is not None:
+        # Forget the router and the settled command IDs it remembers once the failed
+        # tool calls have unwound, or after one more grace period at the latest
+        waited = 0.0
+        while router.pending_results and waited < SESSION_GRACE_PERIOD:
+            await asyncio.sleep(ROUTER_DRAIN_INTERVAL)
+            waited += ROUTER_DRAIN_INTERVAL
+        if not CLIENTS.get(client_id) and MCP_CLIENTS.get(client_id) is router:
+            del MCP_CLIENTS[client_id]
+
+async def next_commands(connection: ClientConnection) -> Optional[List[QueuedCommand]]:
+    """Wait for the next queued commands and take whatever else is already queued with them.
+
+    Returns `(enqueued_at, event_id, command)` items, an empty list after
+    HEARTBEAT_INTERVAL of idleness, or None once the stream has been evicted.
+    """
+    queue = connection.queue
+    # Block on the queue itself so a command wakes the stream as soon as
+    # it is enqueued; heartbeats are only sent when the stream is idle.
+    try:
+        item = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+    except asyncio.TimeoutError:
+        return []
+
+    # An evicted stream is closed so the client reconnects
+    if item[2] is None:
+        return None
     
-    queue = asyncio.Queue()
-    CLIENTS[client_id].add(queue)
-    print(f"Client {client_id} connected")
+    # Drain whatever else is already queued and write it in one flush
+    items = [item]
+    while len(items) < MAX_COMMANDS_PER_FLUSH and not queue.empty():
+        item = queue.get_nowait()
+        if item[2] is None:
+            # Evicted; the commands taken so far are still written
+            queue.put_nowait(item)
+            break
+        items.append(item)
+    connection.queued_since = time.monotonic()
+    return items
+
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    """An event ID from Last-Event-ID or the WebSocket's query string; None if absent or malformed."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+@app.get("/connect/{client_id}")
+async def connect_client(client_id: str, request: Request):
+    """SSE stream of commands for a client; send `Last-Event-ID` on reconnect to resume."""
+    connection = await attach_connection(client_id, "sse", parse_event_id(request.headers.get("last-event-id")))
     
     async def event_generator():
         try:
             while True:
-                if queue.empty():
-                    # Send heartbeat every 15 seconds
-                    await asyncio.sleep(15)
+                items = await next_commands(connection)
+                if items is None:
+                    return
+                if not items:
                     yield {
                         "event": "heartbeat",
                         "data": "ping"
                     }
-                else:
-                    command = await queue.get()
-                    yield {
-                        "event": "command",
-                        "data": json.dumps(command)
-                    }
-        except asyncio.CancelledError:
-            CLIENTS[client_id].remove(queue)
-            if not CLIENTS[client_id]:
-                del CLIENTS[client_id]
-                if client_id in MCP_CLIENTS:
-                    del MCP_CLIENTS[client_id]
-                if client_id in CLIENT_TOOLS:
-                    del CLIENT_TOOLS[client_id]
-            print(f"Client {client_id} disconnected")
+                    continue
+                yield encode_command_events([(event_id, command) for _, event_id, command in items])
+                # The generator resumes once the chunk has been sent
+                written_at = time.perf_counter()
+                for enqueued_at, _, _ in items:
+                    SSE_ENQUEUE_TO_WRITE.observe(written_at - enqueued_at)
+        finally:
+            await detach_connection(client_id, connection)
             
     return EventSourceResponse(event_generator())
 
+@app.websocket("/ws/{client_id}")
+async def websocket_client(websocket: WebSocket, client_id: str, last_event_id: Optional[str] = None):
+    """Bidirectional alternative to `/connect` plus the result and registration POSTs.
+
+    The server sends `{"event", "id", "data"}` frames with the same events and event
+    IDs as the SSE stream; reconnect with `?last_event_id=` to resume.
+    The client sends `{"type": "result" | "results" | "register_tools" | "heartbeat", ...}`
+    frames with the bodies the matching HTTP endpoints take. Commands and results are
+    matched by command ID, so any number may be in flight on one socket.
+    """
+    await websocket.accept()
+    connection = await attach_connection(client_id, "websocket", parse_event_id(last_event_id))
+    
+    async def write_commands():
+        while True:
+            items = await next_commands(connection)
+            if items is None:
+                await websocket.close(code=1012, reason="Evicted")
+                return
+            if not items:
+                await websocket.send_json({"event": "heartbeat", "data": "ping"})
+                continue
+            for _, event_id, command in items:
+                await websocket.send_json({"event": command_event(command), "id": event_id, "data": command})
+            written_at = time.perf_counter()
+            for enqueued_at, _, _ in items:
+                SSE_ENQUEUE_TO_WRITE.observe(written_at - enqueued_at)
+    
+    async def read_messages():
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"event": "error", "data": {"message": "Frames must be JSON objects"}})
+                continue
+            reply = await handle_client_message(client_id, message)
+            if reply is not None:
+                await websocket.send_json(reply)
+    
+    tasks = [asyncio.create_task(write_commands()), asyncio.create_task(read_messages())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"WebSocket of client {client_id} failed: {error!r}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await detach_connection(client_id, connection)
+
+async def handle_client_message(client_id: str, message: Any) -> Optional[Dict[str, Any]]:
+    """Act on one frame from a client's WebSocket; returns the frame to answer with, if any."""
+    kind = message.get("type") if isinstance(message, dict) else None
+    if kind == "result":
+        command_id = message.get("commandId")
+        if not command_id or "result" not in message:
+            return {"event": "error", "data": {"message": "commandId and result are required"}}
+        outcome = await BROKER.send_result(client_id, command_id, message["result"])
+        if outcome not in ("resolved", "forwarded"):
+            return {"event": "rejected", "data": {"commandId": command_id, "reason": outcome}}
+        return None
+    if kind == "results":
+        try:
+            outcomes = await resolve_batch_results(client_id, message.get("results", []))
+        except ValueError as e:
+            return {"event": "error", "data": {"message": str(e)}}
+        return {"event": "results", "data": {"batchId": message.get("batchId"), "outcomes": outcomes}}
+    if kind == "register_tools":
+        try:
+            missing = await register_client_tools(client_id, message)
+        except ValueError as e:
+            return {"event": "error", "data": {"message": str(e)}}
+        if missing:
+            return {"event": "missing_tools", "data": {"toolSetHash": message.get("toolSetHash"), "missing": missing}}
+        return {"event": "registered", "data": {"tools": len(CLIENT_TOOLS[client_id]), **session_pool_report(client_id)}}
+    if kind == "heartbeat":
+        return None
+    return {"event": "error", "data": {"message": f"Unknown message type {kind}"}}
+
 @app.post("/result/{client_id}")
 async def receive_result(client_id: str, request: Request):
-    result_data = await request.json()
-    print(f"Received result from client {client_id}: {result_data}")
+    try:
+        result_data = await read_result_payload(request)
+    except UnsupportedEncoding as e:
+        return JSONResponse(status_code=415, content={"status": "error", "message": str(e)})
+    except PayloadTooLarge as e:
+        return JSONResponse(status_code=413, content={"status": "error", "message": str(e)})
+    except InvalidPayload as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    debug_log("Received result from client %s for command %s: %s", client_id, result_data.get("commandId"), result_data.get("result"))
     
-    # Process the result using the appropriate MCPClient instance
-    if client_id in MCP_CLIENTS:
-        command_id = result_data.get("commandId")
-        result = result_data.get("result")
-        if command_id and result:
-            MCP_CLIENTS[client_id].receive_result(command_id, result)
+    # Resolve the waiting command through the client's shared router
+    command_id = result_data.get("commandId")
+    if not command_id or "result" not in result_data:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "commandId and result are required"})
+    
+    # The broker forwards the result if another worker issued the command
+    outcome = await BROKER.send_result(client_id, command_id, result_data["result"])
     
+    if outcome not in ("resolved", "forwarded"):
+        return JSONResponse(status_code=409, content={"status": "rejected", "reason": outcome})
     return {"status": "received"}
 
+@app.post("/results/{client_id}")
+async def receive_batch_results(client_id: str, request: Request):
+    """Endpoint for clients to post the results of a whole batch envelope at once."""
+    try:
+        batch_data = await read_result_payload(request)
+    except UnsupportedEncoding as e:
+        return JSONResponse(status_code=415, content={"status": "error", "message": str(e)})
+    except PayloadTooLarge as e:
+        return JSONResponse(status_code=413, content={"status": "error", "message": str(e)})
+    except InvalidPayload as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    results = batch_data.get("results", [])
+    try:
+        outcomes = await resolve_batch_results(client_id, results)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    debug_log("Received %d batched results from client %s", len(results), client_id)
+    return {"status": "received", "batchId": batch_data.get("batchId"), "outcomes": outcomes}
+
+async def resolve_batch_results(client_id: str, results: Any) -> Dict[str, str]:
+    """Resolve each `{"commandId", "result"}` item of a batch, returning outcomes by command ID.
+
+    Raises ValueError when `results` is not a list; malformed items are skipped.
+    """
+    if not isinstance(results, list):
+        raise ValueError("results must be a list")
+    outcomes = {}
+    for item in results:
+        if not isinstance(item, dict):
+            continue
+        command_id = item.get("commandId")
+        if not command_id or not isinstance(command_id, str) or "result" not in item:
+            continue
+        outcomes[command_id] = await BROKER.send_result(client_id, command_id, item["result"])
+    return outcomes
+
 @app.post("/register_tools/{client_id}")
 async def register_tools(client_id: str, request: Request):
-    """Endpoint for clients to register their available tools."""
+    """Endpoint for clients to register their available tools.
+
+    A client that sends `toolSetHash` and `toolHashes` without the definitions gets
+    `"status": "incomplete"` and the `missing` hashes when the server does not know
+    them all, and then uploads just those definitions with the same hashes.
+    """
     data = await request.json()
-    tools = data.get("tools", [])
+    try:
+        missing = await register_client_tools(client_id, data)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
     
-    if not tools:
-        return JSONResponse(status_code=400, content={"status": "error", "message": "No tools provided"})
+    if missing:
+        return {"status": "incomplete", "missing": missing, "message": f"Upload the {len(missing)} missing tool definitions"}
+    return {
+        "status": "success",
+        "message": f"Registered {len(CLIENT_TOOLS[client_id])} tools for client {client_id}",
+        **session_pool_report(client_id)
+    }
+
+async def register_client_tools(client_id: str, data: Dict[str, Any]) -> List[str]:
+    """Register a client's tool definitions and capabilities, from `/register_tools` or its WebSocket.
+
+    `data` holds the full `tools` list, or a `toolSetHash` and its `toolHashes` plus
+    the `tools` the server asked for. Definitions come from TOOL_CATALOG, so clients
+    with identical tool sets share them. `capabilities.sessions` is the number of
+    isolated browser sessions the client runs. Returns the hashes of definitions that
+    still have to be uploaded, empty once the client is registered.
+    """
+    capabilities = data.get("capabilities") or {}
+    sessions = capabilities.get("sessions")
+    if sessions is not None and (isinstance(sessions, bool) or not isinstance(sessions, int) or sessions < 1):
+        raise ValueError("capabilities.sessions must be a positive integer")
+    uploaded = data.get("tools") or []
+    if not isinstance(uploaded, list):
+        raise ValueError("tools must be a list")
+    # Uploaded definitions are stored under the hash computed here, never the client's
+    uploaded_hashes = [tool_hash(tool_def) for tool_def in uploaded]
+    tool_hashes = data.get("toolHashes", uploaded_hashes)
+    if not isinstance(tool_hashes, list) or not all(isinstance(digest, str) for digest in tool_hashes):
+        raise ValueError("toolHashes must be a list of hashes")
+    # A definition the client hashed differently would never resolve and the client
+    # would re-upload it forever, so reject it by name instead
+    requested = set(tool_hashes)
+    for tool_def, digest in zip(uploaded, uploaded_hashes):
+        if digest not in requested:
+            name = tool_def.get("name") if isinstance(tool_def, dict) else None
+            raise ValueError(f"Tool {name!r} does not hash to any of toolHashes (server hash {digest})")
+    for tool_def in uploaded:
+        TOOL_CATALOG.add(tool_def)
+    if not tool_hashes:
+        raise ValueError("No tools provided")
+    set_hash = tool_set_hash(tool_hashes)
+    if data.get("toolSetHash", set_hash) != set_hash:
+        raise ValueError("toolSetHash does not match toolHashes")
     
-    # Store the tools for this client
-    CLIENT_TOOLS[client_id] = tools
-    print(f"Registered {len(tools)} tools for client {client_id}")
+    tools = TOOL_CATALOG.get_set(set_hash)
+    if tools is None:
+        tools, missing = TOOL_CATALOG.resolve(tool_hashes)
+        if missing:
+            return missing
+    
+    # Batch concurrent tool calls only for clients that can execute batch envelopes
+    supports_batch = bool(capabilities.get("batch"))
+    get_mcp_client(client_id).batch_window = COMMAND_BATCH_WINDOW if supports_batch else None
+    await configure_session_pool(client_id, sessions)
     
-    return {"status": "success", "message": f"Registered {len(tools)} tools for client {client_id}"}
+    # Store the tools for this client and build their LangChain tools once, here,
+    # rather than on every /agent call; other workers pick them up from the broker
+    if CLIENT_TOOLS.get(client_id) != tools or client_id not in CLIENT_TOOL_OBJECTS:
+        await store_client_tools(client_id, tools)
+    await BROKER.publish_tools(client_id, tools)
+    print(f"Registered {len(tools)} tools for client {client_id} ({len(uploaded)} uploaded)")
+    return []
 
-# Endpoint for agent to process user requests
-@app.post("/agent/{client_id}")
-async def agent_endpoint(client_id: str, request: Request, background_tasks: BackgroundTasks):
+async def configure_session_pool(client_id: str, size: Optional[int]) -> None:
+    """Size a client's session pool from its registration and cap its running agent jobs to match.
+
+    Clients that do not report sessions keep a single shared browser and the usual
+    per-client cap.
+    """
+    if size is None:
+        SESSION_POOLS.pop(client_id, None)
+        await SCHEDULER.set_client_limit(client_id, None)
+        return
+    pool = SESSION_POOLS.get(client_id)
+    if pool is None:
+        SESSION_POOLS[client_id] = SessionPool(size)
+    else:
+        pool.resize(size)
+    await SCHEDULER.set_client_limit(client_id, size)
+
+def session_pool_report(client_id: str) -> Dict[str, Any]:
+    """The client's session pool size and utilization for its registration response, if it has a pool."""
+    pool = SESSION_POOLS.get(client_id)
+    return {"sessions": pool.stats()} if pool is not None else {}
+
+def create_agent_job(client_id: str, user_input: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Record a new agent job so its result can be fetched later by ID.
+
+    `data` is the request body, already checked by submit_agent_job: `thread_id`
+    continues (or starts) a persistent conversation, `priority` picks the scheduling
+    class and `timeout` (seconds) sets the job's deadline.
+    """
+    created_at = time.time()
+    timeout = data.get("timeout")
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "client_id": client_id,
+        "thread_id": data.get("thread_id"),
+        "input": user_input,
+        "priority": data.get("priority") or DEFAULT_PRIORITY,
+        "status": "pending",
+        "created_at": created_at,
+        "deadline": created_at + timeout if timeout is not None else None,
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+        "session_id": None,
+    }
+    AGENT_JOBS[job["job_id"]] = job
+    # Forget the oldest finished jobs once the registry is full
+    for job_id in list(AGENT_JOBS):
+        if len(AGENT_JOBS) <= MAX_AGENT_JOBS:
+            break
+        if AGENT_JOBS[job_id]["status"] in FINISHED_STATUSES:
+            del AGENT_JOBS[job_id]
+    return job
+
+async def get_client_tools(client_id: str) -> List["BaseTool"]:
+    """Return the tools built at registration; clients that never registered get the fallback tool."""
+    # The client may have registered through another worker
+    definitions = await BROKER.get_tools(client_id)
+    if definitions is not None and definitions != CLIENT_TOOLS.get(client_id):
+        await store_client_tools(client_id, definitions)
+    return CLIENT_TOOL_OBJECTS.get(client_id) or await build_client_tools(client_id)
+
+async def submit_agent_job(client_id: str, request: Request, events: Optional[asyncio.Queue] = None):
+    """Validate an agent request and queue it on the scheduler.
+
+    Returns the job, or the error response when the request is invalid or the
+    client already has the maximum number of jobs waiting.
+    """
     data = await request.json()
     user_input = data.get("input")
     
     if not user_input:
         return JSONResponse(status_code=400, content={"status": "error", "message": "No input provided"})
+    if (data.get("priority") or DEFAULT_PRIORITY) not in PRIORITIES:
+        return JSONResponse(status_code=400, content={"status": "error", "message": f"priority must be one of {', '.join(PRIORITIES)}"})
+    timeout = data.get("timeout")
+    if timeout is not None and (
+        isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not math.isfinite(timeout) or timeout <= 0
+    ):
+        return JSONResponse(status_code=400, content={"status": "error", "message": "timeout must be a positive number of seconds"})
     
-    if client_id not in MCP_CLIENTS:
-        # Create MCPClient instance if it doesn't exist
-        MCP_CLIENTS[client_id] = MCPClient(client_id=client_id, send_command_func=send_command_to_client)
+    job = create_agent_job(client_id, user_input, data)
+    AGENT_JOB_TOOLS[job["job_id"]] = await get_client_tools(client_id)
+    if events is not None:
+        AGENT_JOB_EVENTS[job["job_id"]] = events
+    if not await SCHEDULER.submit(job):
+        AGENT_JOBS.pop(job["job_id"])
+        AGENT_JOB_TOOLS.pop(job["job_id"])
+        AGENT_JOB_EVENTS.pop(job["job_id"], None)
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": "1"},
+            content={"status": "error", "message": f"Too many agent requests queued for client {client_id}"}
+        )
+    return job
+
+# Endpoint for agent to process user requests
+@app.post("/agent/{client_id}")
+async def agent_endpoint(client_id: str, request: Request):
+    # The scheduler runs the agent on its worker pool; the result is kept under the job ID
+    job = await submit_agent_job(client_id, request)
+    if isinstance(job, JSONResponse):
+        return job
     
-    # Create MCP tools using the registered tool definitions if available
-    tools = await create_mcp_tools(
-        client_id=client_id, 
-        send_command_func=send_command_to_client,
-        tool_definitions=CLIENT_TOOLS.get(client_id, [])
-    )
+    return {
+        "status": "processing",
+        "job_id": job["job_id"],
+        "thread_id": job["thread_id"],
+        "message": f"Processing request for client {client_id}"
+    }
+
+@app.post("/agent/{client_id}/stream")
+async def agent_stream_endpoint(client_id: str, request: Request):
+    """Run an agent request and stream its progress as SSE events.
+
+    The first event carries the job ID; the job keeps running if the stream is
+    dropped, and its result stays available from `/jobs/{job_id}`.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    job = await submit_agent_job(client_id, request, events)
+    if isinstance(job, JSONResponse):
+        return job
     
-    # Run the agent in the background to avoid blocking
-    background_tasks.add_task(process_agent_request, client_id, user_input, tools)
+    async def event_generator():
+        yield {"event": "job", "data": json.dumps({"job_id": job["job_id"], "thread_id": job["thread_id"]})}
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield {"event": event["type"], "data": json.dumps(event, default=str)}
     
-    return {"status": "processing", "message": f"Processing request for client {client_id}"}
+    return EventSourceResponse(event_generator())
+
+@app.get("/blobs/{blob_id}")
+async def get_blob(blob_id: str):
+    """Return binary tool output (e.g. a screenshot) that was replaced by a reference."""
+    blob = BLOB_STORE.get(blob_id)
+    if blob is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Unknown blob {blob_id}"})
+    data, mime_type = blob
+    return Response(content=data, media_type=mime_type)
+
+@app.get("/jobs")
+async def list_jobs(client_id: Optional[str] = None, status: Optional[str] = None, limit: int = 100):
+    """List the most recent agent jobs, newest first, with the schedulers' queue depths and wait times."""
+    jobs = [
+        job for job in reversed(AGENT_JOBS.values())
+        if (client_id is None or job["client_id"] == client_id) and (status is None or job["status"] == status)
+    ]
+    return {"scheduler": SCHEDULER.stats(), "llm_scheduler": LLM_SCHEDULER.stats(), "jobs": jobs[:limit]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the status and, once finished, the result of an agent job."""
+    job = AGENT_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Unknown job {job_id}"})
+    return job
 
-async def process_agent_request(client_id: str, user_input: str, tools: List[Any]):
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a waiting or running agent job.
+
+    A running job's pending tool commands are abandoned and the local client is
+    sent a `cancel` event for each of them.
+    """
+    job = AGENT_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Unknown job {job_id}"})
+    if not await SCHEDULER.cancel(job):
+        return JSONResponse(status_code=409, content={"status": "error", "message": f"Job {job_id} already {job['status']}"})
+    return {"status": "cancelling" if job["status"] == "running" else job["status"], "job_id": job_id}
+
+async def process_agent_request(job: Dict[str, Any]):
+    """Run one agent job, forwarding progress events to its stream when one is attached."""
+    job_id, client_id, user_input = job["job_id"], job["client_id"], job["input"]
+    tools = AGENT_JOB_TOOLS.pop(job_id)
+    events = AGENT_JOB_EVENTS.pop(job_id, None)
+    job["status"] = "running"
     try:
-        # Run the graph with the user input
-        result = await run_graph(client_id, user_input, tools)
-        print(f"Agent result for client {client_id}: {result}")
-        # Here you could send the result back to a user interface or store it
+        await agent_stack_ready()
+        # With a session pool the run gets a browser session of its own, the one its
+        # thread last used if that is free; its tool calls are tagged with it
+        pool = SESSION_POOLS.get(client_id)
+        async with pool.lease(job["thread_id"]) if pool is not None else nullcontext() as session_id:
+            job["session_id"] = session_id
+            if events is None:
+                # Run the graph with the user input
+                result = await graph.run_graph(client_id, user_input, tools, job["thread_id"])
+                job["result"] = graph.final_answer(result)
+            else:
+                async for event in graph.stream_graph(client_id, user_input, tools, job["thread_id"]):
+                    await events.put(event)
+                    if event["type"] == "final":
+                        job["result"] = event["answer"]
+        job["status"] = "completed"
+        debug_log("Agent result for client %s: %s", client_id, job["result"])
+    except asyncio.CancelledError:
+        # Cancelled on request or past its deadline; the scheduler records which
+        if events is not None:
+            events.put_nowait({"type": "error", "message": "Job stopped before it finished"})
+        raise
     except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        if events is not None:
+            await events.put({"type": "error", "message": str(e)})
         print(f"Error processing agent request: {e}")
+    finally:
+        job["finished_at"] = time.time()
+        if events is not None:
+            events.put_nowait(None)
+
+def skip_agent_job(job: Dict[str, Any]) -> None:
+    """Release a job cancelled or expired before it ran, closing its stream if it has one."""
+    AGENT_JOB_TOOLS.pop(job["job_id"], None)
+    events = AGENT_JOB_EVENTS.pop(job["job_id"], None)
+    if events is not None:
+        events.put_nowait({"type": "error", "message": job["error"]})
+        events.put_nowait(None)
+
+SCHEDULER = JobScheduler(
+    process_agent_request,
+    workers=AGENT_WORKERS,
+    max_running_per_client=MAX_AGENT_RUNS_PER_CLIENT,
+    max_waiting_per_client=MAX_WAITING_AGENT_RUNS,
+    on_skipped=skip_agent_job
+)
+
+@app.get("/metrics")
+async def metrics():
+    """Timings, counters and queue depths in the Prometheus text format."""
+    SSE_QUEUE_DEPTH.clear()
+    for client_id, connections in CLIENTS.items():
+        SSE_QUEUE_DEPTH.set(sum(connection.queue.qsize() for connection in connections), client_id=client_id)
+    PENDING_COMMANDS.clear()
+    for client_id, router in MCP_CLIENTS.items():
+        PENDING_COMMANDS.set(len(router.pending_results), client_id=client_id)
+    SESSION_POOL_SIZE.clear()
+    SESSION_POOL_BUSY.clear()
+    for client_id, pool in SESSION_POOLS.items():
+        SESSION_POOL_SIZE.set(pool.size, client_id=client_id)
+        SESSION_POOL_BUSY.set(pool.busy, client_id=client_id)
+    for tool, timeout in TOOL_LATENCIES.timeouts().items():
+        TOOL_TIMEOUT.set(timeout, tool=tool)
+    LLM_QUEUE_DEPTH.set(LLM_SCHEDULER.waiting)
+    scheduler_stats = SCHEDULER.stats()
+    for priority, depth in scheduler_stats["queue_depth_by_priority"].items():
+        JOB_QUEUE_DEPTH.set(depth, priority=priority)
+    JOBS_RUNNING.set(scheduler_stats["running"])
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 # Test endpoint to send a command to a client
 @app.post("/test/send_command/{client_id}")
-async def test_send_command(client_id: str, request: Request):
+async def test_send_command(client_id: str, request: Request, wait: bool = False):
+    """Send a raw command, or with `?wait=true` send {"tool", "params"} through the
+    client's router and return the result."""
     command = await request.json()
-    print(f"Sending command to client {client_id}: {command}")
+    debug_log("Sending command to client %s: %s", client_id, command)
+    if wait:
+        result = await get_mcp_client(client_id).send_command(command.get("tool"), command.get("params", {}))
+        return {"status": "completed", "result": result}
     await send_command_to_client(client_id, command)
     return {"status": "command sent"}
 
+if STARTUP_MODE == "eager":
+    warm_up_agent_stack()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="debug") 
\ No newline at end of file
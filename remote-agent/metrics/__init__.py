@@ -0,0 +1,77 @@
+from .debug import debug_log
+from .registry import LATENCY_BUCKETS, REGISTRY, TOKEN_BUCKETS, Counter, Gauge, Histogram, Registry
+
+# Command delivery
+SSE_ENQUEUE_TO_WRITE = REGISTRY.histogram(
+    "mcp_sse_enqueue_to_write_seconds", "Time from queuing a command to writing it to the client's SSE stream"
+)
+TOOL_ROUND_TRIP = REGISTRY.histogram(
+    "mcp_tool_round_trip_seconds", "Time from sending a tool command to receiving its result", ["tool"]
+)
+TOOL_COMMANDS = REGISTRY.counter(
+    "mcp_tool_commands_total", "Tool commands sent to clients, by outcome", ["tool", "outcome"]
+)
+TOOL_RESENDS = REGISTRY.counter(
+    "mcp_tool_resends_total", "Idempotent commands sent again, as a hedge or after a timeout", ["tool", "kind"]
+)
+TOOL_TIMEOUT = REGISTRY.gauge("mcp_tool_timeout_seconds", "Timeout derived from a tool's recent latencies", ["tool"])
+SSE_QUEUE_DEPTH = REGISTRY.gauge("mcp_sse_queue_depth", "Commands queued on a client's SSE streams", ["client_id"])
+PENDING_COMMANDS = REGISTRY.gauge("mcp_pending_commands", "Commands awaiting a result from a client", ["client_id"])
+SESSION_POOL_SIZE = REGISTRY.gauge("mcp_session_pool_size", "Browser sessions a client runs for agent runs", ["client_id"])
+SESSION_POOL_BUSY = REGISTRY.gauge("mcp_session_pool_busy", "Browser sessions leased to running agent runs", ["client_id"])
+
+# Agent runs
+LLM_LATENCY = REGISTRY.histogram("agent_llm_latency_seconds", "Latency of one chat model call", ["model"])
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "agent_llm_prompt_tokens", "Prompt tokens of one chat model call", ["model"], TOKEN_BUCKETS
+)
+LLM_COMPLETION_TOKENS = REGISTRY.histogram(
+    "agent_llm_completion_tokens", "Completion tokens of one chat model call", ["model"], TOKEN_BUCKETS
+)
+LLM_QUEUE_WAIT = REGISTRY.histogram(
+    "agent_llm_queue_wait_seconds", "Time an LLM request waited for the rate limits and its turn", ["client_id"]
+)
+LLM_QUEUE_DEPTH = REGISTRY.gauge("agent_llm_queue_depth", "LLM requests waiting for the rate limits")
+WORKFLOW_BUILD = REGISTRY.histogram(
+    "agent_workflow_build_seconds", "Time to get a compiled workflow for a request", ["cache"]
+)
+JOB_WAIT = REGISTRY.histogram(
+    "agent_job_wait_seconds", "Time an agent job waited for a worker", ["priority"]
+)
+JOBS_FINISHED = REGISTRY.counter("agent_jobs_total", "Agent jobs finished, by status", ["status"])
+JOB_QUEUE_DEPTH = REGISTRY.gauge("agent_job_queue_depth", "Agent jobs waiting for a worker", ["priority"])
+JOBS_RUNNING = REGISTRY.gauge("agent_jobs_running", "Agent jobs running")
+
+# Metrics labelled by client_id; a client's series are removed when its session ends
+CLIENT_METRICS = (SSE_QUEUE_DEPTH, PENDING_COMMANDS, SESSION_POOL_SIZE, SESSION_POOL_BUSY, LLM_QUEUE_WAIT)
+
+__all__ = [
+    "CLIENT_METRICS",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "JOB_QUEUE_DEPTH",
+    "JOB_WAIT",
+    "JOBS_FINISHED",
+    "JOBS_RUNNING",
+    "LATENCY_BUCKETS",
+    "LLM_COMPLETION_TOKENS",
+    "LLM_LATENCY",
+    "LLM_PROMPT_TOKENS",
+    "LLM_QUEUE_DEPTH",
+    "LLM_QUEUE_WAIT",
+    "PENDING_COMMANDS",
+    "REGISTRY",
+    "Registry",
+    "SESSION_POOL_BUSY",
+    "SESSION_POOL_SIZE",
+    "SSE_ENQUEUE_TO_WRITE",
+    "SSE_QUEUE_DEPTH",
+    "TOKEN_BUCKETS",
+    "TOOL_COMMANDS",
+    "TOOL_RESENDS",
+    "TOOL_ROUND_TRIP",
+    "TOOL_TIMEOUT",
+    "WORKFLOW_BUILD",
+    "debug_log",
+]
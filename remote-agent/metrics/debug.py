@@ -0,0 +1,10 @@
+import os
+import random
+
+# Fraction of verbose payload log lines printed; 0 (the default) keeps them off the hot path
+DEBUG_SAMPLE_RATE = float(os.environ.get("MCP_DEBUG_SAMPLE_RATE", "0"))
+
+def debug_log(message: str, *args) -> None:
+    """Print a sampled debug line; `args` are only formatted into `message` when it is printed."""
+    if DEBUG_SAMPLE_RATE and random.random() < DEBUG_SAMPLE_RATE:
+        print(message % args if args else message)
@@ -0,0 +1,3 @@
+from .job_scheduler import DEFAULT_PRIORITY, FINISHED_STATUSES, PRIORITIES, JobScheduler
+
+__all__ = ["DEFAULT_PRIORITY", "FINISHED_STATUSES", "JobScheduler", "PRIORITIES"]
@@ -0,0 +1,230 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from metrics import JOB_WAIT, JOBS_FINISHED
+
+# Priority classes, most urgent first
+PRIORITIES = ("interactive", "normal", "batch")
+DEFAULT_PRIORITY = "normal"
+
+# Runs one job; it records the job's result and sets "completed" or "failed" itself
+JobRunner = Callable[[Dict[str, Any]], Awaitable[None]]
+# Called for a job that is cancelled or expires before it starts
+SkipHandler = Callable[[Dict[str, Any]], None]
+
+# Statuses of jobs that will not run (again)
+FINISHED_STATUSES = ("completed", "failed", "cancelled", "timed_out")
+
+class JobScheduler:
+    """Runs agent jobs on a fixed pool of async workers.
+
+    Waiting jobs are taken by priority class, then earliest deadline, then arrival.
+    A client runs at most `max_running_per_client` jobs at once; a job of a client at
+    its cap is passed over for the next one, so one busy client cannot hold workers
+    idle; `set_client_limit` lowers the cap for one client, e.g. to the number of
+    browser sessions it runs. A job past its `deadline` is stopped, whether waiting
+    or running; a waiting one is expired by a timer set for the earliest deadline,
+    even while every worker is busy.
+    """
+
+    def __init__(
+        self,
+        run_job: JobRunner,
+        workers: int,
+        max_running_per_client: int,
+        max_waiting_per_client: int,
+        on_skipped: Optional[SkipHandler] = None
+    ):
+        self.run_job = run_job
+        self.on_skipped = on_skipped
+        self.workers = workers
+        self.max_running_per_client = max_running_per_client
+        self.max_waiting_per_client = max_waiting_per_client
+        # job_id -> waiting job, and the order in which each arrived
+        self._waiting: Dict[str, Dict[str, Any]] = {}
+        self._arrival: Dict[str, int] = {}
+        # Heap of (deadline, arrival, job_id) of waiting jobs with a deadline; entries of
+        # jobs that started or were cancelled are dropped when they reach the top
+        self._deadlines: List[Tuple[float, int, str]] = []
+        self._expiry: Optional[asyncio.TimerHandle] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        # Running jobs being cancelled on request, as opposed to the worker being stopped
+        self._cancelling: Set[str] = set()
+        self._running_per_client: Dict[str, int] = {}
+        # client_id -> running jobs allowed, for clients capped below max_running_per_client
+        self._client_limits: Dict[str, int] = {}
+        self._waiting_per_client: Dict[str, int] = {}
+        self._order = itertools.count()
+        self._changed = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        # Seconds waited by the most recently started jobs, for reporting
+        self._recent_waits: List[float] = []
+
+    async def start(self) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        for task in [*self._workers, *self._running.values()]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._running.values(), return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, job: Dict[str, Any]) -> bool:
+        """Queue a job; False when its client already has the maximum number waiting."""
+        client_id = job["client_id"]
+        if self._waiting_per_client.get(client_id, 0) >= self.max_waiting_per_client:
+            return False
+        job["priority"] = job.get("priority") or DEFAULT_PRIORITY
+        if job["priority"] not in PRIORITIES:
+            raise ValueError(f"Unknown priority {job['priority']}; expected one of {', '.join(PRIORITIES)}")
+        self._arrival[job["job_id"]] = next(self._order)
+        self._waiting[job["job_id"]] = job
+        self._waiting_per_client[client_id] = self._waiting_per_client.get(client_id, 0) + 1
+        if job.get("deadline") is not None:
+            heapq.heappush(self._deadlines, (job["deadline"], self._arrival[job["job_id"]], job["job_id"]))
+            self._schedule_expiry()
+        async with self._changed:
+            self._changed.notify()
+        return True
+
+    async def cancel(self, job: Dict[str, Any]) -> bool:
+        """Cancel a waiting or running job; False when it has already finished."""
+        if job["job_id"] in self._waiting:
+            self._unqueue(job)
+            self._skip(job, "cancelled", "Cancelled before it started")
+            return True
+        task = self._running.get(job["job_id"])
+        if task is None:
+            return False
+        self._cancelling.add(job["job_id"])
+        task.cancel()
+        return True
+
+    async def set_client_limit(self, client_id: str, limit: Optional[int]) -> None:
+        """Cap a client's running jobs below max_running_per_client; None removes the cap."""
+        if limit is None:
+            self._client_limits.pop(client_id, None)
+        else:
+            self._client_limits[client_id] = min(limit, self.max_running_per_client)
+        # A raised cap may let waiting jobs start
+        async with self._changed:
+            self._changed.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, running jobs, queue depth and how long jobs wait for a worker."""
+        now = time.time()
+        waiting = list(self._waiting.values())
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "queue_depth": len(self._waiting),
+            "queue_depth_by_priority": {
+                priority: sum(1 for job in waiting if job["priority"] == priority) for priority in PRIORITIES
+            },
+            "oldest_wait_s": max((now - job["created_at"] for job in waiting), default=0.0),
+            "recent_mean_wait_s": sum(self._recent_waits) / len(self._recent_waits) if self._recent_waits else 0.0,
+        }
+
+    def _sort_key(self, job: Dict[str, Any]) -> tuple:
+        deadline = job.get("deadline")
+        return (PRIORITIES.index(job["priority"]), deadline if deadline is not None else float("inf"), self._arrival[job["job_id"]])
+
+    def _unqueue(self, job: Dict[str, Any]) -> None:
+        del self._waiting[job["job_id"]]
+        del self._arrival[job["job_id"]]
+        self._waiting_per_client[job["client_id"]] -= 1
+        if not self._waiting_per_client[job["client_id"]]:
+            del self._waiting_per_client[job["client_id"]]
+
+    def _finish(self, job: Dict[str, Any], status: str, error: str) -> None:
+        job["status"] = status
+        job["error"] = error
+        job["finished_at"] = time.time()
+
+    def _skip(self, job: Dict[str, Any], status: str, error: str) -> None:
+        self._finish(job, status, error)
+        JOBS_FINISHED.inc(status=status)
+        if self.on_skipped is not None:
+            self.on_skipped(job)
+
+    def _schedule_expiry(self) -> None:
+        """Set the expiry timer for the earliest deadline among the waiting jobs."""
+        while self._deadlines and self._deadlines[0][2] not in self._waiting:
+            heapq.heappop(self._deadlines)
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        if self._deadlines:
+            delay = max(0.0, self._deadlines[0][0] - time.time())
+            self._expiry = asyncio.get_running_loop().call_later(delay, self._expire_waiting)
+
+    def _expire_waiting(self) -> None:
+        self._expiry = None
+        now = time.time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            job = self._waiting.get(heapq.heappop(self._deadlines)[2])
+            if job is not None:
+                self._unqueue(job)
+                self._skip(job, "timed_out", "Deadline passed before the job started")
+        self._schedule_expiry()
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        """Take the most urgent waiting job whose client has a free slot, dropping expired ones."""
+        now = time.time()
+        for job in sorted(self._waiting.values(), key=self._sort_key):
+            if job.get("deadline") is not None and job["deadline"] <= now:
+                self._unqueue(job)
+                self._skip(job, "timed_out", "Deadline passed before the job started")
+                continue
+            limit = self._client_limits.get(job["client_id"], self.max_running_per_client)
+            if self._running_per_client.get(job["client_id"], 0) < limit:
+                self._unqueue(job)
+                return job
+        return None
+
+    async def _work(self) -> None:
+        while True:
+            async with self._changed:
+                job = self._next_job()
+                while job is None:
+                    await self._changed.wait()
+                    job = self._next_job()
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        client_id = job["client_id"]
+        self._running_per_client[client_id] = self._running_per_client.get(client_id, 0) + 1
+        job["started_at"] = time.time()
+        waited = job["started_at"] - job["created_at"]
+        self._recent_waits = [*self._recent_waits[-99:], waited]
+        JOB_WAIT.observe(waited, priority=job["priority"])
+
+        timeout = job["deadline"] - time.time() if job.get("deadline") is not None else None
+        task = asyncio.create_task(asyncio.wait_for(self.run_job(job), timeout))
+        self._running[job["job_id"]] = task
+        try:
+            await task
+        except asyncio.TimeoutError:
+            self._finish(job, "timed_out", "Deadline passed while the job was running")
+        except asyncio.CancelledError:
+            if job["job_id"] not in self._cancelling:
+                # The worker itself is being stopped
+                raise
+            self._finish(job, "cancelled", "Cancelled while running")
+        finally:
+            del self._running[job["job_id"]]
+            self._cancelling.discard(job["job_id"])
+            if job["status"] in FINISHED_STATUSES:
+                JOBS_FINISHED.inc(status=job["status"])
+            self._running_per_client[client_id] -= 1
+            if not self._running_per_client[client_id]:
+                del self._running_per_client[client_id]
+            # A slot freed up for this client's waiting jobs
+            async with self._changed:
+                self._changed.notify()
@@ -0,0 +1,95 @@
+"""Checks that the server hashes tool definitions exactly as the local client does.
+
+The local client registers tools by the SHA-256 of its canonicalJson; if the server's
+tool_hash disagrees, the client's uploads never resolve. This runs the client's own
+canonicalJson (taken from local-mcp/src/index.ts) under node and compares the hashes.
+
+    python -m pytest test_tool_hashes.py
+"""
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from tools.catalog import canonical_json, tool_hash
+
+CLIENT_SOURCE = Path(__file__).resolve().parent.parent / "local-mcp" / "src" / "index.ts"
+
+# A nested schema with the values the two JSON writers format differently: unicode,
+# keys outside the BMP, integral and exponent floats, escapes, nulls
+NESTED_TOOL = {
+    "name": "browser_fill_form",
+    "description": "Fill a form — «unicode», emoji 😀 and a tab\there",
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "fields": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"ref": {"type": "string"}, "value": {"type": ["string", "null"]}},
+                    "required": ["ref"],
+                },
+                "maxItems": 50,
+            },
+            "timeout": {"type": "number", "minimum": 1e-07, "maximum": 1.5e21, "default": 30.0},
+            "ratio": {"type": "number", "multipleOf": 0.00001, "exclusiveMaximum": 0.1},
+            "\U0001F600": {"const": True},
+            "＀": {"const": None},
+        },
+        "additionalProperties": False,
+    },
+}
+
+
+def client_hash(tool_def):
+    """The hash the local client computes, by running its canonicalJson under node."""
+    node = shutil.which("node")
+    if node is None:
+        pytest.skip("node is not installed")
+    source = CLIENT_SOURCE.read_text()
+    function = re.search(r"^function canonicalJson\(.*?^}$", source, re.MULTILINE | re.DOTALL).group(0)
+    # Drop the TypeScript annotations so node runs it as plain JavaScript
+    function = function.replace("(value: any): string", "(value)")
+    script = (
+        f"{function}\n"
+        "const definition = JSON.parse(require('fs').readFileSync(0, 'utf8'));\n"
+        "process.stdout.write(require('crypto').createHash('sha256').update(canonicalJson(definition)).digest('hex'));\n"
+    )
+    # The client hashes what it parsed from JSON, so send it exactly that
+    result = subprocess.run([node, "-e", script], input=json.dumps(tool_def), capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+def test_nested_schema_hashes_alike():
+    assert tool_hash(NESTED_TOOL) == client_hash(NESTED_TOOL)
+
+
+def test_python_only_float_spellings_hash_alike():
+    # Python would write these as 1e-05, 1e+16 and 2.0; JSON.stringify does not
+    tool_def = {"name": "t", "inputSchema": {"a": 0.00001, "b": 1e16, "c": 2.0, "d": -2.5e-10}}
+    assert canonical_json(tool_def) == '{"inputSchema":{"a":0.00001,"b":10000000000000000,"c":2,"d":-2.5e-10},"name":"t"}'
+    assert tool_hash(tool_def) == client_hash(tool_def)
+
+
+def test_upload_with_unrequested_hash_is_rejected():
+    import main
+
+    tool_def = {"name": "browser_click", "inputSchema": {"type": "object"}}
+    client_digest = hashlib.sha256(b"hashed some other way").hexdigest()
+    with TestClient(main.app) as client:
+        response = client.post("/register_tools/test-tool-hashes", json={
+            "toolHashes": [client_digest],
+            "tools": [tool_def],
+        })
+    assert response.status_code == 400
+    assert "browser_click" in response.text
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
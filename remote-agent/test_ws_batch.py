@@ -0,0 +1,70 @@
+"""Checks that malformed batch results are answered with an error, not a dropped socket or a 500.
+
+    python -m pytest test_ws_batch.py
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@contextmanager
+def connect(client):
+    """A WebSocket for a fresh client, closed the way a real client closes it.
+
+    TestClient cancels the handler as soon as it sends the disconnect, so wait for
+    the server to detach the stream (and schedule the session's teardown) first.
+    """
+    client_id = f"test-ws-batch-{uuid.uuid4().hex}"
+    with client.websocket_connect(f"/ws/{client_id}") as websocket:
+        yield websocket
+        websocket.close()
+        deadline = time.monotonic() + 5
+        while client_id not in main.SESSION_TEARDOWNS and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+def receive_reply(websocket):
+    """The next frame that is not a heartbeat or a command."""
+    while True:
+        frame = websocket.receive_json()
+        if frame["event"] in ("error", "results", "rejected"):
+            return frame
+
+
+@pytest.mark.parametrize("results", [{"commandId": "c1"}, "c1", None])
+def test_ws_batch_that_is_not_a_list_gets_an_error_frame(client, results):
+    with connect(client) as websocket:
+        websocket.send_json({"type": "results", "batchId": "b1", "results": results})
+        assert receive_reply(websocket) == {"event": "error", "data": {"message": "results must be a list"}}
+        # The socket stays open and keeps answering
+        websocket.send_json({"type": "results", "batchId": "b2", "results": []})
+        assert receive_reply(websocket) == {"event": "results", "data": {"batchId": "b2", "outcomes": {}}}
+
+
+def test_ws_batch_skips_items_that_are_not_objects(client):
+    with connect(client) as websocket:
+        websocket.send_json({"type": "results", "batchId": "b1", "results": ["c1", 7, None, [1], {"commandId": ["c2"], "result": 1}]})
+        assert receive_reply(websocket) == {"event": "results", "data": {"batchId": "b1", "outcomes": {}}}
+
+
+def test_http_batch_that_is_not_a_list_gets_400(client):
+    response = client.post("/results/test-ws-batch", json={"batchId": "b1", "results": {"commandId": "c1"}})
+    assert response.status_code == 400
+    response = client.post("/results/test-ws-batch", json={"batchId": "b1", "results": ["c1", None]})
+    assert response.status_code == 200
+    assert response.json()["outcomes"] == {}
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -1,3 +1,34 @@
-from .mcp_tools import MCPClient, create_mcp_tools
+from .blob_store import BLOB_STORE, BlobStore
+from .catalog import TOOL_CATALOG, TOOL_REGISTRATION_STATS, ToolCatalog, tool_hash, tool_set_hash
+from .compaction import COMPACTION_STATS, TOOL_OUTPUT_POLICIES, ToolOutputPolicy
+from .deadlines import TOOL_LATENCIES, ToolLatencies
+from .mcp_tools import MCPClient, READ_ONLY_TOOLS, RESULT_CACHE_STATS, create_mcp_tools, warm_up
+from .selection import PINNED_TOOLS, TOOL_SELECTION_STATS, ToolIndex, tool_index
+from .sessions import SessionPool, current_session, use_session
 
-__all__ = ["MCPClient", "create_mcp_tools"]
+__all__ = [
+    "BLOB_STORE",
+    "BlobStore",
+    "COMPACTION_STATS",
+    "MCPClient",
+    "PINNED_TOOLS",
+    "READ_ONLY_TOOLS",
+    "RESULT_CACHE_STATS",
+    "SessionPool",
+    "TOOL_CATALOG",
+    "TOOL_LATENCIES",
+    "TOOL_OUTPUT_POLICIES",
+    "TOOL_REGISTRATION_STATS",
+    "TOOL_SELECTION_STATS",
+    "ToolCatalog",
+    "ToolIndex",
+    "ToolLatencies",
+    "ToolOutputPolicy",
+    "create_mcp_tools",
+    "current_session",
+    "tool_hash",
+    "tool_index",
+    "tool_set_hash",
+    "use_session",
+    "warm_up",
+]
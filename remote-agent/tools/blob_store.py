@@ -0,0 +1,45 @@
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class BlobStore:
+    """Size-bounded in-memory store for binary tool output such as screenshots.
+
+    Blobs are referenced by ID; once `max_bytes` is exceeded the least recently
+    used blobs are evicted. A blob larger than `max_bytes` is refused.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # blob_id -> (data, mime type), least recently used first
+        self._blobs: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+
+    def put(self, data: bytes, mime_type: str = "application/octet-stream") -> str:
+        """Store a blob and return its ID; ValueError if it alone exceeds max_bytes."""
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Blob of {len(data)} bytes exceeds the store's {self.max_bytes} bytes")
+        blob_id = uuid.uuid4().hex
+        self._blobs[blob_id] = (data, mime_type)
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes:
+            _, (evicted, _) = self._blobs.popitem(last=False)
+            self.total_bytes -= len(evicted)
+        return blob_id
+
+    def put_reference(self, data: bytes, mime_type: str = "application/octet-stream") -> str:
+        """Store a blob and return the textual reference that stands in for it in results."""
+        return f"[blob {self.put(data, mime_type)}: {mime_type}, {len(data)} bytes]"
+
+    def get(self, blob_id: str) -> Optional[Tuple[bytes, str]]:
+        """Return the blob's data and mime type, or None if it was never stored or was evicted."""
+        blob = self._blobs.get(blob_id)
+        if blob is not None:
+            self._blobs.move_to_end(blob_id)
+        return blob
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+# Shared by tool-output compaction and the result transport
+BLOB_STORE = BlobStore()
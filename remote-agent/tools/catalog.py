@@ -0,0 +1,107 @@
+import hashlib
+import json
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+# Totals across all clients since startup
+TOOL_REGISTRATION_STATS: Dict[str, int] = {"known_sets": 0, "new_sets": 0, "uploaded_tools": 0}
+REGISTRY.stats_counter("mcp_tool_registrations_total", "Tool registration events", TOOL_REGISTRATION_STATS)
+
+def _js_number(value: float) -> str:
+    """A float as JavaScript's Number#toString writes it, e.g. 1e-7 and 0.00001, not 1e-07 and 1e-05."""
+    if value.is_integer() and abs(value) < 1e21:
+        return str(int(value))
+    sign, digits, exponent = Decimal(repr(value)).normalize().as_tuple()
+    sign = "-" if sign else ""
+    digits = "".join(map(str, digits))
+    # value = 0.<digits> * 10 ** point
+    point = len(digits) + exponent
+    if len(digits) <= point <= 21:
+        return sign + digits + "0" * (point - len(digits))
+    if 0 < point <= 21:
+        return f"{sign}{digits[:point]}.{digits[point:]}"
+    if -6 < point <= 0:
+        return f"{sign}0.{'0' * -point}{digits}"
+    mantissa = digits if len(digits) == 1 else f"{digits[0]}.{digits[1:]}"
+    return f"{sign}{mantissa}e{'+' if point > 0 else '-'}{abs(point - 1)}"
+
+def canonical_json(value: Any) -> str:
+    """JSON with sorted keys and no whitespace, written exactly as the local client's
+    canonicalJson writes it, so both sides hash a definition alike: keys sort by UTF-16
+    code unit and numbers are formatted as JavaScript does.
+    """
+    if isinstance(value, dict):
+        keys = sorted(value, key=lambda key: key.encode("utf-16-be"))
+        return "{" + ",".join(f"{json.dumps(key, ensure_ascii=False)}:{canonical_json(value[key])}" for key in keys) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(canonical_json(item) for item in value) + "]"
+    if isinstance(value, float):
+        return _js_number(value)
+    return json.dumps(value, ensure_ascii=False)
+
+def tool_hash(tool_def: Dict[str, Any]) -> str:
+    """SHA-256 of a tool definition's canonical JSON."""
+    return hashlib.sha256(canonical_json(tool_def).encode()).hexdigest()
+
+def tool_set_hash(tool_hashes: List[str]) -> str:
+    """SHA-256 of a tool set: its tool hashes, in order, one per line."""
+    return hashlib.sha256("\n".join(tool_hashes).encode()).hexdigest()
+
+class ToolCatalog:
+    """Tool definitions and tool sets by content hash, shared by every client.
+
+    Clients running the same MCP servers register identical tool sets; each set and
+    each definition is stored once and the same objects are handed to every client,
+    so a reconnecting client only has to send hashes. Least recently used entries are
+    dropped beyond the limits, after which clients are simply asked to upload again.
+    """
+
+    def __init__(self, max_tools: int = 4096, max_sets: int = 256):
+        self.max_tools = max_tools
+        self.max_sets = max_sets
+        self._tools: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sets: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    def add(self, tool_def: Dict[str, Any]) -> str:
+        """Store a definition under its hash, returning the hash."""
+        digest = tool_hash(tool_def)
+        if digest not in self._tools:
+            TOOL_REGISTRATION_STATS["uploaded_tools"] += 1
+            self._tools[digest] = tool_def
+        self._tools.move_to_end(digest)
+        while len(self._tools) > self.max_tools:
+            self._tools.popitem(last=False)
+        return digest
+
+    def get_set(self, set_hash: str) -> Optional[List[Dict[str, Any]]]:
+        """The tool set registered under a hash, if it is still known."""
+        tools = self._sets.get(set_hash)
+        if tools is not None:
+            self._sets.move_to_end(set_hash)
+            TOOL_REGISTRATION_STATS["known_sets"] += 1
+        return tools
+
+    def resolve(self, tool_hashes: List[str]) -> Tuple[Optional[List[Dict[str, Any]]], List[str]]:
+        """Assemble a tool set from known definitions.
+
+        Returns the set (also remembered under its set hash) and no missing hashes,
+        or None and the hashes of the definitions that still have to be uploaded.
+        """
+        missing = [digest for digest in tool_hashes if digest not in self._tools]
+        if missing:
+            return None, missing
+        tools = [self._tools[digest] for digest in tool_hashes]
+        TOOL_REGISTRATION_STATS["new_sets"] += 1
+        self._sets[tool_set_hash(tool_hashes)] = tools
+        while len(self._sets) > self.max_sets:
+            self._sets.popitem(last=False)
+        return tools, []
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+# Shared by every client's tool registration
+TOOL_CATALOG = ToolCatalog()
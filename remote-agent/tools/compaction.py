@@ -0,0 +1,185 @@
+import base64
+import binascii
+import json
+import os
+import re
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    # Message classes are only needed for annotations; langchain_core loads with the agent
+    from langchain_core.messages import AnyMessage
+
+from metrics import REGISTRY
+from .blob_store import BLOB_STORE
+
+@dataclass(frozen=True)
+class ToolOutputPolicy:
+    """How a tool's result is compacted before it enters the agent's messages."""
+
+    # Longest text kept from the result, in characters
+    max_chars: int = 8000
+    # "truncate" keeps the head, "tail" keeps the end, "structural" keeps only the
+    # lines of an accessibility snapshot an agent can act on
+    strategy: str = "truncate"
+    # Whether the result carries a page snapshot that a later snapshot supersedes
+    page_snapshot: bool = False
+
+DEFAULT_POLICY = ToolOutputPolicy()
+# Set MCP_COMPACT_TOOL_OUTPUT=0 to pass tool results to the model verbatim
+COMPACTION_ENABLED = os.environ.get("MCP_COMPACT_TOOL_OUTPUT", "1") != "0"
+
+# Policies by tool display name; tools not listed use DEFAULT_POLICY
+TOOL_OUTPUT_POLICIES: Dict[str, ToolOutputPolicy] = {
+    "browser_snapshot": ToolOutputPolicy(max_chars=12000, strategy="structural", page_snapshot=True),
+    "browser_navigate": ToolOutputPolicy(max_chars=12000, strategy="structural", page_snapshot=True),
+    "browser_click": ToolOutputPolicy(max_chars=12000, strategy="structural", page_snapshot=True),
+    "browser_type": ToolOutputPolicy(max_chars=12000, strategy="structural", page_snapshot=True),
+    "browser_take_screenshot": ToolOutputPolicy(max_chars=2000),
+    "browser_console_messages": ToolOutputPolicy(max_chars=4000, strategy="tail"),
+    "browser_network_requests": ToolOutputPolicy(max_chars=4000, strategy="tail"),
+}
+
+# Text Playwright MCP puts before the accessibility tree in a result
+SNAPSHOT_MARKER = "Page Snapshot"
+# Strings at least this long that decode as base64 are treated as binary payloads
+MIN_BLOB_CHARS = 1024
+_BASE64_RE = re.compile(r"^[A-Za-z0-9+/\r\n]+={0,2}$")
+_DATA_URI_RE = re.compile(r"^data:([\w.+-]+/[\w.+-]+);base64,(.*)$", re.DOTALL)
+# Snapshot lines kept by the "structural" strategy besides element refs
+_STRUCTURAL_KEYWORDS = ("Page URL", "Page Title", SNAPSHOT_MARKER, "heading", "```")
+
+SUPERSEDED_SNAPSHOT = "[page snapshot omitted: superseded by a later snapshot]"
+
+# Totals across all runs since startup
+COMPACTION_STATS: Dict[str, int] = {"results_compacted": 0, "blobs_stored": 0, "prompt_tokens_saved": 0}
+REGISTRY.stats_counter("agent_compaction_total", "Tool output compaction totals", COMPACTION_STATS)
+
+# Per-run accounting, shared with the tasks the graph spawns for nodes and tools
+_RUN_REPORT: ContextVar[Optional[Dict[str, int]]] = ContextVar("compaction_run_report", default=None)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4
+
+def start_compaction_report() -> Dict[str, int]:
+    """Begin per-run accounting of prompt tokens saved in the current context."""
+    report = {"result_tokens_saved": 0, "prompt_tokens_saved": 0, "llm_calls": 0}
+    _RUN_REPORT.set(report)
+    return report
+
+def get_policy(tool_name: str) -> ToolOutputPolicy:
+    return TOOL_OUTPUT_POLICIES.get(tool_name, DEFAULT_POLICY)
+
+def _blob_reference(data: bytes, mime_type: str) -> str:
+    try:
+        reference = BLOB_STORE.put_reference(data, mime_type)
+    except ValueError:
+        # Too large to keep; the model only ever saw a reference anyway
+        return f"[{mime_type} output of {len(data)} bytes dropped: too large to store]"
+    COMPACTION_STATS["blobs_stored"] += 1
+    return reference
+
+def _store_binary(value: Any, mime_type: Optional[str] = None) -> Any:
+    """Replace base64 payloads anywhere in a result with blob references."""
+    if isinstance(value, dict):
+        # MCP image/audio content blocks carry their type next to the data
+        block_mime = value.get("mimeType") or value.get("mime_type")
+        return {key: _store_binary(item, block_mime if key == "data" else None) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_store_binary(item) for item in value]
+    if not isinstance(value, str) or len(value) < MIN_BLOB_CHARS:
+        return value
+
+    match = _DATA_URI_RE.match(value)
+    if match:
+        mime_type, value = match.group(1), match.group(2)
+    elif mime_type is None and not _BASE64_RE.match(value[:MIN_BLOB_CHARS]):
+        return value
+    try:
+        data = base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError):
+        return value
+    return _blob_reference(data, mime_type or "application/octet-stream")
+
+def _structural_summary(text: str) -> str:
+    """Keep the lines of an accessibility snapshot that identify the page or an element to act on."""
+    if SNAPSHOT_MARKER not in text:
+        return text
+    lines = [line for line in text.splitlines() if "[ref=" in line or any(key in line for key in _STRUCTURAL_KEYWORDS)]
+    return "\n".join(lines)
+
+def _shorten(text: str, policy: ToolOutputPolicy) -> str:
+    if policy.strategy == "structural":
+        text = _structural_summary(text)
+    if len(text) <= policy.max_chars:
+        return text
+    omitted = len(text) - policy.max_chars
+    if policy.strategy == "tail":
+        return f"[{omitted} earlier characters truncated]\n" + text[-policy.max_chars:]
+    return text[:policy.max_chars] + f"\n[{omitted} more characters truncated]"
+
+def compact_tool_result(tool_name: str, result: Any) -> Any:
+    """Apply the tool's output policy to a result before it is returned to the agent."""
+    if not COMPACTION_ENABLED:
+        return result
+    original = result if isinstance(result, str) else json.dumps(result, default=str)
+    compacted = _store_binary(result)
+    if isinstance(compacted, str):
+        compacted = _shorten(compacted, get_policy(tool_name))
+    elif isinstance(compacted, list):
+        # MCP content arrays: shorten each text block
+        compacted = [
+            {**block, "text": _shorten(block["text"], get_policy(tool_name))}
+            if isinstance(block, dict) and isinstance(block.get("text"), str) else block
+            for block in compacted
+        ]
+
+    saved = estimate_tokens(original) - estimate_tokens(
+        compacted if isinstance(compacted, str) else json.dumps(compacted, default=str)
+    )
+    if saved > 0:
+        COMPACTION_STATS["results_compacted"] += 1
+        report = _RUN_REPORT.get()
+        if report is not None:
+            report["result_tokens_saved"] += saved
+    return compacted
+
+def _carries_snapshot(message: "AnyMessage") -> bool:
+    if message.type != "tool":
+        return False
+    return get_policy(message.name or "").page_snapshot or SNAPSHOT_MARKER in str(message.content)
+
+def compact_messages(messages: List["AnyMessage"]) -> List["AnyMessage"]:
+    """Replace every page snapshot except the latest with a short placeholder."""
+    latest = max((i for i, message in enumerate(messages) if _carries_snapshot(message)), default=None)
+    if latest is None:
+        return list(messages)
+    return [
+        message.model_copy(update={"content": SUPERSEDED_SNAPSHOT})
+        if i < latest and _carries_snapshot(message) else message
+        for i, message in enumerate(messages)
+    ]
+
+def compact_prompt(state: Dict[str, Any]) -> List["AnyMessage"]:
+    """ReAct agent prompt: the state's messages with superseded snapshots dropped.
+
+    Also accounts the prompt tokens this LLM call saves, counting results that were
+    compacted when they were produced, since each is re-sent on every later step.
+    """
+    messages = state["messages"]
+    if not COMPACTION_ENABLED:
+        return messages
+    compacted = compact_messages(messages)
+    report = _RUN_REPORT.get()
+    if report is not None:
+        dropped = sum(
+            estimate_tokens(str(before.content)) - estimate_tokens(str(after.content))
+            for before, after in zip(messages, compacted) if before is not after
+        )
+        saved = dropped + report["result_tokens_saved"]
+        report["llm_calls"] += 1
+        report["prompt_tokens_saved"] += saved
+        COMPACTION_STATS["prompt_tokens_saved"] += saved
+    return compacted
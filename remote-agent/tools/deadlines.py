@@ -0,0 +1,79 @@
+import math
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+# Seconds a command may take before it times out, for tools without enough history
+# and as the upper bound for the rest
+MAX_TOOL_TIMEOUT = float(os.environ.get("MCP_TOOL_TIMEOUT", "60"))
+# Lower bound on a derived timeout, so a fast tool still survives a hiccup
+MIN_TOOL_TIMEOUT = float(os.environ.get("MCP_MIN_TOOL_TIMEOUT", "5"))
+# A tool's timeout is this multiple of its observed p99
+TIMEOUT_P99_MULTIPLIER = 3.0
+# Idempotent commands still waiting at this quantile of their tool's latency are sent
+# again; set MCP_HEDGE_IDEMPOTENT=0 to only retry them after a timeout
+HEDGE_QUANTILE = 0.95
+HEDGE_ENABLED = os.environ.get("MCP_HEDGE_IDEMPOTENT", "1") != "0"
+# Hedging earlier than this would mostly duplicate commands that are about to answer
+MIN_HEDGE_DELAY = 0.05
+# A tool's quantiles are recomputed after this many new samples, not on every command
+QUANTILE_REFRESH_EVERY = 16
+
+class ToolLatencies:
+    """Recent round-trip times per tool, and the timeout and hedge delay derived from them.
+
+    Only the last `window` samples of a tool count, so the timeouts follow the client's
+    current speed; below `min_samples` a tool gets MAX_TOOL_TIMEOUT and no hedging.
+    A command that timed out counts with the seconds it waited, a lower bound of its
+    latency, so a tool that slows down raises its own timeout instead of timing out
+    at the old one forever.
+    """
+
+    def __init__(self, window: int = 512, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        # Sorted copy of each tool's samples, and how many samples it is missing
+        self._sorted: Dict[str, List[float]] = {}
+        self._unsorted: Dict[str, int] = {}
+
+    def observe(self, tool: str, seconds: float, timed_out: bool = False) -> None:
+        """Record a round trip; `timed_out` when the command was given up after `seconds`."""
+        samples = self._samples.get(tool)
+        if samples is None:
+            samples = self._samples[tool] = deque(maxlen=self.window)
+        samples.append(seconds)
+        # A timeout refreshes the quantiles right away, so the next command waits longer
+        self._unsorted[tool] = QUANTILE_REFRESH_EVERY if timed_out else self._unsorted.get(tool, 0) + 1
+
+    def quantile(self, tool: str, q: float) -> Optional[float]:
+        """The q-th quantile of the tool's recent latencies, None without enough of them."""
+        samples = self._samples.get(tool)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = self._sorted.get(tool)
+        if ordered is None or self._unsorted[tool] >= QUANTILE_REFRESH_EVERY:
+            ordered = self._sorted[tool] = sorted(samples)
+            self._unsorted[tool] = 0
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def timeout(self, tool: str) -> float:
+        """Seconds to wait for a result of the tool before giving up on the command."""
+        p99 = self.quantile(tool, 0.99)
+        if p99 is None:
+            return MAX_TOOL_TIMEOUT
+        return min(MAX_TOOL_TIMEOUT, max(MIN_TOOL_TIMEOUT, p99 * TIMEOUT_P99_MULTIPLIER))
+
+    def hedge_delay(self, tool: str) -> Optional[float]:
+        """Seconds after which an idempotent command of the tool is sent again, None to not hedge."""
+        if not HEDGE_ENABLED:
+            return None
+        expected = self.quantile(tool, HEDGE_QUANTILE)
+        return None if expected is None else max(MIN_HEDGE_DELAY, expected)
+
+    def timeouts(self) -> Dict[str, float]:
+        """Current timeout of every tool seen so far."""
+        return {tool: self.timeout(tool) for tool in self._samples}
+
+# Shared by every client's router; clients run the same tools at comparable speeds
+TOOL_LATENCIES = ToolLatencies()
@@ -1,85 +1,327 @@
 import uuid
 import asyncio
+import hashlib
+import json
 import inspect
-from typing import Any, Dict, List, Optional, Callable, Type, get_type_hints, ClassVar, Union
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Callable, Set, Type, get_type_hints, ClassVar, Union
 from pydantic import BaseModel, Field, create_model
-from langchain.tools import BaseTool, Tool, StructuredTool
 import httpx
+from metrics import REGISTRY, TOOL_COMMANDS, TOOL_RESENDS, TOOL_ROUND_TRIP, debug_log
+from .compaction import compact_tool_result
+from .deadlines import TOOL_LATENCIES
+from .sessions import current_session
+
+if TYPE_CHECKING:
+    from langchain.tools import BaseTool
+
+# Set MCP_CACHE_READ_ONLY_RESULTS=0 to send every read-only tool call to the client
+RESULT_CACHE_ENABLED = os.environ.get("MCP_CACHE_READ_ONLY_RESULTS", "1") != "0"
+
+# Tools, by display name, treated as read-only when their definition does not say
+READ_ONLY_TOOLS: Set[str] = {"browser_snapshot", "browser_take_screenshot", "browser_tab_list"}
+
+# Times an idempotent command is sent again after timing out, besides any hedge
+IDEMPOTENT_RETRIES = int(os.environ.get("MCP_IDEMPOTENT_RETRIES", "1"))
+
+# Totals across all clients since startup; each hit is a round-trip to the client saved
+RESULT_CACHE_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+REGISTRY.stats_counter("mcp_result_cache_events_total", "Read-only tool result cache events", RESULT_CACHE_STATS)
+
+def is_read_only(tool_def: Dict[str, Any]) -> bool:
+    """Whether a tool only reads state, so its results can be reused until a mutating tool runs.
+
+    Clients declare it with `readOnly` or MCP's `annotations.readOnlyHint`; otherwise
+    the server-side READ_ONLY_TOOLS list decides.
+    """
+    declared = tool_def.get("readOnly", (tool_def.get("annotations") or {}).get("readOnlyHint"))
+    if declared is not None:
+        return bool(declared)
+    return tool_def.get("display_name", tool_def.get("name")) in READ_ONLY_TOOLS
+
+def is_idempotent(tool_def: Dict[str, Any]) -> bool:
+    """Whether running a tool twice has the same effect as once, so a slow command may be sent again.
+
+    Clients declare it with `idempotent` or MCP's `annotations.idempotentHint`;
+    read-only tools are idempotent.
+    """
+    declared = tool_def.get("idempotent", (tool_def.get("annotations") or {}).get("idempotentHint"))
+    if declared is not None:
+        return bool(declared)
+    return is_read_only(tool_def)
     
 class MCPClient:
-    """Client for communicating with MCP through the FastAPI server."""
+    """Client for communicating with MCP through the FastAPI server.
+
+    One instance exists per connected client and acts as its command router: it owns
+    the pending future of every command sent on behalf of any agent run, so a result
+    posted to `/result/{client_id}` resolves the waiting tool call directly.
+    """
+
+    # Number of settled command IDs remembered to classify late or duplicate results
+    MAX_SETTLED_COMMANDS = 10000
+    # Number of read-only results remembered between mutating commands
+    MAX_CACHED_RESULTS = 64
     
-    def __init__(self, client_id: str = "default-client", send_command_func: Optional[Callable] = None):
+    def __init__(
+        self,
+        client_id: str = "default-client",
+        send_command_func: Optional[Callable] = None,
+        batch_window: Optional[float] = None,
+        command_id_prefix: str = ""
+    ):
         self.client_id = client_id
+        # Prepended to command IDs so results can be routed back to this process
+        self.command_id_prefix = command_id_prefix
         self.pending_results: Dict[str, asyncio.Future] = {}
         self.send_command_func = send_command_func
+        # command_id -> how it was settled ("resolved" or "expired"), oldest first
+        self.settled_commands: "OrderedDict[str, str]" = OrderedDict()
+        # When set, commands issued within this many seconds of each other (e.g. all tool
+        # calls of one agent step) are sent together as a single batch envelope
+        self.batch_window = batch_window
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_flush: Optional[asyncio.Task] = None
+        # Tool names whose results are reused until a mutating tool runs
+        self.read_only_tools: Set[str] = set()
+        # Tool names whose commands are sent again when slow, first result wins
+        self.idempotent_tools: Set[str] = set()
+        # [session, tool, params] -> result of a read-only command, least recently used first
+        self._result_cache: "OrderedDict[str, Any]" = OrderedDict()
+        # Bumped on every invalidation so results of reads overlapping a write are not cached
+        self._result_generation = 0
+        # Strong references to cancel notices being sent
+        self._cancel_notices: Set[asyncio.Task] = set()
+    
+    def invalidate_results(self) -> None:
+        """Forget cached read-only results, e.g. when the page may have changed."""
+        if self._result_cache:
+            RESULT_CACHE_STATS["invalidations"] += 1
+        self._result_cache.clear()
+        self._result_generation += 1
+    
+    def _invalidate_session_results(self, session_id: Optional[str]) -> None:
+        """Forget the cached results of one session, whose page a mutating tool may change."""
+        prefix = json.dumps([session_id])[:-1] + ","
+        stale = [key for key in self._result_cache if key.startswith(prefix)]
+        if stale:
+            RESULT_CACHE_STATS["invalidations"] += 1
+        for key in stale:
+            del self._result_cache[key]
+        self._result_generation += 1
     
     async def send_command(self, tool: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Send a command to the MCP client and wait for the result."""
+        """Send a command to the MCP client and wait for the result.
+
+        The command is tagged with the session the current agent run is pinned to,
+        if any. Results of read-only tools are reused for identical calls in the same
+        session until a mutating tool (any tool not marked read-only) is sent or
+        completes there.
+
+        The command times out after a multiple of its tool's recent p99 latency. An
+        idempotent command is sent again under the same ID once it passes the tool's
+        p95 (a hedge) and once more if it times out; the first result resolves it and
+        later ones are dropped as duplicates.
+        """
+        session_id = current_session()
+        if not RESULT_CACHE_ENABLED:
+            return await self._send_command(tool, params, session_id)
+        
+        if tool not in self.read_only_tools:
+            self._invalidate_session_results(session_id)
+            try:
+                return await self._send_command(tool, params, session_id)
+            finally:
+                self._invalidate_session_results(session_id)
+        
+        key = json.dumps([session_id, tool, params], sort_keys=True, default=str)
+        if key in self._result_cache:
+            self._result_cache.move_to_end(key)
+            RESULT_CACHE_STATS["hits"] += 1
+            return self._result_cache[key]
+        
+        RESULT_CACHE_STATS["misses"] += 1
+        generation = self._result_generation
+        result = await self._send_command(tool, params, session_id)
+        failed = isinstance(result, dict) and ("error" in result or result.get("isError"))
+        if generation == self._result_generation and not failed:
+            self._result_cache[key] = result
+            while len(self._result_cache) > self.MAX_CACHED_RESULTS:
+                self._result_cache.popitem(last=False)
+        return result
+    
+    async def _send_command(self, tool: str, params: Dict[str, Any], session_id: Optional[str] = None) -> Dict[str, Any]:
         if self.send_command_func is None:
             raise ValueError("send_command_func not provided to MCPClient")
         
-        command_id = str(uuid.uuid4())
+        command_id = f"{self.command_id_prefix}{uuid.uuid4()}"
         command = {
             "id": command_id,
             "tool": tool,
             "params": params
         }
+        if session_id is not None:
+            command["sessionId"] = session_id
         
         # Create a future to store the result
-        future = asyncio.get_event_loop().create_future()
+        future = asyncio.get_running_loop().create_future()
         self.pending_results[command_id] = future
         
-        # Send the command
-        await self.send_command_func(self.client_id, command)
-        
-        # Wait for the result with a timeout
+        started = time.perf_counter()
+        outcome = "error"
         try:
-            result = await asyncio.wait_for(future, timeout=60.0)
+            # Send the command, or hold it for the next batch envelope
+            if self.batch_window is None:
+                await self.send_command_func(self.client_id, command)
+            else:
+                self._add_to_batch(command)
+            
+            result = await self._await_result(command, future)
+            outcome = "ok"
+            elapsed = time.perf_counter() - started
+            TOOL_ROUND_TRIP.observe(elapsed, tool=tool)
+            TOOL_LATENCIES.observe(tool, elapsed)
             return result
         except asyncio.TimeoutError:
-            del self.pending_results[command_id]
-            raise TimeoutError(f"Timeout waiting for result of command {command_id}")
+            outcome = "timeout"
+            TOOL_LATENCIES.observe(tool, time.perf_counter() - started, timed_out=True)
+            self._abandon(command)
+            raise TimeoutError(f"Timeout waiting for result of command {command_id} ({tool})")
+        except asyncio.CancelledError:
+            # The agent run was cancelled or hit its deadline
+            outcome = "cancelled"
+            self._abandon(command)
+            raise
+        finally:
+            TOOL_COMMANDS.inc(tool=tool, outcome=outcome)
+            # Timed out, cancelled or failed commands must not stay registered
+            if self.pending_results.pop(command_id, None) is not None:
+                self._mark_settled(command_id, "expired")
+    
+    async def _await_result(self, command: Dict[str, Any], future: asyncio.Future) -> Dict[str, Any]:
+        """Wait for a command's result within its tool's timeout, hedging and retrying idempotent ones."""
+        tool = command["tool"]
+        idempotent = tool in self.idempotent_tools
+        timeout = TOOL_LATENCIES.timeout(tool)
+        hedge_delay = TOOL_LATENCIES.hedge_delay(tool) if idempotent else None
+        retries = IDEMPOTENT_RETRIES if idempotent else 0
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        give_up_at = started + timeout
+        while True:
+            wake_at = give_up_at if hedge_delay is None else min(give_up_at, started + hedge_delay)
+            # asyncio.wait leaves the future pending on timeout, unlike wait_for
+            await asyncio.wait({future}, timeout=max(0.0, wake_at - loop.time()))
+            if future.done():
+                return future.result()
+            if loop.time() < give_up_at:
+                # Past the expected latency: a second copy may finish first
+                hedge_delay = None
+                await self._resend(command, "hedge")
+            elif retries > 0:
+                retries -= 1
+                give_up_at = loop.time() + timeout
+                await self._resend(command, "retry")
+            else:
+                raise asyncio.TimeoutError()
+
+    async def _resend(self, command: Dict[str, Any], kind: str) -> None:
+        """Send an idempotent command again under its ID; a failure leaves the first copy to answer."""
+        TOOL_RESENDS.inc(tool=command["tool"], kind=kind)
+        try:
+            if self.batch_window is None:
+                await self.send_command_func(self.client_id, command)
+            elif command not in self._batch:
+                self._add_to_batch(command)
+        except Exception as e:
+            print(f"Could not resend command {command['id']}: {e}")
+
+    def _abandon(self, command: Dict[str, Any]) -> None:
+        """Stop a command nobody waits for: drop it from the batch, or tell the client to cancel it."""
+        if command in self._batch:
+            self._batch.remove(command)
+            return
+        notice = asyncio.create_task(self._send_cancel(command["id"]))
+        self._cancel_notices.add(notice)
+        notice.add_done_callback(self._cancel_notices.discard)
+    
+    async def _send_cancel(self, command_id: str) -> None:
+        try:
+            await self.send_command_func(self.client_id, {"type": "cancel", "id": str(uuid.uuid4()), "commandId": command_id})
+        except Exception as e:
+            print(f"Could not send cancel for command {command_id}: {e}")
+    
+    def _add_to_batch(self, command: Dict[str, Any]) -> None:
+        """Queue a command for the batch being collected, starting its flush timer."""
+        self._batch.append(command)
+        if self._batch_flush is None:
+            self._batch_flush = asyncio.create_task(self._flush_batch())
+    
+    async def _flush_batch(self) -> None:
+        """Send the commands collected during the batch window in one envelope."""
+        await asyncio.sleep(self.batch_window)
+        commands, self._batch, self._batch_flush = self._batch, [], None
+        # Every command in the window may have been abandoned
+        if not commands:
+            return
+        
+        # A lone command goes out as a plain command event
+        envelope = commands[0] if len(commands) == 1 else {
+            "type": "batch",
+            "id": str(uuid.uuid4()),
+            "commands": commands
+        }
+        try:
+            await self.send_command_func(self.client_id, envelope)
+        except Exception as e:
+            for command in commands:
+                future = self.pending_results.get(command["id"])
+                if future is not None and not future.done():
+                    future.set_exception(e)
     
-    def receive_result(self, command_id: str, result: Dict[str, Any]) -> None:
-        """Process a result received from the MCP client."""
-        if command_id in self.pending_results:
-            future = self.pending_results.pop(command_id)
-            if not future.done():
-                future.set_result(result)
+    def receive_result(self, command_id: str, result: Dict[str, Any]) -> str:
+        """Process a result received from the MCP client.
+
+        Returns "resolved" when a waiting command was completed, "late" when the
+        command already timed out or was cancelled, "duplicate" when it was already
+        resolved, and "unknown" for command IDs this router never issued.
+        """
+        future = self.pending_results.pop(command_id, None)
+        if future is None:
+            settled = self.settled_commands.get(command_id)
+            if settled == "resolved":
+                return "duplicate"
+            if settled == "expired":
+                return "late"
+            return "unknown"
+        
+        if future.done():
+            self._mark_settled(command_id, "expired")
+            return "late"
+        future.set_result(result)
+        self._mark_settled(command_id, "resolved")
+        return "resolved"
+    
+    def fail_command(self, command_id: str, error: Exception) -> bool:
+        """Fail a waiting command, e.g. one that can no longer be delivered to the client."""
+        future = self.pending_results.get(command_id)
+        if future is None or future.done():
+            return False
+        future.set_exception(error)
+        return True
+    
+    def _mark_settled(self, command_id: str, outcome: str) -> None:
+        """Remember how a command was settled, evicting the oldest entries."""
+        self.settled_commands[command_id] = outcome
+        while len(self.settled_commands) > self.MAX_SETTLED_COMMANDS:
+            self.settled_commands.popitem(last=False)
 
 class MCPToolInput(BaseModel):
     """Default input model for MCP tools."""
     pass
 
-# 비동기 함수를 동기적으로 실행하는 래퍼 함수
-def create_sync_wrapper(coro_func, is_single_param=False):
-    """Create a synchronous wrapper for an asynchronous function"""
-    if is_single_param:
-        def wrapper(arg):
-            """Wrapper for single parameter async function"""
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                # 이벤트 루프가 없으면 새로 생성
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            return loop.run_until_complete(coro_func(arg))
-        return wrapper
-    else:
-        def wrapper(**kwargs):
-            """Wrapper for multi parameter async function"""
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                # 이벤트 루프가 없으면 새로 생성
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-            return loop.run_until_complete(coro_func(**kwargs))
-        return wrapper
-
 # Instead of subclassing BaseTool, we'll use Tool factory function to avoid Pydantic issues
 async def create_mcp_tool_function(
     client: MCPClient,
@@ -106,7 +348,8 @@ async def create_mcp_tool_function(
                 # Create params dictionary with the single parameter
                 params = {param_name: arg_value}
                 result = await client.send_command(tool_name, params)
-                return result
+                # Keep large payloads out of the agent's messages
+                return compact_tool_result(display_name, result)
             except Exception as e:
                 return {"error": str(e)}
         
@@ -127,7 +370,8 @@ async def create_mcp_tool_function(
                     return {"error": "MCP client not provided"}
                 # Pass kwargs directly as params
                 result = await client.send_command(tool_name, kwargs)
-                return result
+                # Keep large payloads out of the agent's messages
+                return compact_tool_result(display_name, result)
             except Exception as e:
                 return {"error": str(e)}
         
@@ -169,8 +413,25 @@ async def fetch_mcp_tools(client_id: str) -> List[Dict[str, Any]]:
             }
         ]
 
+# Maximum number of argument models kept before the least recently used is dropped
+MAX_CACHED_ARGS_SCHEMAS = 4096
+
+# Schema hash -> argument model, shared by every tool definition with the same name and parameters
+_ARGS_SCHEMA_CACHE: "OrderedDict[str, Type[BaseModel]]" = OrderedDict()
+
 def create_args_schema(tool_def: Dict[str, Any]) -> Type[BaseModel]:
-    """Dynamically create a Pydantic model for tool arguments."""
+    """Dynamically create a Pydantic model for tool arguments.
+
+    Models are cached by the definition's display name and parameters, so clients
+    registering identical tools share one schema class.
+    """
+    cache_key = hashlib.sha256(json.dumps(
+        [tool_def.get("display_name", "MCPTool"), tool_def.get("parameters", {})], sort_keys=True
+    ).encode()).hexdigest()
+    if cache_key in _ARGS_SCHEMA_CACHE:
+        _ARGS_SCHEMA_CACHE.move_to_end(cache_key)
+        return _ARGS_SCHEMA_CACHE[cache_key]
+    
     fields = {}
     for param_name, param_def in tool_def.get("parameters", {}).items():
         param_type = str  # Default to string
@@ -183,26 +444,46 @@ def create_args_schema(tool_def: Dict[str, Any]) -> Type[BaseModel]:
             
         fields[param_name] = (param_type, Field(..., description=param_def.get("description", "")))
     
-    # If no parameters, create an empty model
-    if not fields:
-        fields = {"dummy": (Optional[str], Field(None, description="Dummy field"))}
+    # Tools without parameters get an empty model, so they are called with no arguments
     
     # Create a dynamic Pydantic model for the arguments
     model_name = f"{tool_def.get('display_name', 'MCPTool')}Input"
-    return create_model(model_name, **fields)
+    args_schema = create_model(model_name, **fields)
+    _ARGS_SCHEMA_CACHE[cache_key] = args_schema
+    while len(_ARGS_SCHEMA_CACHE) > MAX_CACHED_ARGS_SCHEMAS:
+        _ARGS_SCHEMA_CACHE.popitem(last=False)
+    return args_schema
+
+def warm_up() -> None:
+    """Load LangChain's tool classes ahead of the first create_mcp_tools call."""
+    import langchain.tools  # noqa: F401
 
 async def create_mcp_tools(
     client_id: str = "default-client", 
     send_command_func: Optional[Callable] = None, 
-    tool_definitions: Optional[List[Dict[str, Any]]] = None
-) -> List[BaseTool]:
-    """Create a list of MCP tools dynamically based on tool definitions."""
-    # Create a single client instance that will be shared by all tools
-    mcp_client = MCPClient(client_id=client_id, send_command_func=send_command_func)
+    tool_definitions: Optional[List[Dict[str, Any]]] = None,
+    mcp_client: Optional[MCPClient] = None
+) -> List["BaseTool"]:
+    """Create a list of MCP tools dynamically based on tool definitions.
+
+    Pass the client's shared `mcp_client` router so results posted back to the
+    server resolve the commands issued by these tools.
+    """
+    # Imported here so the server can start accepting clients before LangChain is loaded
+    from langchain.tools import StructuredTool, Tool
+    
+    # All tools share one client instance; create one only if no router was given
+    if mcp_client is None:
+        mcp_client = MCPClient(client_id=client_id, send_command_func=send_command_func)
     
     # Use provided tool definitions if available, otherwise try to fetch them
     tool_defs = tool_definitions or []
     
+    # A new tool set may come from a restarted client, so earlier results are stale
+    mcp_client.read_only_tools = {tool_def.get("name") for tool_def in tool_defs if is_read_only(tool_def)}
+    mcp_client.idempotent_tools = {tool_def.get("name") for tool_def in tool_defs if is_idempotent(tool_def)}
+    mcp_client.invalidate_results()
+    
     tools = []
     for tool_def in tool_defs:
         try:
@@ -226,29 +507,26 @@ async def create_mcp_tools(
             tool_func = tool_info["func"]
             is_single_param = tool_info["is_single_param"]
             
-            # 비동기 함수를 동기적으로 실행하는 래퍼 생성
-            sync_func = create_sync_wrapper(tool_func, is_single_param)
-            
-            # Create appropriate tool type based on parameters
+            # Tools are async-only: the agent awaits them on the server's event loop
             if is_single_param:
                 # 단일 파라미터 도구는 일반 Tool 사용
                 tool = Tool(
                     name=display_name,
                     description=description,
-                    func=sync_func,  # 동기 래퍼 사용
+                    func=None,
                     coroutine=tool_func
                 )
             else:
                 # 다중 파라미터 도구는 StructuredTool 사용
                 tool = StructuredTool.from_function(
-                    func=sync_func,  # 동기 래퍼 사용
+                    coroutine=tool_func,
                     name=display_name, 
                     description=description,
                     args_schema=args_schema,
                 )
                 
             tools.append(tool)
-            print(f"Created tool: {display_name} with schema: {args_schema}")
+            debug_log("Created tool: %s with schema: %s", display_name, args_schema)
         except Exception as e:
             print(f"Error creating tool for {tool_def.get('name')}: {e}")
     
@@ -268,16 +546,12 @@ async def create_mcp_tools(
             )
             
             tool_func = tool_info["func"]
-            is_single_param = tool_info["is_single_param"]
-            
-            # 비동기 함수를 동기적으로 실행하는 래퍼 생성
-            sync_func = create_sync_wrapper(tool_func, is_single_param)
             
             # Create a Tool using the factory function
             default_tool = Tool(
                 name="browser_navigate",
                 description="Navigate to a URL",
-                func=sync_func,  # 동기 래퍼 사용
+                func=None,
                 coroutine=tool_func  # 비동기 함수
             )
             
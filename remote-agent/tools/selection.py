@@ -0,0 +1,129 @@
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Set, Tuple
+
+from metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from langchain.tools import BaseTool
+
+# Tools bound to each LLM call, besides the pinned ones; 0 binds every registered tool
+TOOL_TOP_K = int(os.environ.get("AGENT_TOOL_TOP_K", "8"))
+
+# Tools, by name, bound to every LLM call whatever the step is about
+PINNED_TOOLS: Set[str] = {"browser_navigate", "browser_snapshot"}
+
+# Totals across all agent steps since startup
+TOOL_SELECTION_STATS: Dict[str, int] = {"steps": 0, "tools_bound": 0, "tools_available": 0}
+REGISTRY.stats_counter("agent_tool_selection_total", "Tools bound to LLM calls by relevance", TOOL_SELECTION_STATS)
+
+# Words too common in requests and tool descriptions to say which tool is meant
+_STOPWORDS = {
+    "a", "an", "and", "as", "at", "be", "by", "for", "from", "i", "if", "in", "into", "is", "it",
+    "me", "my", "of", "on", "or", "please", "that", "the", "then", "this", "to", "with", "you",
+}
+# Request words mapped to the words tool descriptions use for the same action
+_SYNONYMS = {
+    "go": "navigate", "visit": "navigate", "open": "navigate", "browse": "navigate", "http": "url", "https": "url",
+    "enter": "type", "fill": "type", "write": "type", "input": "type",
+    "choose": "select", "pick": "select", "dropdown": "select",
+    "capture": "screenshot", "image": "screenshot", "picture": "screenshot",
+    "read": "snapshot", "look": "snapshot", "see": "snapshot", "content": "snapshot",
+    "previous": "back",
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word stems of a text, with snake_case names split into words."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in _STOPWORDS:
+            continue
+        # Crude plural stemming, enough for "tabs" to match "tab"
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(_SYNONYMS.get(word, word))
+    return tokens
+
+class ToolIndex:
+    """BM25 index over tool names, descriptions and argument names.
+
+    Built once per tool set and queried on every agent step to bind only the tools
+    relevant to it; a tool's name counts twice, as it says most about what it does.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, documents: Iterable[Tuple[str, str]]):
+        self.names: List[str] = []
+        self._term_counts: List[Counter] = []
+        for name, text in documents:
+            self.names.append(name)
+            self._term_counts.append(Counter(tokenize(f"{name} {name} {text}")))
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        document_frequency = Counter(term for counts in self._term_counts for term in counts)
+        total = len(self.names)
+        self._idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    @classmethod
+    def from_tools(cls, tools: List["BaseTool"]) -> "ToolIndex":
+        return cls((tool.name, f"{tool.description} {' '.join(tool.args)}") for tool in tools)
+
+    def scores(self, query: str) -> List[float]:
+        """BM25 score of every tool for a query, in index order."""
+        terms = Counter(tokenize(query))
+        scores = [0.0] * len(self.names)
+        for i, counts in enumerate(self._term_counts):
+            norm = self.K1 * (1 - self.B + self.B * self._lengths[i] / self._average_length)
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    scores[i] += self._idf[term] * frequency * (self.K1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query: str, k: int) -> List[str]:
+        """Names of the (at most) k tools scoring highest for a query, best first; tools scoring 0 are left out."""
+        ranked = sorted(zip(self.scores(query), range(len(self.names))), key=lambda scored: (-scored[0], scored[1]))
+        return [self.names[i] for score, i in ranked[:k] if score > 0]
+
+    def select(self, query: str, pinned: Iterable[str], k: int = TOOL_TOP_K) -> List[str]:
+        """The tools to bind for a step: the pinned ones present in the index plus the top k for the query.
+
+        Every tool is selected when k is 0 or the index is no bigger than the selection.
+        """
+        TOOL_SELECTION_STATS["steps"] += 1
+        TOOL_SELECTION_STATS["tools_available"] += len(self.names)
+        pinned = set(pinned)
+        selected = [name for name in self.names if name in pinned]
+        if k <= 0 or len(self.names) <= k + len(selected):
+            selected = list(self.names)
+        else:
+            selected += [name for name in self.search(query, k + len(selected)) if name not in selected][:k]
+        TOOL_SELECTION_STATS["tools_bound"] += len(selected)
+        return selected
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+# Maximum number of indexes kept before the least recently used is dropped
+MAX_CACHED_INDEXES = 256
+
+# Tool set key -> index, shared by every client registering the same tools
+_INDEX_CACHE: "OrderedDict[Tuple, ToolIndex]" = OrderedDict()
+
+def tool_index(tools: List["BaseTool"]) -> ToolIndex:
+    """The index for a tool set, built on first use; clients registering identical tools share one."""
+    key = tuple((tool.name, tool.description, tuple(tool.args)) for tool in tools)
+    index = _INDEX_CACHE.get(key)
+    if index is None:
+        index = _INDEX_CACHE[key] = ToolIndex.from_tools(tools)
+        while len(_INDEX_CACHE) > MAX_CACHED_INDEXES:
+            _INDEX_CACHE.popitem(last=False)
+    _INDEX_CACHE.move_to_end(key)
+    return index
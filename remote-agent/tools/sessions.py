@@ -0,0 +1,120 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional, Set
+
+# Browser session of the agent run in the current context; its commands are tagged with it
+_SESSION: ContextVar[Optional[str]] = ContextVar("mcp_session", default=None)
+
+def current_session() -> Optional[str]:
+    """The session the current agent run is pinned to, if any."""
+    return _SESSION.get()
+
+@contextmanager
+def use_session(session_id: Optional[str]) -> Iterator[None]:
+    """Tag the commands sent within the block with a session."""
+    token = _SESSION.set(session_id)
+    try:
+        yield
+    finally:
+        _SESSION.reset(token)
+
+class SessionPool:
+    """Leases a client's browser sessions to agent runs, one run per session at a time.
+
+    A client registering `"capabilities": {"sessions": n}` runs n isolated browser
+    contexts (or MCP server processes), addressed as sessions "0" to "n-1". Runs
+    waiting for a session get the next one released, first come first served. A
+    run with a key (e.g. its conversation thread) gets the session that key last
+    used when it is free, so the conversation continues on the same page.
+    """
+
+    # Number of keys whose last session is remembered
+    MAX_AFFINITIES = 1024
+
+    def __init__(self, size: int):
+        self.size = 0
+        self._free: List[str] = []
+        self._busy: Set[str] = set()
+        self._waiters: Deque[asyncio.Future] = deque()
+        # key -> session it last used, least recently used first
+        self._affinity: "OrderedDict[str, str]" = OrderedDict()
+        self.resize(size)
+
+    @property
+    def busy(self) -> int:
+        return len(self._busy)
+
+    def stats(self) -> Dict[str, float]:
+        """Pool size, sessions leased and runs waiting for one."""
+        return {
+            "size": self.size,
+            "busy": self.busy,
+            "waiting": len(self._waiters),
+            "utilization": self.busy / self.size if self.size else 0.0,
+        }
+
+    def resize(self, size: int) -> None:
+        """Grow or shrink the pool; sessions beyond a smaller size are retired when released."""
+        if size < 1:
+            raise ValueError("A session pool needs at least one session")
+        old_size, self.size = self.size, size
+        self._free = [session_id for session_id in self._free if int(session_id) < size]
+        for index in range(old_size, size):
+            # A session still leased from before a shrink comes back when released
+            if str(index) not in self._busy:
+                self._release(str(index))
+
+    async def acquire(self, key: Optional[str] = None) -> str:
+        """Lease a session, waiting for one to be released if all are busy."""
+        preferred = self._affinity.get(key) if key is not None else None
+        if preferred in self._free:
+            self._free.remove(preferred)
+            session_id = preferred
+        elif self._free:
+            session_id = self._free.pop(0)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                session_id = await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Released to this run just as it was cancelled; pass it on
+                    self._release(waiter.result())
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+        self._busy.add(session_id)
+        if key is not None:
+            self._affinity[key] = session_id
+            self._affinity.move_to_end(key)
+            while len(self._affinity) > self.MAX_AFFINITIES:
+                self._affinity.popitem(last=False)
+        return session_id
+
+    def release(self, session_id: str) -> None:
+        """Return a leased session to the pool, handing it to the longest waiting run."""
+        self._busy.discard(session_id)
+        self._release(session_id)
+
+    def _release(self, session_id: str) -> None:
+        if int(session_id) >= self.size:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(session_id)
+                return
+        self._free.append(session_id)
+
+    @asynccontextmanager
+    async def lease(self, key: Optional[str] = None) -> AsyncIterator[str]:
+        """Hold a session for the duration of the block, tagging the commands sent within it."""
+        session_id = await self.acquire(key)
+        try:
+            with use_session(session_id):
+                yield session_id
+        finally:
+            self.release(session_id)
@@ -0,0 +1,12 @@
+from .replay import SESSION_STATS, ReplayBuffer
+from .results import InvalidPayload, PayloadTooLarge, UnsupportedEncoding, decompress_body, read_result_payload
+
+__all__ = [
+    "InvalidPayload",
+    "PayloadTooLarge",
+    "ReplayBuffer",
+    "SESSION_STATS",
+    "UnsupportedEncoding",
+    "decompress_body",
+    "read_result_payload",
+]
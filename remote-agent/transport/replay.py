@@ -0,0 +1,33 @@
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
+
+from metrics import REGISTRY
+
+# Totals across all clients since startup
+SESSION_STATS: Dict[str, int] = {"resumed": 0, "replayed_commands": 0, "expired": 0}
+REGISTRY.stats_counter("mcp_session_events_total", "Client session resumption events", SESSION_STATS)
+
+class ReplayBuffer:
+    """The most recent commands sent to one client, numbered with monotonically increasing event IDs.
+
+    A client that reconnects with the last event ID it saw gets the later commands
+    again. Only the newest `max_events` are kept, so a client that was gone for
+    longer gets what is left.
+    """
+
+    def __init__(self, max_events: int = 256):
+        self._events: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=max_events)
+        self._last_id = 0
+
+    def record(self, command: Dict[str, Any]) -> int:
+        """Number a command and remember it, returning its event ID."""
+        self._last_id += 1
+        self._events.append((self._last_id, command))
+        return self._last_id
+
+    def since(self, last_event_id: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """The remembered commands after an event ID, oldest first."""
+        return [(event_id, command) for event_id, command in self._events if event_id > last_event_id]
+
+    def __len__(self) -> int:
+        return len(self._events)
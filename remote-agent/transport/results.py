@@ -0,0 +1,145 @@
+import gzip
+import io
+import json
+import os
+import zlib
+from typing import Any, BinaryIO, Dict
+
+from starlette.datastructures import UploadFile
+from starlette.requests import Request
+from starlette.types import Message
+
+from tools import BLOB_STORE
+
+try:
+    import zstandard
+except ImportError:  # zstd bodies are rejected when the package is not installed
+    zstandard = None
+
+# Largest result body accepted, as sent and once decompressed, so neither a large body
+# nor a small compressed one that expands into gigabytes is held in memory
+MAX_RESULT_BYTES = int(os.environ.get("MCP_MAX_RESULT_BYTES", str(64 * 1024 * 1024)))
+# Bytes decompressed at a time while checking a body against the limit
+DECOMPRESS_CHUNK = 1024 * 1024
+
+class UnsupportedEncoding(ValueError):
+    """The request body uses a Content-Encoding this server cannot decode."""
+
+class InvalidPayload(ValueError):
+    """The request body is corrupt or misses the result JSON."""
+
+class PayloadTooLarge(InvalidPayload):
+    """The request body is, or decompresses to, more than MAX_RESULT_BYTES."""
+
+def limit_body(request: Request, limit: int = MAX_RESULT_BYTES) -> Request:
+    """The request with its body capped: reading past `limit` bytes raises PayloadTooLarge."""
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise PayloadTooLarge(f"Result body exceeds {limit} bytes")
+    received = 0
+
+    async def receive() -> Message:
+        nonlocal received
+        message = await request.receive()
+        received += len(message.get("body", b""))
+        if received > limit:
+            raise PayloadTooLarge(f"Result body exceeds {limit} bytes")
+        return message
+
+    return Request(request.scope, receive)
+
+def _read_limited(stream: BinaryIO, limit: int) -> bytes:
+    chunks = []
+    size = 0
+    while True:
+        chunk = stream.read(DECOMPRESS_CHUNK)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise PayloadTooLarge(f"Result body exceeds {limit} bytes once decompressed")
+        chunks.append(chunk)
+
+def decompress_body(body: bytes, encoding: str, limit: int = MAX_RESULT_BYTES) -> bytes:
+    """Decode a request body according to its Content-Encoding header.
+
+    Decompression stops once the output passes `limit` bytes.
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        if len(body) > limit:
+            raise PayloadTooLarge(f"Result body exceeds {limit} bytes")
+        return body
+    if encoding == "gzip":
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(body)) as stream:
+                return _read_limited(stream, limit)
+        except (OSError, EOFError, zlib.error) as e:
+            raise InvalidPayload(f"Corrupt gzip body: {e}") from e
+    if encoding == "zstd":
+        if zstandard is None:
+            raise UnsupportedEncoding("zstd bodies need the zstandard package")
+        try:
+            return _read_limited(zstandard.ZstdDecompressor().stream_reader(body), limit)
+        except zstandard.ZstdError as e:
+            raise InvalidPayload(f"Corrupt zstd body: {e}") from e
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding: {encoding}")
+
+def _parse_json(data: bytes) -> Dict[str, Any]:
+    try:
+        payload = json.loads(data)
+    except ValueError as e:
+        raise InvalidPayload(f"Result body is not valid JSON: {e}") from e
+    if not isinstance(payload, dict):
+        raise InvalidPayload("Result body must be a JSON object")
+    return payload
+
+def resolve_attachments(value: Any, attachments: Dict[str, UploadFile], payloads: Dict[str, bytes]) -> Any:
+    """Replace `{"attachment": name}` placeholders with references to the stored blobs."""
+    if isinstance(value, list):
+        return [resolve_attachments(item, attachments, payloads) for item in value]
+    if not isinstance(value, dict):
+        return value
+    name = value.get("attachment")
+    if isinstance(name, str) and name in payloads:
+        mime_type = value.get("mimeType") or attachments[name].content_type or "application/octet-stream"
+        try:
+            reference = BLOB_STORE.put_reference(payloads[name], mime_type)
+        except ValueError as e:
+            raise PayloadTooLarge(str(e)) from e
+        # The binary content block becomes a text block carrying the blob reference
+        return {"type": "text", "text": reference}
+    return {key: resolve_attachments(item, attachments, payloads) for key, item in value.items()}
+
+async def read_result_payload(request: Request) -> Dict[str, Any]:
+    """Parse a result POST in any of the supported transports.
+
+    - JSON, optionally gzip- or zstd-compressed (Content-Encoding);
+    - multipart/form-data with the JSON in a `payload` part and binary attachments
+      (e.g. screenshots) as raw file parts, referenced from the JSON as
+      `{"attachment": "<part name>"}`. Attachments go to the blob store.
+
+    Raises UnsupportedEncoding for an encoding this server cannot decode, and
+    InvalidPayload (PayloadTooLarge past MAX_RESULT_BYTES) for a body it cannot read.
+    The body is counted as it streams in, so an oversized one is never read whole.
+    """
+    request = limit_body(request)
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        payload = form.get("payload")
+        if payload is None:
+            raise InvalidPayload("Multipart result has no payload part")
+        # Parts are spooled to disk while parsing; only what fits the limit is read into memory
+        budget = MAX_RESULT_BYTES
+        parts = [part for part in form.values() if isinstance(part, UploadFile)]
+        for part in parts:
+            budget -= part.size or 0
+            if budget < 0:
+                raise PayloadTooLarge(f"Result attachments exceed {MAX_RESULT_BYTES} bytes")
+        payload = _parse_json(await payload.read() if isinstance(payload, UploadFile) else payload)
+        attachments = {name: part for name, part in form.items() if isinstance(part, UploadFile) and name != "payload"}
+        payloads = {name: await part.read() for name, part in attachments.items()}
+        return resolve_attachments(payload, attachments, payloads)
+
+    body = decompress_body(await request.body(), request.headers.get("content-encoding", ""))
+    return _parse_json(body)